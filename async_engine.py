@@ -0,0 +1,418 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# asyncio engine for the tiled image processing.
+# The byte ranges of the internal blocks of remote
+# (http) images are fetched concurrently over a small
+# pool of keep-alive connections, decoded in an
+# executor and fed to the same kernel and writer.
+###########################################
+"""
+
+import asyncio
+import ssl
+import zlib
+import concurrent.futures
+from urllib.parse import urlsplit
+import numpy as np
+import rasterio as rio
+from io_profiles import with_gdal_env
+from fault_tolerance import TRANSIENT_ERRORS, failure
+from instrumentation import NULL_RECORDER, INPUTS
+
+
+# default concurrency of the async engine
+DEFAULT_MAX_REQUESTS = 64
+DEFAULT_CONNECTIONS = 16
+DEFAULT_DECODE_WORKERS = 4
+DEFAULT_TILES_IN_FLIGHT = 16
+
+# neighbouring blocks closer than this (bytes) are fetched with one request
+MERGE_GAP = 16384
+
+SUPPORTED_COMPRESSION = (None, 'none', 'deflate', 'adobe_deflate')
+
+
+class BlockLayout(object):
+    """Position of the internal blocks of a single band GeoTIFF.
+    Only layouts the engine can decode itself are created,
+    everything else is read with rasterio"""
+
+    def __init__(self, url, width, height, block_shape, dtype,
+                 compression, predictor, offsets, bytecounts):
+        self.url = url
+        self.width = width
+        self.height = height
+        self.block_height, self.block_width = block_shape
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.compression = compression
+        self.predictor = predictor
+        self.offsets = offsets
+        self.bytecounts = bytecounts
+
+    @classmethod
+    def from_url(cls, url):
+        """Reads the block layout from the header of an image.
+        :parameter:
+        url of the image
+        :returns:
+        BlockLayout or None if the image can't be decoded by the engine"""
+        if urlsplit(url).scheme not in ('http', 'https'):
+            return None
+
+        with rio.open(url) as src:
+            compression = src.compression.value.lower() if src.compression else None
+            predictor = int(src.tags(ns='IMAGE_STRUCTURE').get('PREDICTOR', 1))
+
+            if (src.driver != 'GTiff' or src.count != 1
+                    or compression not in SUPPORTED_COMPRESSION
+                    or predictor not in (1, 2)):
+                return None
+
+            block_height, block_width = src.block_shapes[0]
+            offsets = {}
+            bytecounts = {}
+            for block_row in range(-(-src.height // block_height)):
+                for block_col in range(-(-src.width // block_width)):
+                    key = '%d_%d' % (block_col, block_row)
+                    offset = src.get_tag_item('BLOCK_OFFSET_' + key, 'TIFF', bidx=1)
+                    size = src.get_tag_item('BLOCK_SIZE_' + key, 'TIFF', bidx=1)
+                    if offset is None or size is None:
+                        return None
+                    offsets[block_row, block_col] = int(offset)
+                    bytecounts[block_row, block_col] = int(size)
+
+            return cls(url, src.width, src.height, (block_height, block_width),
+                       src.dtypes[0], compression, predictor, offsets, bytecounts)
+
+    def contains(self, window):
+        """Checks if a window is completely inside the image"""
+        return (window.col_off >= 0 and window.row_off >= 0
+                and window.col_off + window.width <= self.width
+                and window.row_off + window.height <= self.height)
+
+    def blocks(self, window):
+        """Returns (block_row, block_col) of all blocks touching a window"""
+        row_start = int(window.row_off) // self.block_height
+        row_stop = (int(window.row_off) + int(window.height) - 1) // self.block_height
+        col_start = int(window.col_off) // self.block_width
+        col_stop = (int(window.col_off) + int(window.width) - 1) // self.block_width
+        return [(block_row, block_col)
+                for block_row in range(row_start, row_stop + 1)
+                for block_col in range(col_start, col_stop + 1)]
+
+
+def decode_block(raw, layout):
+    """Decodes the raw bytes of one block.
+    :parameter:
+    bytes of the block,
+    BlockLayout of the image
+    :returns:
+    2D-Array with the size of the block"""
+    if not raw:
+        # sparse block, GDAL reads it as 0
+        return np.zeros((layout.block_height, layout.block_width), dtype=layout.dtype)
+
+    if layout.compression in ('deflate', 'adobe_deflate'):
+        raw = zlib.decompress(raw)
+
+    block = np.frombuffer(raw, dtype=layout.dtype).reshape(-1, layout.block_width)
+
+    # horizontal differencing, the cumulative sum wraps
+    # around in the integer dtype just like the encoder did
+    if layout.predictor == 2:
+        block = np.cumsum(block, axis=1, dtype=layout.dtype)
+
+    return block.astype(layout.dtype.newbyteorder('='), copy=False)
+
+
+def merge_ranges(ranges, gap=MERGE_GAP):
+    """Merges byte ranges which are closer than gap.
+    :parameter:
+    List of (offset, size, key)
+    :returns:
+    List of (start, end, [(offset, size, key), ...]), end is inclusive"""
+    merged = []
+    for offset, size, key in sorted(r for r in ranges if r[1] > 0):
+        if merged and offset - merged[-1][1] - 1 <= gap:
+            start, end, members = merged[-1]
+            merged[-1] = (start, max(end, offset + size - 1), members + [(offset, size, key)])
+        else:
+            merged.append((offset, offset + size - 1, [(offset, size, key)]))
+    return merged
+
+
+class _ConnectionPool(object):
+    """Keep-alive HTTP/1.1 connections to one host"""
+
+    def __init__(self, scheme, host, port, size, recorder=NULL_RECORDER):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self):
+        context = ssl.create_default_context() if self.scheme == 'https' else None
+        return await asyncio.open_connection(self.host, self.port, ssl=context)
+
+    async def _request(self, connection, path, start, end):
+        reader, writer = connection
+        writer.write(('GET %s HTTP/1.1\r\n'
+                      'Host: %s\r\n'
+                      'Range: bytes=%d-%d\r\n'
+                      'Connection: keep-alive\r\n\r\n'
+                      % (path, self.host, start, end)).encode('latin-1'))
+        await writer.drain()
+
+        status = (await reader.readline()).decode('latin-1').split()
+        if len(status) < 2:
+            raise ConnectionError('Connection closed by %s' % self.host)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                chunk_size = int((await reader.readline()).split(b';')[0], 16)
+                if chunk_size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(chunk_size)
+                await reader.readline()
+        else:
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+
+        if status[1] == '206':
+            return body, keep_alive
+        if status[1] == '200':
+            # server ignored the range header
+            return body[start:end + 1], keep_alive
+        raise rio.RasterioIOError('HTTP %s for %s' % (status[1], path))
+
+    async def fetch(self, path, start, end):
+        """Fetches the bytes start-end (inclusive) of path"""
+        async with self._slots:
+            # a reused connection might have been closed by the server,
+            # so a failed request is repeated once on a new connection
+            for attempt in range(2):
+                reused = bool(self._idle)
+                self.recorder.count('connection_pool_hits' if reused else 'connection_pool_misses')
+                connection = self._idle.pop() if reused else await self._connect()
+                try:
+                    body, keep_alive = await self._request(connection, path, start, end)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection[1].close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    connection[1].close()
+                    raise
+                if keep_alive:
+                    self._idle.append(connection)
+                else:
+                    connection[1].close()
+                return body
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+class RangeClient(object):
+    """Fetches byte ranges over one connection pool per host. The number
+    of concurrent requests over all hosts is limited by a semaphore.
+    The transferred bytes are counted as bytes_read of the input
+    labels[url], reused keep-alive connections as connection_pool_hits.
+    Has to be created inside the running event loop"""
+
+    def __init__(self, max_requests=None, connections=None, recorder=NULL_RECORDER,
+                 labels=None):
+        self._requests = asyncio.Semaphore(max_requests or DEFAULT_MAX_REQUESTS)
+        self._connections = connections or DEFAULT_CONNECTIONS
+        self._recorder = recorder
+        self._labels = labels or {}
+        self._pools = {}
+
+    async def fetch(self, url, start, end):
+        """Fetches the bytes start-end (inclusive) of url"""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        if key not in self._pools:
+            self._pools[key] = _ConnectionPool(parts.scheme, parts.hostname,
+                                               port, self._connections, self._recorder)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+
+        async with self._requests:
+            body = await self._pools[key].fetch(path, start, end)
+        self._recorder.count('bytes_read', len(body), self._labels.get(url, url))
+        return body
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+
+async def read_window_async(client, layout, window, executor):
+    """Reads a window of an image by fetching and decoding its blocks.
+    :parameter:
+    RangeClient,
+    BlockLayout of the image,
+    window inside the image,
+    executor for decoding
+    :returns:
+    Array with the shape (1, height, width) like rasterio's read"""
+    loop = asyncio.get_running_loop()
+    keys = layout.blocks(window)
+    ranges = merge_ranges([(layout.offsets[key], layout.bytecounts[key], key)
+                           for key in keys])
+
+    responses = await asyncio.gather(*(client.fetch(layout.url, start, end)
+                                       for start, end, members in ranges))
+
+    raw_blocks = dict((key, b'') for key in keys)
+    for (start, end, members), body in zip(ranges, responses):
+        for offset, size, key in members:
+            raw_blocks[key] = body[offset - start:offset - start + size]
+
+    decoded = await asyncio.gather(*(loop.run_in_executor(executor, decode_block,
+                                                          raw_blocks[key], layout)
+                                     for key in keys))
+
+    row_off, col_off = int(window.row_off), int(window.col_off)
+    height, width = int(window.height), int(window.width)
+    result = np.zeros((1, height, width), dtype=decoded[0].dtype)
+
+    # copy the overlapping part of each block into the window
+    for (block_row, block_col), block in zip(keys, decoded):
+        top = block_row * layout.block_height
+        left = block_col * layout.block_width
+        row_start, row_stop = max(top, row_off), min(top + block.shape[0], row_off + height)
+        col_start, col_stop = max(left, col_off), min(left + block.shape[1], col_off + width)
+        result[0, row_start - row_off:row_stop - row_off, col_start - col_off:col_stop - col_off] = \
+            block[row_start - top:row_stop - top, col_start - left:col_stop - left]
+
+    return result
+
+
+def run_async(tasks, urls, read_fallback, compute_fn, write_fn,
+              max_requests=None, connections=None, decode_workers=None,
+              tiles_in_flight=None, gdal_options=None, retry=None, failures=None,
+              recorder=NULL_RECORDER, inputs=None):
+    """Processes the tasks with asyncio. The bands of every tile are
+    fetched concurrently as byte ranges, decoded and passed to compute_fn.
+    Tiles which are not completely inside every band or images the
+    engine can't decode (e.g. LZW) are read with read_fallback instead.
+    :parameter:
+    List of (window_idx, window),
+    List of urls read for every tile (in the order compute_fn expects them),
+    read_fallback(task) returning the same data as the async read,
+    compute_fn(task, data) returning the result of the task,
+    write_fn(task, result) writing the result,
+    Maximum number of concurrent range requests,
+    Number of keep-alive connections per host,
+    Number of threads for decoding and computing,
+    Maximum number of tiles processed at the same time,
+    dict with GDAL config options for reading the headers,
+    RetryPolicy for transient errors (without one the first error is raised),
+    list collecting the windows which failed for good,
+    Recorder for the timing of the stages (see instrumentation),
+    names of the urls for the bytes_read counter (default INPUTS),
+    names ending with _ts1 belong to the scene read without resampling"""
+
+    decode_workers = decode_workers or DEFAULT_DECODE_WORKERS
+    tiles_in_flight = tiles_in_flight or DEFAULT_TILES_IN_FLIGHT
+
+    # the header of each image is read once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(urls)) as header_pool:
+        layouts = list(header_pool.map(with_gdal_env(BlockLayout.from_url, gdal_options),
+                                       urls))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=decode_workers,
+                                                     thread_name_prefix='decode')
+    # the destination dataset is not threadsafe, so one thread writes
+    writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+
+    if inputs is None:
+        # the first half of the urls belongs to timestep 1
+        inputs = INPUTS
+        half = len(layouts) // 2
+        read_stages = ['read_ts1'] * half + ['read_ts2'] * (len(layouts) - half)
+    else:
+        read_stages = ['read_ts1' if name.endswith('_ts1') else 'read_ts2' for name in inputs]
+
+    async def read_band(client, layout, window, stage, window_idx):
+        # every band is timed on its own, so the spans don't change
+        # how many bands of a tile are fetched at the same time
+        with recorder.span(stage, window_idx):
+            return await read_window_async(client, layout, window, executor)
+
+    async def read_tile(client, task):
+        loop = asyncio.get_running_loop()
+        window = task[1]
+        if all(layout is not None and layout.contains(window) for layout in layouts):
+            blocks = await asyncio.gather(*(read_band(client, layout, window, stage, task[0])
+                                            for layout, stage in zip(layouts, read_stages)))
+            return tuple(blocks)
+        return await loop.run_in_executor(executor, read_fallback, task)
+
+    async def read_tile_retrying(client, task):
+        attempt = 0
+        while True:
+            try:
+                return await read_tile(client, task)
+            except TRANSIENT_ERRORS:
+                if retry is None or attempt >= retry.retries:
+                    raise
+                await asyncio.sleep(retry.delay(attempt))
+                attempt += 1
+
+    async def worker(client, task_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                task = task_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                data = await read_tile_retrying(client, task)
+            except TRANSIENT_ERRORS as exc:
+                if retry is None or failures is None:
+                    raise
+                failures.append(failure(task, exc))
+                continue
+            result = await loop.run_in_executor(executor, compute_fn, task, data)
+            await loop.run_in_executor(writer, write_fn, task, result)
+
+    async def main():
+        client = RangeClient(max_requests=max_requests, connections=connections,
+                             recorder=recorder, labels=dict(zip(urls, inputs)))
+        task_queue = asyncio.Queue()
+        for task in tasks:
+            task_queue.put_nowait(task)
+        workers = [asyncio.ensure_future(worker(client, task_queue))
+                   for _ in range(tiles_in_flight)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for future in workers:
+                future.cancel()
+            client.close()
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown(wait=True)
+        writer.shutdown(wait=True)
@@ -0,0 +1,192 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Batch processing of many date pairs and AOIs.
+# All jobs share one pool of workers, so the
+# number of tiles processed at the same time is
+# limited for the whole batch. Image searches and
+# open datasets (with their GDAL block cache) are
+# shared by the jobs reading the same scene.
+###########################################
+"""
+
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from time import time
+import rasterio as rio
+from parallized_resampled import search_image
+from parallized_resampled import optimal_tiled_calc
+from parallized_resampled import customized_tiled_calc
+from instrumentation import NULL_RECORDER
+
+
+# open datasets kept per worker thread
+DEFAULT_MAX_OPEN = 16
+
+# keys of a job, missing keys are taken from the batch config
+JOB_KEYS = ('dates', 'bounding_box', 'property', 'tilex', 'tiley', 'outfile')
+
+
+class _Borrowed(object):
+    """Context manager handing out a shared dataset without closing it"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __enter__(self):
+        return self.dataset
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class SharedDatasets(object):
+    """Open datasets reused by all tiles and jobs. A dataset is not
+    threadsafe, so every worker thread has its own handle per url,
+    the least recently used handles are closed. Reused handles are
+    counted as dataset_cache_hits.
+    :parameter:
+    maximum number of open datasets per thread,
+    Recorder for the counters (see instrumentation)"""
+
+    def __init__(self, max_open=DEFAULT_MAX_OPEN, recorder=NULL_RECORDER):
+        self.max_open = max_open
+        self.recorder = recorder
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._handles = []
+
+    def open(self, url):
+        """Returns the dataset of url for the current thread,
+        used as opener of process_tiles"""
+        datasets = getattr(self._local, 'datasets', None)
+        if datasets is None:
+            datasets = self._local.datasets = OrderedDict()
+        if url in datasets:
+            datasets.move_to_end(url)
+            self.recorder.count('dataset_cache_hits')
+            return _Borrowed(datasets[url])
+
+        self.recorder.count('dataset_cache_misses')
+        dataset = rio.open(url)
+        datasets[url] = dataset
+        with self._lock:
+            self._handles.append(dataset)
+        if len(datasets) > self.max_open:
+            _, oldest = datasets.popitem(last=False)
+            oldest.close()
+        return _Borrowed(dataset)
+
+    def close(self):
+        with self._lock:
+            for dataset in self._handles:
+                if not dataset.closed:
+                    dataset.close()
+            self._handles = []
+
+
+def make_jobs(config):
+    """Creates the jobs of a batch config. Every entry of config['jobs']
+    may leave out the keys which are the same for all jobs, they are
+    taken from the top level of the config.
+    :returns:
+    list of dicts with the keys of JOB_KEYS"""
+    jobs = []
+    for number, entry in enumerate(config['jobs']):
+        job = dict((key, entry.get(key, config.get(key))) for key in JOB_KEYS)
+        missing = [key for key in ('dates', 'bounding_box', 'property', 'outfile')
+                   if job[key] is None]
+        if missing:
+            raise ValueError('Job %d is missing %s' % (number, ', '.join(missing)))
+        job['tilex'] = int(job['tilex'] or 0)
+        job['tiley'] = int(job['tiley'] or 0)
+        jobs.append(job)
+
+    outfiles = [job['outfile'] for job in jobs]
+    if len(set(outfiles)) != len(outfiles):
+        raise ValueError('Every job needs its own outfile')
+    return jobs
+
+
+class BatchScheduler(object):
+    """Runs the jobs of a batch on one shared pool of workers.
+    :parameter:
+    number of workers for all jobs together,
+    number of jobs running at the same time,
+    function searching an image (date, bounding_box, property),
+    further options of the tiling functions (gdal_options, retry, ...)"""
+
+    def __init__(self, processors, max_jobs=None, search=search_image, **options):
+        self.processors = processors
+        self.max_jobs = max_jobs or processors
+        self.options = options
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=processors,
+                                                              thread_name_prefix='worker')
+        self.datasets = SharedDatasets(recorder=options.get('recorder', NULL_RECORDER))
+        self._search = search
+        self._searches = {}
+        self._search_lock = threading.Lock()
+
+    def search(self, date, bounding_box, prop):
+        """Searches an image once for every date, bounding box and property,
+        jobs asking for a search which is running wait for its result"""
+        key = (str(date), tuple(bounding_box), str(prop))
+        with self._search_lock:
+            future = self._searches.get(key)
+            searching = future is None
+            if searching:
+                future = self._searches[key] = concurrent.futures.Future()
+        if searching:
+            try:
+                future.set_result(self._search(date, bounding_box, prop))
+            except Exception as exc:
+                future.set_exception(exc)
+        return future.result()
+
+    def run_job(self, job):
+        """Runs one job, errors are returned instead of raised,
+        so the other jobs of the batch go on
+        :returns:
+        dict with the outfile, the failed windows, the wall time and the error"""
+        start = time()
+        result = {'outfile': job['outfile'], 'failed_windows': [], 'error': None}
+        try:
+            item_ts1 = self.search(job['dates'][0], job['bounding_box'], job['property'])
+            item_ts2 = self.search(job['dates'][1], job['bounding_box'], job['property'])
+            result['scenes'] = [str(item_ts1), str(item_ts2)]
+            # the reads run in the GDAL environment of the workers,
+            # so the shared datasets are opened there
+            options = dict(self.options, engine='pool', executor=self.executor,
+                           opener=self.datasets.open)
+            if job['tilex'] and job['tiley'] > 0:
+                result['failed_windows'] = customized_tiled_calc(
+                    item_ts1, item_ts2, job['outfile'], job['tilex'], job['tiley'],
+                    max_workers=self.processors, **options)
+            else:
+                result['failed_windows'] = optimal_tiled_calc(
+                    item_ts1, item_ts2, job['outfile'],
+                    max_workers=self.processors, **options)
+        except Exception as exc:
+            result['error'] = '%s: %s' % (type(exc).__name__, exc)
+        result['wall_time'] = time() - start
+        return result
+
+    def run(self, jobs):
+        """Runs the jobs, max_jobs at the same time.
+        :returns:
+        list with the result of every job, in the order of the jobs"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_jobs,
+                                                   thread_name_prefix='job') as job_pool:
+            return list(job_pool.map(self.run_job, jobs))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.datasets.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
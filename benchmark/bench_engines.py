@@ -0,0 +1,177 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# End-to-end benchmark of the tiling functions on
+# synthetic scenes. Runs optimal_tiled_calc and
+# customized_tiled_calc for every combination of
+# engine, worker count and tile size and saves
+# tiles/s, MB/s, wall time and peak RSS as json.
+#
+# python -m benchmark.bench_engines -o bench.json
+###########################################
+"""
+
+import os
+import json
+import platform
+import argparse
+import tempfile
+import multiprocessing
+from itertools import product
+from time import time
+import numpy as np
+import rasterio as rio
+from parallized_resampled import get_tiles
+from parallized_resampled import optimal_tiled_calc
+from parallized_resampled import customized_tiled_calc
+from profiling import peak_rss_mb
+from benchmark.synthetic import make_scene_pair
+
+
+# measured for every case
+METRICS = ('wall_time', 'tiles_per_s', 'mb_per_s', 'peak_rss_mb')
+
+
+def count_tiles(url, tile_size):
+    """Number of tiles of the optimal (tile_size 0) or custom tiling"""
+    with rio.open(url) as src:
+        if not tile_size:
+            return len(list(src.block_windows()))
+        return len(list(get_tiles(src, tile_size, tile_size)))
+
+
+def run_case(case):
+    """Runs one benchmark case, called in a fresh process so the
+    peak RSS belongs to this case only.
+    :parameter:
+    dict with item_ts1, item_ts2, engine, workers and tile_size
+    :returns:
+    dict with the measurements"""
+    item_ts1, item_ts2 = case['item_ts1'], case['item_ts2']
+    outfile = os.path.join(case['directory'], 'bench_out.tif')
+    stages = {'io_workers': case['workers'], 'compute_workers': case['workers']}
+
+    start = time()
+    if case['tile_size']:
+        customized_tiled_calc(item_ts1, item_ts2, outfile,
+                              case['tile_size'], case['tile_size'],
+                              max_workers=case['workers'],
+                              engine=case['engine'], stages=stages)
+    else:
+        optimal_tiled_calc(item_ts1, item_ts2, outfile,
+                           max_workers=case['workers'],
+                           engine=case['engine'], stages=stages)
+    wall_time = time() - start
+
+    with rio.open(item_ts1.assets['B4']['href']) as src:
+        # red and nir of both timesteps, uncompressed
+        megabytes = 4 * src.width * src.height * np.dtype(src.dtypes[0]).itemsize / 1e6
+
+    tiles = count_tiles(item_ts1.assets['B4']['href'], case['tile_size'])
+
+    return {'function': 'customized_tiled_calc' if case['tile_size'] else 'optimal_tiled_calc',
+            'engine': case['engine'],
+            'workers': case['workers'],
+            'tile_size': case['tile_size'],
+            'tiles': tiles,
+            'wall_time': wall_time,
+            'tiles_per_s': tiles / wall_time,
+            'mb_per_s': megabytes / wall_time,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def run_isolated(case):
+    """Runs a case in a new process"""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, (case,))
+
+
+def summarize(runs):
+    """Combines repeated runs of a case. Every metric is the median
+    of the runs, the spread is saved as interquartile range.
+    :parameter:
+    list of results of run_case
+    :returns:
+    dict with the median metrics, their iqr and the single runs"""
+    result = dict(runs[0])
+    result['iqr'] = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs]
+        result[metric] = float(np.median(values))
+        result['iqr'][metric] = float(np.percentile(values, 75) - np.percentile(values, 25))
+    result['runs'] = [dict((metric, run[metric]) for metric in METRICS) for run in runs]
+    return result
+
+
+def run_benchmark(directory, size=2048, workers=(1, 2, 4), tile_sizes=(0, 6000),
+                  engines=('pool', 'staged'), repeat=1):
+    """Creates a synthetic scene pair and runs every case.
+    :parameter:
+    directory for the synthetic images and the outfile,
+    width and height of the scene in pixels,
+    worker counts,
+    tile sizes in m (0 is the optimal tiling),
+    engines,
+    number of runs of every case
+    :returns:
+    dict with the environment, the parameters and the results"""
+    item_ts1, item_ts2 = make_scene_pair(directory, size=size)
+
+    results = []
+    for engine, worker_count, tile_size in product(engines, workers, tile_sizes):
+        case = {'item_ts1': item_ts1, 'item_ts2': item_ts2, 'directory': directory,
+                'engine': engine, 'workers': worker_count, 'tile_size': tile_size}
+        result = summarize([run_isolated(case) for _ in range(repeat)])
+        print('%(function)s engine=%(engine)s workers=%(workers)s tile_size=%(tile_size)s: '
+              '%(tiles_per_s).1f tiles/s, %(mb_per_s).1f MB/s, %(wall_time).2f s, '
+              '%(peak_rss_mb).0f MB' % result)
+        results.append(result)
+
+    return {'environment': {'python': platform.python_version(),
+                            'numpy': np.__version__,
+                            'rasterio': rio.__version__,
+                            'gdal': rio.__gdal_version__,
+                            'cpus': os.cpu_count(),
+                            'platform': platform.platform()},
+            'parameters': {'size': size,
+                           'workers': list(workers),
+                           'tile_sizes': list(tile_sizes),
+                           'engines': list(engines),
+                           'repeat': repeat},
+            'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the tiling functions '
+                                                 'on synthetic scenes')
+    parser.add_argument('-o', '--out', default='bench_engines.json',
+                        help='json file for the results')
+    parser.add_argument('--size', type=int, default=2048,
+                        help='width and height of the synthetic scene in pixels')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--tile-sizes', type=int, nargs='+', default=[0, 6000],
+                        help='tile sizes in m, 0 is the optimal tiling')
+    parser.add_argument('--engines', nargs='+', default=['pool', 'staged'])
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs of every case, the median is reported')
+    parser.add_argument('--directory', default=None,
+                        help='directory for the synthetic images (default: temporary)')
+    args = parser.parse_args(argv)
+
+    if args.directory:
+        report = run_benchmark(args.directory, args.size, args.workers,
+                               args.tile_sizes, args.engines, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            report = run_benchmark(directory, args.size, args.workers,
+                                   args.tile_sizes, args.engines, args.repeat)
+
+    with open(args.out, 'w') as dst:
+        json.dump(report, dst, indent=2)
+    print('Results saved in %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
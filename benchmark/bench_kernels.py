@@ -0,0 +1,160 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Micro-benchmarks of the kernels. Times
+# calculate_ndvi, calculate_difference and their
+# alternatives for different tile shapes, input
+# dtypes and fractions of zero pixels, checks that
+# the results are the same and prints a table.
+#
+# python -m benchmark.bench_kernels -o bench_kernels.json
+###########################################
+"""
+
+import json
+import argparse
+import timeit
+from itertools import product
+from statistics import median
+import numpy as np
+from parallized_resampled import calculate_ndvi
+from parallized_resampled import calculate_difference
+
+
+def ndvi_float32_where(red, nir):
+    """Candidate ndvi kernel: float32 math and a division only
+    where red or nir is > 0, no temporary float64 arrays"""
+    band_red = red.astype(np.float32)
+    band_nir = nir.astype(np.float32)
+    total = band_nir + band_red
+    ndvi = np.full(total.shape, -2, dtype=np.float32)
+    np.divide(band_nir - band_red, total, out=ndvi, where=total > 0)
+    return ndvi
+
+
+def difference_float32(ndvi_tile1, ndvi_tile2):
+    """Candidate difference kernel without copies of float32 input"""
+    return np.subtract(ndvi_tile1, ndvi_tile2, dtype=np.float32)
+
+
+# kernels timed against each other, the first one is used by the engine
+NDVI_KERNELS = {'calculate_ndvi': calculate_ndvi,
+                'ndvi_float32_where': ndvi_float32_where}
+DIFFERENCE_KERNELS = {'calculate_difference': calculate_difference,
+                      'difference_float32': difference_float32}
+
+DEFAULT_SHAPES = [(1, 256, 256), (1, 512, 512), (1, 1024, 1024)]
+DEFAULT_DTYPES = ['uint16', 'float32']
+DEFAULT_ZERO_FRACTIONS = [0.0, 0.3, 0.9]
+
+
+def make_bands(shape, dtype, zero_fraction, seed=0):
+    """Red and nir tile with landsat-like values, zero_fraction
+    of the pixels are 0 in both bands (nodata collar)"""
+    rng = np.random.RandomState(seed)
+    red = rng.randint(5000, 15000, shape)
+    nir = rng.randint(8000, 25000, shape)
+    zeros = rng.random_sample(shape) < zero_fraction
+    red[zeros] = 0
+    nir[zeros] = 0
+    return red.astype(dtype), nir.astype(dtype)
+
+
+def time_kernel(function, args, repeat=5):
+    """Times a kernel like timeit does, every repetition runs
+    the kernel often enough to take at least 0.2 s.
+    :returns:
+    list with the seconds per call of every repetition"""
+    timer = timeit.Timer(lambda: function(*args))
+    number, _ = timer.autorange()
+    return [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+
+
+def equivalent(result, reference):
+    """Checks if a kernel result matches the reference kernel"""
+    return (result.shape == reference.shape
+            and np.allclose(result, reference, rtol=1e-6, atol=1e-6, equal_nan=True))
+
+
+def run_kernels(shapes=None, dtypes=None, zero_fractions=None, repeat=5):
+    """Times every kernel for every combination of the parameters.
+    :parameter:
+    tile shapes (bands, rows, cols),
+    input dtypes,
+    fractions of zero pixels,
+    number of repetitions
+    :returns:
+    list of dicts with the measurements"""
+    results = []
+    for shape, dtype, zero_fraction in product(shapes or DEFAULT_SHAPES,
+                                               dtypes or DEFAULT_DTYPES,
+                                               zero_fractions or DEFAULT_ZERO_FRACTIONS):
+        red, nir = make_bands(shape, dtype, zero_fraction)
+        red_2, nir_2 = make_bands(shape, dtype, zero_fraction, seed=1)
+        ndvi_1 = calculate_ndvi(red, nir)
+        ndvi_2 = calculate_ndvi(red_2, nir_2)
+        reference_difference = calculate_difference(ndvi_1, ndvi_2)
+
+        cases = [(name, function, (red, nir), ndvi_1)
+                 for name, function in sorted(NDVI_KERNELS.items())]
+        cases += [(name, function, (ndvi_1, ndvi_2), reference_difference)
+                  for name, function in sorted(DIFFERENCE_KERNELS.items())]
+
+        for name, function, args, reference in cases:
+            seconds = time_kernel(function, args, repeat=repeat)
+            pixels = shape[-1] * shape[-2]
+            results.append({'kernel': name,
+                            'shape': list(shape),
+                            'dtype': dtype,
+                            'zero_fraction': zero_fraction,
+                            'median_ms': median(seconds) * 1e3,
+                            'best_ms': min(seconds) * 1e3,
+                            'mpix_per_s': pixels / median(seconds) / 1e6,
+                            'equivalent': equivalent(function(*args), reference)})
+    return results
+
+
+def format_table(results):
+    """Comparison table, the speedup is relative to the first
+    kernel of the same group (the one used by the engine)"""
+    lines = ['%-22s %-16s %-8s %5s %10s %10s %8s %5s'
+             % ('kernel', 'shape', 'dtype', 'zeros', 'median ms', 'Mpix/s', 'speedup', 'same')]
+    baseline = {}
+    for result in results:
+        group = (tuple(result['shape']), result['dtype'], result['zero_fraction'],
+                 result['kernel'] in NDVI_KERNELS)
+        baseline.setdefault(group, result['median_ms'])
+        lines.append('%-22s %-16s %-8s %5.2f %10.3f %10.1f %7.2fx %5s'
+                     % (result['kernel'], 'x'.join(str(v) for v in result['shape']),
+                        result['dtype'], result['zero_fraction'], result['median_ms'],
+                        result['mpix_per_s'], baseline[group] / result['median_ms'],
+                        'yes' if result['equivalent'] else 'NO'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the kernels')
+    parser.add_argument('-o', '--out', default='bench_kernels.json',
+                        help='json file for the results')
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help='tile sizes in pixels (square tiles)')
+    parser.add_argument('--dtypes', nargs='+', default=None)
+    parser.add_argument('--zero-fractions', type=float, nargs='+', default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    shapes = [(1, size, size) for size in args.sizes] if args.sizes else None
+    results = run_kernels(shapes, args.dtypes, args.zero_fractions, args.repeat)
+    print(format_table(results))
+
+    with open(args.out, 'w') as dst:
+        json.dump({'results': results}, dst, indent=2)
+    print('Results saved in %s' % args.out)
+
+    # a kernel giving different results is an error
+    return 0 if all(result['equivalent'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
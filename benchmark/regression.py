@@ -0,0 +1,166 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Performance regression gate. Compares the results
+# of bench_engines to a committed baseline and exits
+# with 1 if a tracked metric of a tiling engine got
+# worse than its tolerance.
+#
+# python -m benchmark.regression --run --repeat 5
+# python -m benchmark.regression --current bench_engines.json
+###########################################
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(DIRECTORY, 'baseline.json')
+DEFAULT_TOLERANCES = os.path.join(DIRECTORY, 'tolerances.json')
+
+# cases of a new baseline
+DEFAULT_PARAMETERS = {'size': 2048, 'workers': [1, 2, 4],
+                      'tile_sizes': [0, 6000], 'engines': ['pool', 'staged']}
+
+
+def case_key(result):
+    """Identifies a benchmark case"""
+    return (result['function'], result['engine'], result['workers'], result['tile_size'])
+
+
+def compare(baseline, current, tolerances):
+    """Compares every tracked metric of every case of the baseline.
+    A metric regressed if it got worse by more than its tolerance
+    (relative to the baseline) and more than the noise of both runs
+    (iqr_factor times the sum of their interquartile ranges).
+    :parameter:
+    baseline results, current results (json of bench_engines),
+    tolerances (json)
+    :returns:
+    list of dicts with case, metric, baseline, current, change and status
+    ('ok', 'improved', 'regression' or 'missing')"""
+    current_cases = dict((case_key(result), result) for result in current['results'])
+    iqr_factor = tolerances.get('iqr_factor', 0)
+
+    rows = []
+    for base in baseline['results']:
+        key = case_key(base)
+        now = current_cases.get(key)
+        for metric, setting in sorted(tolerances['metrics'].items()):
+            row = {'case': list(key), 'metric': metric, 'baseline': base[metric]}
+            if now is None:
+                row.update({'current': None, 'change': None, 'status': 'missing'})
+                rows.append(row)
+                continue
+
+            noise = iqr_factor * (base.get('iqr', {}).get(metric, 0)
+                                  + now.get('iqr', {}).get(metric, 0))
+            allowed = max(setting['tolerance'] * abs(base[metric]), noise)
+            # positive worse is a slowdown for both directions
+            worse = now[metric] - base[metric]
+            if setting['direction'] == 'higher':
+                worse = -worse
+
+            if worse > allowed:
+                status = 'regression'
+            elif -worse > allowed:
+                status = 'improved'
+            else:
+                status = 'ok'
+            row.update({'current': now[metric],
+                        'change': (now[metric] - base[metric]) / base[metric]
+                                  if base[metric] else None,
+                        'status': status})
+            rows.append(row)
+    return rows
+
+
+def format_rows(rows):
+    lines = ['%-48s %-12s %12s %12s %8s  %s'
+             % ('case', 'metric', 'baseline', 'current', 'change', 'status')]
+    for row in rows:
+        lines.append('%-48s %-12s %12.3f %12s %8s  %s'
+                     % (' '.join(str(value) for value in row['case']), row['metric'],
+                        row['baseline'],
+                        '-' if row['current'] is None else '%.3f' % row['current'],
+                        '-' if row['change'] is None else '%+.1f%%' % (100 * row['change']),
+                        row['status']))
+    return '\n'.join(lines)
+
+
+def run_current(parameters, repeat):
+    """Runs bench_engines with the parameters of the baseline"""
+    # only needed with --run, comparing json files works without rasterio
+    from benchmark.bench_engines import run_benchmark
+
+    with tempfile.TemporaryDirectory() as directory:
+        return run_benchmark(directory, parameters['size'], parameters['workers'],
+                             parameters['tile_sizes'], parameters['engines'], repeat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Performance regression gate')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerances', default=DEFAULT_TOLERANCES)
+    parser.add_argument('--current', default=None,
+                        help='json of bench_engines to check')
+    parser.add_argument('--run', action='store_true',
+                        help='run bench_engines with the parameters of the baseline')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of every case with --run')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='save the current results as new baseline')
+    parser.add_argument('-o', '--out', default=None,
+                        help='json file for the comparison')
+    args = parser.parse_args(argv)
+
+    if args.current is None and not args.run:
+        parser.error('either --current or --run is needed')
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as src:
+            baseline = json.load(src)
+    elif not args.update_baseline:
+        print('No baseline found at %s, create it on the reference machine with '
+              '--run --update-baseline' % args.baseline)
+        return 2
+
+    if args.run:
+        current = run_current(baseline['parameters'] if baseline else DEFAULT_PARAMETERS,
+                              args.repeat)
+    else:
+        with open(args.current) as src:
+            current = json.load(src)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as dst:
+            json.dump(current, dst, indent=2, sort_keys=True)
+        print('Baseline saved in %s' % args.baseline)
+        return 0
+
+    with open(args.tolerances) as src:
+        tolerances = json.load(src)
+
+    rows = compare(baseline, current, tolerances)
+    print(format_rows(rows))
+
+    if args.out:
+        with open(args.out, 'w') as dst:
+            json.dump({'rows': rows}, dst, indent=2)
+
+    failed = [row for row in rows if row['status'] in ('regression', 'missing')]
+    if failed:
+        print('%s tracked metrics regressed or are missing' % len(failed))
+        return 1
+    print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Synthetic Landsat-like scenes for the benchmarks.
+# The red and nir band are uint16 GeoTIFFs with the
+# internal block layout of the landsat-images on aws,
+# a rotated footprint with a nodata collar and a small
+# offset between the two timesteps.
+###########################################
+"""
+
+import os
+import numpy as np
+import rasterio as rio
+from rasterio.transform import from_origin
+
+
+# landsat 8 scenes on aws: 30m pixels, 512 x 512 deflate blocks
+PIXEL_SIZE = 30
+BLOCK_SIZE = 512
+ORIGIN = (460000, 5540000)
+CRS = 'EPSG:32632'
+
+
+class SyntheticItem(object):
+    """Stand-in for the statsac.Item of sat-search,
+    get_urls only needs the assets"""
+
+    def __init__(self, red, nir):
+        self.assets = {'B4': {'href': red}, 'B5': {'href': nir}}
+
+    def __str__(self):
+        return 'SYNTHETIC_%s' % os.path.basename(self.assets['B4']['href'])
+
+
+def footprint_mask(height, width, angle=12.0, margin=0.08):
+    """Boolean mask of a rotated rectangle like the footprint
+    of a landsat scene, False is the nodata collar"""
+    rows, cols = np.mgrid[0:height, 0:width].astype(np.float32)
+    rows = rows / height - 0.5
+    cols = cols / width - 0.5
+    theta = np.radians(angle)
+    u = cols * np.cos(theta) + rows * np.sin(theta)
+    v = -cols * np.sin(theta) + rows * np.cos(theta)
+    half = 0.5 - margin
+    return (np.abs(u) < half) & (np.abs(v) < half)
+
+
+def synthetic_bands(height, width, seed=0):
+    """Red and nir band with a smooth vegetation pattern and noise.
+    :returns:
+    two uint16 arrays"""
+    rng = np.random.RandomState(seed)
+    rows, cols = np.mgrid[0:height, 0:width].astype(np.float32)
+    vegetation = 0.5 + 0.5 * np.sin(rows / 97.0) * np.cos(cols / 131.0)
+
+    red = 7000 + 3000 * (1 - vegetation) + rng.normal(0, 300, (height, width))
+    nir = 9000 + 12000 * vegetation + rng.normal(0, 300, (height, width))
+
+    mask = footprint_mask(height, width)
+    red = np.where(mask, np.clip(red, 1, 65535), 0).astype(np.uint16)
+    nir = np.where(mask, np.clip(nir, 1, 65535), 0).astype(np.uint16)
+    return red, nir
+
+
+def write_band(path, array, origin=ORIGIN, block_size=BLOCK_SIZE):
+    """Writes one band as tiled deflate GeoTIFF with nodata 0"""
+    profile = {'driver': 'GTiff',
+               'width': array.shape[1],
+               'height': array.shape[0],
+               'count': 1,
+               'dtype': 'uint16',
+               'nodata': 0,
+               'crs': CRS,
+               'transform': from_origin(origin[0], origin[1], PIXEL_SIZE, PIXEL_SIZE),
+               'tiled': True,
+               'blockxsize': block_size,
+               'blockysize': block_size,
+               'compress': 'deflate'}
+    with rio.open(path, 'w', **profile) as dst:
+        dst.write(array, 1)
+
+
+def make_scene_pair(directory, size=2048, offset=7, block_size=BLOCK_SIZE):
+    """Creates two timesteps of a synthetic scene. The second scene is
+    shifted by offset pixels and slightly larger, like two landsat scenes
+    of the same path/row.
+    :parameter:
+    directory for the images,
+    width and height of the first scene in pixels,
+    shift of the second scene in pixels,
+    internal block size
+    :returns:
+    SyntheticItem of timestep 1 and 2"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    items = []
+    for timestep, (height, width, shift, seed) in enumerate(
+            [(size, size, 0, 1), (size + offset, size + 2 * offset, offset, 2)], 1):
+        red, nir = synthetic_bands(height, width, seed=seed)
+        origin = (ORIGIN[0] - shift * PIXEL_SIZE, ORIGIN[1] + shift * PIXEL_SIZE)
+        paths = [os.path.join(directory, 'ts%d_B%d.TIF' % (timestep, band))
+                 for band in (4, 5)]
+        write_band(paths[0], red, origin, block_size)
+        write_band(paths[1], nir, origin, block_size)
+        items.append(SyntheticItem(*paths))
+
+    return items[0], items[1]
@@ -0,0 +1,163 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Coarse-to-fine change detection. The difference
+# is first calculated from the overviews of the
+# whole scene (see overviews), only tiles where
+# the coarse absolute change exceeds a threshold
+# are read and calculated at the full resolution,
+# the others are filled from the coarse result.
+###########################################
+"""
+
+import numpy as np
+import rasterio as rio
+from parallized_resampled import get_urls, scene_tiles, process_windows
+from parallized_resampled import read_tile_blocks, compute_tile_difference
+from overviews import DEFAULT_FACTOR, decimated_shape, decimated_window
+from overviews import ArrayWriter, decimated_tiles, decimated_tiled_calc
+from io_profiles import gdal_env
+from tile_journal import TileWriter
+from instrumentation import NULL_RECORDER, INPUTS
+from progress import NULL_PROGRESS
+
+
+# absolute ndvi-difference of a coarse pixel marking its tiles as changed
+DEFAULT_THRESHOLD = 0.2
+
+# unchanged tiles take the upsampled coarse difference or nodata
+FILLS = ('coarse', 'nodata')
+
+
+def changed_tiles(coarse, tiles, shape, threshold=DEFAULT_THRESHOLD):
+    """Indexes of the tiles with a coarse pixel whose absolute difference
+    exceeds the threshold. Pixels without data in one of the timesteps
+    don't count, tiles smaller than a coarse pixel or missing in the
+    coarse result (failed) are always changed.
+    :parameter:
+    coarse difference and validity mask (see PRODUCTS),
+    list of windows of the full grid,
+    (height, width) of the full grid,
+    threshold of the absolute difference
+    :returns:
+    set of the indexes of the changed tiles"""
+    difference, valid = coarse
+    changed = set()
+    for window_idx, window in enumerate(tiles):
+        rows, cols = decimated_window(window, shape, difference.shape).toslices()
+        block = np.abs(difference[rows, cols])[valid[rows, cols] == 1]
+        if not difference[rows, cols].size or np.isnan(valid[rows, cols]).any() or \
+                (block > threshold).any():
+            changed.add(window_idx)
+    return changed
+
+
+def upsample(coarse, window, shape):
+    """The coarse pixels of a window of the full grid repeated
+    to its resolution (nearest neighbour)
+    :parameter:
+    coarse band,
+    window of the full grid,
+    (height, width) of the full grid
+    :returns:
+    Numpy-Array with the size of the window"""
+    scale_y, scale_x = coarse.shape[0] / float(shape[0]), coarse.shape[1] / float(shape[1])
+    rows = ((np.arange(int(window.height)) + window.row_off + 0.5) * scale_y).astype(int)
+    cols = ((np.arange(int(window.width)) + window.col_off + 0.5) * scale_x).astype(int)
+    rows = np.minimum(rows, coarse.shape[0] - 1)
+    cols = np.minimum(cols, coarse.shape[1] - 1)
+    return coarse[np.ix_(rows, cols)][np.newaxis]
+
+
+def coarse_to_fine_calc(statsac_item_ts1, statsac_item_ts2, outfile,
+                        threshold=DEFAULT_THRESHOLD, factor=DEFAULT_FACTOR, fill='coarse',
+                        tile_size_x=0, tile_size_y=0, max_workers=1, resume=False,
+                        checkpoint_every=None, recorder=NULL_RECORDER, opener=None,
+                        progress=NULL_PROGRESS, **options):
+    """Calculates the ndvi-difference from the overviews of the whole scene
+    and at the full resolution only for the tiles with a change above the
+    threshold. The outfile has the grid of optimal_tiled_calc or
+    customized_tiled_calc, the tiles_fine and tiles_coarse counters of
+    the recorder tell how many tiles were read at the full resolution.
+    :parameter:
+    Statsac-Item Object of date x,
+    Statsac-Item object of date y,
+    Name of outfile,
+    threshold of the absolute coarse difference,
+    decimation of the coarse pass (8 for 1/8 of the resolution),
+    fill of the unchanged tiles (see FILLS), nodata writes NaN,
+    tile size x and y in m (0 for the internal blocks of date x),
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    ProgressReporter counting the written tiles of the full grid (see progress),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if fill not in FILLS:
+        raise ValueError('fill needs to be one of %s' % ', '.join(FILLS))
+    if options.get('engine') == 'async':
+        # the async engine fetches every tile at the full resolution
+        raise ValueError('Coarse-to-fine can be calculated with the pool and the staged engine')
+    urls_timestep1 = get_urls(statsac_item_ts1)
+    urls_timestep2 = get_urls(statsac_item_ts2)
+
+    with gdal_env(options.get('gdal_options')), rio.open(urls_timestep1[0]) as src_red:
+        out_profile = src_red.profile.copy()
+        out_profile.update({'dtype': 'float32'})
+        if fill == 'nodata':
+            # the nodata of the bands (0 for landsat) is a valid difference
+            out_profile['nodata'] = np.nan
+        shape = (src_red.height, src_red.width)
+        tiles = scene_tiles(src_red, tile_size_x, tile_size_y)
+
+        # coarse pass over the whole scene in tiles of the decimated grid, the
+        # reads are recorded, its tiles aren't counted as tiles of the run
+        out_shape = decimated_shape(src_red.height, src_red.width, factor)
+        coarse = ArrayWriter(2, *out_shape)
+        with recorder.span('coarse'):
+            decimated_tiled_calc(urls_timestep1, urls_timestep2, coarse,
+                                 decimated_tiles(shape, out_shape),
+                                 shape, out_shape, recorder=recorder, opener=opener,
+                                 products=('difference', 'valid'),
+                                 engine_recorder=NULL_RECORDER,
+                                 max_workers=max_workers, **options)
+        changed = changed_tiles(coarse.array, tiles, shape, threshold)
+        recorder.count('tiles_fine', len(changed))
+        recorder.count('tiles_coarse', len(tiles) - len(changed))
+
+        # open outfile with outprofile, when resuming the existing
+        # outfile is updated instead
+        with TileWriter(outfile, out_profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+
+            def read(window_idx, window):
+                if window_idx in changed:
+                    return read_tile_blocks(urls_timestep1, urls_timestep2,
+                                            window, tiles, window_idx=window_idx,
+                                            recorder=recorder, opener=opener)
+                # nothing is read for the unchanged tiles
+                if fill == 'coarse':
+                    return upsample(coarse.array[0], window, shape)
+                return np.full((1, int(window.height), int(window.width)),
+                               np.nan, dtype=rio.float32)
+
+            def compute(data):
+                # the bands of a changed tile
+                if isinstance(data, tuple):
+                    return compute_tile_difference(data)
+                return data
+
+            # same order of the bands as returned by read_tile_blocks
+            urls = [urls_timestep1[0], urls_timestep1[1], urls_timestep2[0], urls_timestep2[1]]
+
+            failures = process_windows(tiles, urls, read, compute, dst,
+                                       max_workers=max_workers, completed=dst.completed,
+                                       recorder=recorder, progress=progress, inputs=INPUTS,
+                                       **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
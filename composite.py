@@ -0,0 +1,149 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Best-pixel composites of several scenes per
+# date. Clouds or gaps in the best scene are
+# filled with the other scenes of the date: the
+# scenes are streamed through every tile into a
+# max-NDVI or median composite, the composites of
+# both dates are passed to the difference kernel.
+###########################################
+"""
+
+import warnings
+import numpy as np
+import rasterio as rio
+from parallized_resampled import get_urls, scene_tiles, process_windows, SceneGrid
+from parallized_resampled import read_scene_ndvi, calculate_difference
+from io_profiles import gdal_env
+from tile_journal import TileWriter
+from ndvi_cache import grid_id
+from instrumentation import NULL_RECORDER, scene_inputs
+
+
+# max-ndvi keeps the greenest (least clouded) value of a pixel,
+# median the middle one of all scenes with data
+COMPOSITES = ('max-ndvi', 'median')
+
+# default number of scenes per date
+DEFAULT_SCENES = 3
+
+# value of calculate_ndvi for pixels without data
+MISSING = -2
+
+
+class MaxComposite(object):
+    """Running maximum of the ndvi, one buffer of the tile size.
+    Pixels without data (-2) are lower than every ndvi, so they are
+    replaced by the first scene with data."""
+
+    def __init__(self, shape):
+        self.ndvi = np.full(shape, MISSING, dtype=np.float32)
+
+    def add(self, ndvi):
+        np.maximum(self.ndvi, ndvi, out=self.ndvi)
+
+    def result(self):
+        return self.ndvi
+
+
+class MedianComposite(object):
+    """Median of the ndvi of all scenes with data. The median needs every
+    value, so the memory is one buffer of the tile size per scene of the
+    date (bounded by the number of scenes searched per date)."""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.values = []
+
+    def add(self, ndvi):
+        self.values.append(np.where(ndvi == MISSING, np.nan, ndvi).astype(np.float32))
+
+    def result(self):
+        with warnings.catch_warnings():
+            # pixels without data in every scene
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median = np.nanmedian(np.stack(self.values), axis=0)
+        return np.where(np.isnan(median), MISSING, median).astype(np.float32)
+
+
+def make_composite(method, shape):
+    """Returns an empty composite of a tile (see COMPOSITES)"""
+    if method == 'max-ndvi':
+        return MaxComposite(shape)
+    if method == 'median':
+        return MedianComposite(shape)
+    raise ValueError('composite needs to be one of %s' % ', '.join(COMPOSITES))
+
+
+def composite_tiled_calc(items_ts1, items_ts2, outfile, method='max-ndvi', tile_size_x=0,
+                         tile_size_y=0, max_workers=1, resume=False, checkpoint_every=None,
+                         recorder=NULL_RECORDER, opener=None, cache=None, **options):
+    """Calculates the difference of the composites of two dates tile by tile.
+    The first scene of items_ts1 is the source of the outfile, all other
+    scenes are reprojected to its grid, so scenes of other path/rows or
+    with shifted grids are read at the same ground position.
+    :parameter:
+    List of Statsac-Item Objects of date x, the best scene first (see search_images),
+    List of Statsac-Item Objects of date y,
+    Name of outfile,
+    composite of the scenes of a date (see COMPOSITES),
+    tile size x and y in m (0 for the internal blocks of the first scene),
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    NdviTileCache with the ndvi of scenes calculated before (see ndvi_cache),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if method not in COMPOSITES:
+        raise ValueError('composite needs to be one of %s' % ', '.join(COMPOSITES))
+    if not items_ts1 or not items_ts2:
+        raise ValueError('Every date needs at least one scene')
+    if options.get('engine') == 'async':
+        # the scenes are streamed one after another, the async
+        # engine would fetch all of them at the same time
+        raise ValueError('Composites can be calculated with the pool and the staged engine')
+    urls_scenes = [get_urls(item) for item in list(items_ts1) + list(items_ts2)]
+    urls = [url for urls_scene in urls_scenes for url in urls_scene]
+    dates = [range(len(items_ts1)), range(len(items_ts1), len(urls_scenes))]
+
+    with gdal_env(options.get('gdal_options')), rio.open(urls_scenes[0][0]) as src_red:
+        out_profile = src_red.profile.copy()
+        out_profile.update({'dtype': 'float32'})
+        tiles = scene_tiles(src_red, tile_size_x, tile_size_y)
+        grid = grid_id(src_red, tiles)
+        reference = SceneGrid(src_red)
+        # open outfile with outprofile, when resuming the existing
+        # outfile is updated instead
+        with TileWriter(outfile, out_profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+
+            def read(window_idx, window):
+                # only the bands of one scene and the composites are in memory
+                composites = []
+                for scenes in dates:
+                    composite = make_composite(method, (1, int(window.height),
+                                                        int(window.width)))
+                    for number in scenes:
+                        ndvi = read_scene_ndvi(urls_scenes, number, window, tiles, window_idx,
+                                               recorder, opener, cache, grid, reference)
+                        with recorder.span('kernel', window_idx):
+                            composite.add(ndvi)
+                    composites.append(composite)
+                return composites
+
+            def compute(composites):
+                return calculate_difference(*[composite.result() for composite in composites])
+
+            failures = process_windows(tiles, urls, read, compute, dst,
+                                       max_workers=max_workers, completed=dst.completed,
+                                       recorder=recorder,
+                                       inputs=scene_inputs(len(urls_scenes)),
+                                       **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
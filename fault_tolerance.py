@@ -0,0 +1,222 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Fault tolerant execution of the tiles.
+# Transient I/O-Errors are retried with exponential
+# backoff, tiles running far longer than the median
+# tile are started a second time (the first result
+# wins) and windows which fail for good are collected
+# in a summary instead of aborting the whole scene.
+###########################################
+"""
+
+import random
+import threading
+import concurrent.futures
+from statistics import median
+from time import time, sleep
+import rasterio as rio
+
+
+# errors worth another try, e.g. a dropped http connection
+TRANSIENT_ERRORS = (rio.RasterioIOError, OSError)
+
+# marks the result of a window which failed for good
+FAILED = object()
+
+
+class RetryPolicy(object):
+    """Settings of the fault tolerant execution.
+    :parameter:
+    Number of retries after a transient error,
+    backoff before the first retry in seconds (doubled for every retry),
+    maximum backoff in seconds,
+    tiles running straggler_factor times longer than the median tile
+    are started again (None switches it off),
+    number of finished tiles before stragglers are detected"""
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=8.0,
+                 straggler_factor=4.0, min_samples=8):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.straggler_factor = straggler_factor
+        self.min_samples = min_samples
+
+    def delay(self, attempt):
+        """Backoff before the retry number attempt (starting at 0),
+        with jitter so the workers don't retry at the same time"""
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+
+def with_retries(function, policy):
+    """Wraps a function, so transient errors are retried.
+    :parameter:
+    function,
+    RetryPolicy
+    :returns:
+    wrapped function"""
+
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except TRANSIENT_ERRORS:
+                if attempt >= policy.retries:
+                    raise
+                sleep(policy.delay(attempt))
+                attempt += 1
+
+    return wrapper
+
+
+def failure(task, exc):
+    """Entry of the failure summary for a task (window_idx, window)"""
+    window = task[1]
+    return {'window_idx': task[0],
+            'window': [int(window.col_off), int(window.row_off),
+                       int(window.width), int(window.height)],
+            'error': '%s: %s' % (type(exc).__name__, exc)}
+
+
+def tolerant(function, policy, failures):
+    """Wraps the read function of a task for the staged engine.
+    Transient errors are retried, a task whose transient errors persist
+    is added to failures and FAILED is returned instead of raising.
+    Other errors (e.g. programming errors) are raised.
+    :parameter:
+    function(task),
+    RetryPolicy,
+    list collecting the failures
+    :returns:
+    wrapped function"""
+    retrying = with_retries(function, policy)
+
+    def wrapper(task):
+        try:
+            return retrying(task)
+        except TRANSIENT_ERRORS as exc:
+            failures.append(failure(task, exc))
+            return FAILED
+
+    return wrapper
+
+
+def skip_failed(function):
+    """Wraps a compute or write function, so FAILED is passed on"""
+
+    def wrapper(*args):
+        if args[-1] is FAILED:
+            return FAILED
+        return function(*args)
+
+    return wrapper
+
+
+def run_pool(tasks, task_fn, write_fn, max_workers=1, policy=None, poll=0.5,
+             executor=None):
+    """Runs one task per tile on a thread pool and writes the results
+    in the calling thread. Without a policy the first error is raised,
+    like the plain as_completed loop did, with a policy only windows
+    failing with transient errors are skipped, other errors are raised.
+    :parameter:
+    List of (window_idx, window),
+    task_fn(task) returning the result of the task,
+    write_fn(task, result) writing the result,
+    Number of Processors,
+    RetryPolicy or None,
+    seconds between two checks for stragglers,
+    executor shared with other runs (see batch), max_workers is ignored then
+    :returns:
+    list with the failed windows"""
+
+    raise_errors = policy is None
+    policy = policy or RetryPolicy(retries=0, straggler_factor=None)
+    retrying = with_retries(task_fn, policy)
+
+    failures = []
+    durations = []
+    started = {}
+    lock = threading.Lock()
+
+    def run(task):
+        with lock:
+            started.setdefault(task[0], time())
+        start = time()
+        result = retrying(task)
+        return result, time() - start
+
+    # source: https://gist.github.com/sgillies/b90a79917d7ec5ca0c074b5f6f4857e3.js.
+    # This was adapted for the ndvi processing
+    shared = executor is not None
+    if not shared:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                         thread_name_prefix='worker')
+    pending = dict()
+    copies = dict()
+    finished = set()
+
+    def finish(task):
+        # the other copies of a finished task are dropped, so a
+        # straggler doesn't hold back the end of the run
+        finished.add(task[0])
+        for other in copies[task[0]]:
+            other.cancel()
+            pending.pop(other, None)
+
+    try:
+        for task in tasks:
+            future = executor.submit(run, task)
+            pending[future] = task
+            copies[task[0]] = [future]
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, timeout=poll,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future not in pending:
+                    # loser of a speculative copy
+                    continue
+                task = pending.pop(future)
+                try:
+                    result, duration = future.result()
+                except Exception as exc:
+                    if raise_errors or not isinstance(exc, TRANSIENT_ERRORS):
+                        raise
+                    # another copy of the task might still succeed
+                    if any(other in pending for other in copies[task[0]]):
+                        continue
+                    finish(task)
+                    failures.append(failure(task, exc))
+                    continue
+
+                finish(task)
+                durations.append(duration)
+                write_fn(task, result)
+
+            # start stragglers a second time
+            if policy.straggler_factor and len(durations) >= policy.min_samples:
+                limit = policy.straggler_factor * median(durations)
+                now = time()
+                with lock:
+                    running = list(started.items())
+                for window_idx, start in running:
+                    if (window_idx not in finished and len(copies[window_idx]) == 1
+                            and now - start > limit):
+                        task = pending[copies[window_idx][0]]
+                        future = executor.submit(run, task)
+                        pending[future] = task
+                        copies[window_idx].append(future)
+    finally:
+        if shared:
+            # the executor keeps running the tasks of other runs
+            for future in pending:
+                future.cancel()
+        else:
+            # don't wait for the losers of speculative copies
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return failures
@@ -0,0 +1,153 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Lightweight timing of the tile stages. Every
+# stage of a tile (open, read timestep 1, resampled
+# read timestep 2, kernel, write) is recorded as a
+# span, at the end of the run the spans are summed
+# up per stage as histogram. Counters (tiles, bytes
+# read per input, ...) are kept next to the spans.
+###########################################
+"""
+
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+import numpy as np
+
+
+# the stages of a tile in processing order
+STAGES = ('open', 'read_ts1', 'read_ts2', 'kernel', 'write')
+
+# the bands read for every tile, in the order of read_tile_blocks
+INPUTS = ('red_ts1', 'nir_ts1', 'red_ts2', 'nir_ts2')
+
+
+def scene_inputs(count):
+    """Names of the bands read for count scenes (see time_series),
+    the same as INPUTS for two scenes"""
+    return tuple('%s_ts%d' % (band, scene + 1)
+                 for scene in range(count) for band in ('red', 'nir'))
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, 10.0, 20.0, 50.0, float('inf'))
+
+
+class Span(object):
+    """One timed stage of a tile"""
+    __slots__ = ('stage', 'window_idx', 'thread', 'start', 'duration')
+
+    def __init__(self, stage, window_idx, thread, start, duration):
+        self.stage = stage
+        self.window_idx = window_idx
+        self.thread = thread
+        self.start = start
+        self.duration = duration
+
+
+class Recorder(object):
+    """Collects the spans of a run. list.append is atomic,
+    so the workers record without a lock."""
+
+    enabled = True
+
+    def __init__(self):
+        self.spans = []
+        self.origin = perf_counter()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, window_idx=None):
+        """Times the code inside the with-block as stage of a tile"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(stage, window_idx, threading.current_thread().name,
+                                   start - self.origin, perf_counter() - start))
+
+    def count(self, name, value=1, label=None):
+        """Adds value to the counter name, e.g. the bytes read for
+        the input label"""
+        with self._lock:
+            self._counters[name, label] = self._counters.get((name, label), 0) + value
+
+    def counters(self):
+        """Returns a dict with the value of every counter,
+        counters with labels as dict label: value"""
+        with self._lock:
+            items = list(self._counters.items())
+        counters = {}
+        for (name, label), value in sorted(items, key=lambda item: str(item[0])):
+            if label is None:
+                counters[name] = value
+            else:
+                counters.setdefault(name, {})[label] = value
+        return counters
+
+    def durations(self):
+        """Returns a dict with the durations of every stage"""
+        durations = {}
+        for span in list(self.spans):
+            durations.setdefault(span.stage, []).append(span.duration)
+        return durations
+
+    def summary(self):
+        """Aggregates the spans per stage.
+        :returns:
+        dict with count, total, mean, quantiles and histogram per stage"""
+        summary = {}
+        for stage, values in self.durations().items():
+            values = np.asarray(values)
+            counts = np.histogram(values, bins=(0,) + BUCKETS)[0]
+            summary[stage] = {'count': int(values.size),
+                              'total_s': float(values.sum()),
+                              'mean_s': float(values.mean()),
+                              'p50_s': float(np.percentile(values, 50)),
+                              'p90_s': float(np.percentile(values, 90)),
+                              'p99_s': float(np.percentile(values, 99)),
+                              'max_s': float(values.max()),
+                              'histogram': dict(('<=%gs' % bound, int(count))
+                                                for bound, count in zip(BUCKETS, counts)
+                                                if count)}
+        return summary
+
+    def format_summary(self):
+        """Table of the summary with a text histogram per stage"""
+        summary = self.summary()
+        order = [stage for stage in STAGES if stage in summary]
+        order += sorted(stage for stage in summary if stage not in STAGES)
+
+        lines = ['%-10s %7s %9s %9s %9s %9s %9s'
+                 % ('stage', 'count', 'total s', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms')]
+        for stage in order:
+            entry = summary[stage]
+            lines.append('%-10s %7d %9.2f %9.1f %9.1f %9.1f %9.1f'
+                         % (stage, entry['count'], entry['total_s'], entry['mean_s'] * 1e3,
+                            entry['p50_s'] * 1e3, entry['p90_s'] * 1e3, entry['p99_s'] * 1e3))
+        for stage in order:
+            histogram = summary[stage]['histogram']
+            largest = max(histogram.values())
+            lines.append('%s:' % stage)
+            for bucket, count in histogram.items():
+                lines.append('  %8s %6d %s' % (bucket, count, '#' * max(1, 40 * count // largest)))
+        return '\n'.join(lines)
+
+
+class NullRecorder(object):
+    """Recorder doing nothing, used if no instrumentation is wanted"""
+
+    enabled = False
+
+    @contextmanager
+    def span(self, stage, window_idx=None):
+        yield
+
+    def count(self, name, value=1, label=None):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
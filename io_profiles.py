@@ -0,0 +1,108 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Named I/O-Profiles for the GDAL environment.
+# A profile is a set of GDAL config options
+# which is applied in the main thread and in
+# every worker reading the images.
+###########################################
+"""
+
+import functools
+import rasterio as rio
+
+
+# GDAL config options of the profiles
+PROFILES = {
+    # images on a local disk, a bounded but generous block cache
+    'local': {
+        'GDAL_CACHEMAX': 512,
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'FALSE',
+        'VSI_CACHE': 'FALSE',
+    },
+    # cloud optimized geotiffs on http-servers (e.g. landsat on aws)
+    'remote-cog': {
+        'GDAL_CACHEMAX': 512,
+        # don't list the directory of the image for sidecar files
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+        'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.TIF,.tiff,.ovr',
+        # several requests over one connection and one request
+        # for neighbouring byte ranges
+        'GDAL_HTTP_MULTIPLEX': 'YES',
+        'GDAL_HTTP_VERSION': '2',
+        'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+        'VSI_CACHE': 'TRUE',
+        'VSI_CACHE_SIZE': 50000000,
+        'GDAL_HTTP_MAX_RETRY': 3,
+        'GDAL_HTTP_RETRY_DELAY': 1,
+    },
+    # many workers on a small machine
+    'low-memory': {
+        'GDAL_CACHEMAX': 64,
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+        'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.TIF,.tiff,.ovr',
+        'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+        'VSI_CACHE': 'FALSE',
+    },
+}
+
+DEFAULT_PROFILE = 'remote-cog'
+
+
+def resolve_profile(name=None, overrides=None):
+    """Returns the GDAL config options of a profile.
+    :parameter:
+    Name of the profile (None for the default profile),
+    dict with options replacing the ones of the profile
+    :returns:
+    dict with GDAL config options"""
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError('Unknown io_profile %s, choose one of %s'
+                         % (name, ', '.join(sorted(PROFILES))))
+
+    options = dict(PROFILES[name])
+    options.update(overrides or {})
+    return options
+
+
+def gdal_env(options=None):
+    """Creates a rasterio environment with the given options.
+    :parameter:
+    dict with GDAL config options
+    :returns:
+    rasterio.Env"""
+    return rio.Env(**(options or {}))
+
+
+def with_gdal_env(function, options=None):
+    """Wraps a function, so it runs inside a rasterio environment.
+    Needed for worker threads, which don't share the environment
+    of the main thread.
+    :parameter:
+    function,
+    dict with GDAL config options
+    :returns:
+    wrapped function"""
+    if not options:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with gdal_env(options):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def effective_options(options=None):
+    """Returns the options of the environment as they are set,
+    for the run report.
+    :parameter:
+    dict with GDAL config options
+    :returns:
+    dict with the options of the environment"""
+    with gdal_env(options):
+        return dict((key, value) for key, value in rio.env.getenv().items()
+                    if key.isupper())
@@ -0,0 +1,214 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Machine readable metrics of a run. The counters
+# and spans of the Recorder are exported as
+# Prometheus textfile (node_exporter textfile
+# collector) and as section of the run report,
+# both are updated periodically during the run.
+###########################################
+"""
+
+import os
+import threading
+from time import time, perf_counter
+from run_report import report_path
+from profiling import peak_rss_mb
+
+
+# seconds between two updates of the metrics
+DEFAULT_INTERVAL = 15
+
+# prefix of the prometheus metrics
+NAMESPACE = 'ndvi'
+
+QUANTILES = (('0.5', 'p50_s'), ('0.9', 'p90_s'), ('0.99', 'p99_s'))
+
+
+def metrics_path(outfile):
+    """Returns the path of the prometheus textfile for an outfile"""
+    return os.path.splitext(outfile)[0] + '.prom'
+
+
+def busy_seconds(spans):
+    """Time covered by the spans, overlapping spans are counted once"""
+    busy = 0.0
+    end = None
+    for span in sorted(spans, key=lambda span: span.start):
+        stop = span.start + span.duration
+        if end is None or span.start > end:
+            busy += span.duration
+            end = stop
+        elif stop > end:
+            busy += stop - end
+            end = stop
+    return busy
+
+
+def worker_utilization(recorder, now=None):
+    """Share of the time every thread spent in a stage since
+    the first span of the run.
+    :parameter:
+    Recorder (see instrumentation),
+    current time relative to recorder.origin
+    :returns:
+    dict thread: utilization between 0 and 1"""
+    spans = list(recorder.spans)
+    if not spans:
+        return {}
+    if now is None:
+        now = perf_counter() - recorder.origin
+    elapsed = now - min(span.start for span in spans)
+    threads = {}
+    for span in spans:
+        threads.setdefault(span.thread, []).append(span)
+    return dict((thread, min(1.0, busy_seconds(thread_spans) / elapsed) if elapsed > 0 else 0.0)
+                for thread, thread_spans in threads.items())
+
+
+def hit_rates(counters):
+    """Hit rate of every cache with a <cache>_hits and <cache>_misses counter"""
+    rates = {}
+    for name, hits in counters.items():
+        if name.endswith('_hits'):
+            cache = name[:-len('_hits')]
+            lookups = hits + counters.get(cache + '_misses', 0)
+            rates[cache] = hits / float(lookups) if lookups else 0.0
+    return rates
+
+
+def collect(recorder):
+    """Collects the metrics of a run from a Recorder.
+    :returns:
+    dict with the metrics, the same structure is used in the run report"""
+    counters = recorder.counters()
+    utilization = worker_utilization(recorder)
+    workers = [value for thread, value in utilization.items() if thread != 'MainThread']
+    return {'updated': time(),
+            'tiles_total': counters.get('tiles_total', 0),
+            'tiles_processed': counters.get('tiles_processed', 0),
+            'tiles_skipped': counters.get('tiles_skipped', 0),
+            'bytes_read': counters.get('bytes_read', {}),
+            'cache_hit_rates': hit_rates(counters),
+            'stages': dict((stage, dict((key, value) for key, value in entry.items()
+                                        if key != 'histogram'))
+                           for stage, entry in recorder.summary().items()),
+            'worker_utilization': utilization,
+            'mean_worker_utilization': sum(workers) / len(workers) if workers else 0.0,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def _line(name, value, labels=None):
+    labels = ','.join('%s="%s"' % (key, str(label).replace('\\', '\\\\').replace('"', '\\"'))
+                      for key, label in sorted((labels or {}).items()))
+    return '%s_%s%s %r' % (NAMESPACE, name, '{%s}' % labels if labels else '', float(value))
+
+
+def format_prometheus(metrics, job=None):
+    """Formats the metrics in the prometheus text exposition format.
+    :parameter:
+    dict as returned by collect,
+    value of the job label (e.g. the name of the outfile)
+    :returns:
+    string"""
+    base = {'job': job} if job else {}
+
+    def labels(**extra):
+        extra.update(base)
+        return extra
+
+    entries = [
+        ('tiles_total', 'gauge', 'Tiles of the outfile',
+         [_line('tiles_total', metrics['tiles_total'], labels())]),
+        ('tiles_processed_total', 'counter', 'Tiles written to the outfile',
+         [_line('tiles_processed_total', metrics['tiles_processed'], labels())]),
+        ('tiles_skipped_total', 'counter', 'Tiles skipped because they are in the journal',
+         [_line('tiles_skipped_total', metrics['tiles_skipped'], labels())]),
+        ('bytes_read_total', 'counter', 'Bytes read per input band',
+         [_line('bytes_read_total', value, labels(input=name))
+          for name, value in sorted(metrics['bytes_read'].items())]),
+        ('cache_hit_ratio', 'gauge', 'Hit rate of the caches',
+         [_line('cache_hit_ratio', value, labels(cache=name))
+          for name, value in sorted(metrics['cache_hit_rates'].items())]),
+        ('stage_latency_seconds', 'summary', 'Latency of the stages of a tile',
+         [line for stage, entry in sorted(metrics['stages'].items())
+          for line in [_line('stage_latency_seconds', entry[key],
+                             labels(stage=stage, quantile=quantile))
+                       for quantile, key in QUANTILES]
+          + [_line('stage_latency_seconds_sum', entry['total_s'], labels(stage=stage)),
+             _line('stage_latency_seconds_count', entry['count'], labels(stage=stage))]]),
+        ('worker_utilization', 'gauge', 'Share of the time a thread spent in a stage',
+         [_line('worker_utilization', value, labels(thread=thread))
+          for thread, value in sorted(metrics['worker_utilization'].items())]),
+        ('peak_rss_bytes', 'gauge', 'Peak resident set size of the process',
+         [_line('peak_rss_bytes', metrics['peak_rss_mb'] * 1e6, labels())]),
+        ('last_update_timestamp_seconds', 'gauge', 'Time of the last update',
+         [_line('last_update_timestamp_seconds', metrics['updated'], labels())]),
+    ]
+
+    lines = []
+    for name, kind, description, samples in entries:
+        if not samples:
+            continue
+        lines.append('# HELP %s_%s %s' % (NAMESPACE, name, description))
+        lines.append('# TYPE %s_%s %s' % (NAMESPACE, name, kind))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter(object):
+    """Writes the metrics of a Recorder every interval seconds to a
+    prometheus textfile and the metrics-section of the run report.
+    Used as context manager around the processing, the last update
+    is written when leaving it.
+    :parameter:
+    Recorder (see instrumentation),
+    RunReport or None,
+    Name of outfile, the files are saved next to it,
+    path of the prometheus textfile (default: outfile with the suffix .prom),
+    seconds between two updates"""
+
+    def __init__(self, recorder, report, outfile, prom_file=None, interval=DEFAULT_INTERVAL):
+        self.recorder = recorder
+        self.report = report
+        self.outfile = outfile
+        self.prom_file = prom_file or metrics_path(outfile)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def write(self):
+        """Collects the metrics and saves them, the files are replaced
+        atomically so a scraper never reads half a file"""
+        metrics = collect(self.recorder)
+        tmp_path = self.prom_file + '.tmp'
+        with open(tmp_path, 'w') as dst:
+            dst.write(format_prometheus(metrics, job=os.path.basename(self.outfile)))
+        os.replace(tmp_path, self.prom_file)
+
+        if self.report is not None:
+            self.report.set('metrics', metrics)
+            self.report.write(report_path(self.outfile))
+        return metrics
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.write()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,219 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Mosaics of several scenes per date for areas
+# of interest crossing the edge of a path/row.
+# For each date the smallest set of scenes
+# covering the area is chosen, a grid index of
+# the footprints tells every tile which scenes it
+# has to read. The NDVI of the scenes is merged
+# before the difference is calculated.
+###########################################
+"""
+
+from math import floor, ceil
+import numpy as np
+import rasterio as rio
+from rasterio import warp, windows, features
+from rasterio.transform import Affine
+from parallized_resampled import get_urls, process_windows, read_warped_blocks
+from parallized_resampled import calculate_ndvi, calculate_difference
+from io_profiles import gdal_env
+from tile_journal import TileWriter
+from instrumentation import NULL_RECORDER, scene_inputs
+
+
+# number of scenes searched per date to choose the mosaic from
+DEFAULT_CANDIDATES = 10
+
+# pixels per cell of the footprint index
+CELL_SIZE = 16
+
+# crs of the bounding box and of the footprints of sat-search
+GEOGRAPHIC = 'EPSG:4326'
+
+# value of calculate_ndvi for pixels without data
+MISSING = -2
+
+
+def aoi_grid(bounding_box, reference):
+    """Grid of the outfile: the bounding box in the crs and the
+    pixels of the reference scene
+    :parameter:
+    Bounding Box as List (lon/lat),
+    open dataset of the reference scene
+    :returns:
+    crs, transform, width, height"""
+    left, bottom, right, top = warp.transform_bounds(GEOGRAPHIC, reference.crs, *bounding_box)
+    res_x, res_y = reference.res
+    origin_x, origin_y = reference.transform.c, reference.transform.f
+    col_start, col_stop = floor((left - origin_x) / res_x), ceil((right - origin_x) / res_x)
+    row_start, row_stop = floor((origin_y - top) / res_y), ceil((origin_y - bottom) / res_y)
+    transform = Affine(res_x, 0, origin_x + col_start * res_x,
+                       0, -res_y, origin_y - row_start * res_y)
+    return reference.crs, transform, col_stop - col_start, row_stop - row_start
+
+
+def grid_tiles(width, height, tile_width, tile_height):
+    """Windows of tile_width x tile_height pixels covering the grid row by row"""
+    return [windows.Window(col, row, min(tile_width, width - col), min(tile_height, height - row))
+            for row in range(0, height, tile_height) for col in range(0, width, tile_width)]
+
+
+def footprint(statsac_item, src, crs):
+    """Footprint of a scene in crs, the geometry of the sat-search item
+    or the bounds of the image if the item has none"""
+    geometry = getattr(statsac_item, 'geometry', None)
+    if geometry:
+        return warp.transform_geom(GEOGRAPHIC, crs, geometry)
+    left, bottom, right, top = src.bounds
+    box = {'type': 'Polygon',
+           'coordinates': [[(left, bottom), (right, bottom), (right, top),
+                            (left, top), (left, bottom)]]}
+    return warp.transform_geom(src.crs, crs, box)
+
+
+def choose_scenes(coverages):
+    """Smallest set of scenes covering the grid (greedy set cover), the
+    scene adding the most cells is taken first, on a tie the earlier
+    (less clouded) scene. Scenes adding nothing are left out.
+    :parameter:
+    boolean cell coverage of every candidate
+    :returns:
+    list with the indexes of the chosen scenes"""
+    if not coverages:
+        return []
+    covered = np.zeros_like(coverages[0])
+    chosen = []
+    while True:
+        gains = [int(np.count_nonzero(coverage & ~covered)) for coverage in coverages]
+        best = int(np.argmax(gains))
+        if gains[best] == 0:
+            return chosen
+        chosen.append(best)
+        covered |= coverages[best]
+
+
+class MosaicLayout(object):
+    """Grid of the outfile, the chosen scenes of both dates and the
+    scenes every tile reads. The footprints are rasterized once into
+    cells of CELL_SIZE pixels, the scenes of a tile are the ones
+    touching one of its cells.
+    :parameter:
+    List of Statsac-Item Objects of date x and y, the best scene first
+    (see search_images), the first one is the reference of the grid,
+    Bounding Box as List (lon/lat),
+    tile size x and y in m (0 for the internal blocks of the reference scene),
+    dict with GDAL config options for reading the headers (see io_profiles)"""
+
+    def __init__(self, items_ts1, items_ts2, bounding_box, tile_size_x=0, tile_size_y=0,
+                 gdal_options=None):
+        with gdal_env(gdal_options):
+            with rio.open(get_urls(items_ts1[0])[0]) as reference:
+                self.crs, self.transform, self.width, self.height = \
+                    aoi_grid(bounding_box, reference)
+                if tile_size_x and tile_size_y > 0:
+                    tile_height, tile_width = (int(round(tile_size_y / reference.res[1])),
+                                               int(round(tile_size_x / reference.res[0])))
+                else:
+                    tile_height, tile_width = reference.block_shapes[0]
+                self.profile = {'driver': 'GTiff', 'dtype': 'float32', 'count': 1,
+                                'crs': self.crs, 'transform': self.transform,
+                                'width': self.width, 'height': self.height,
+                                'nodata': reference.nodata}
+                if reference.profile.get('compress'):
+                    self.profile['compress'] = reference.profile['compress']
+                if tile_width % 16 == 0 and tile_height % 16 == 0:
+                    self.profile.update({'tiled': True, 'blockxsize': tile_width,
+                                         'blockysize': tile_height})
+            self.tiles = grid_tiles(self.width, self.height, tile_width, tile_height)
+
+            cells = (max(1, ceil(self.height / CELL_SIZE)), max(1, ceil(self.width / CELL_SIZE)))
+            cell_transform = self.transform * Affine.scale(CELL_SIZE)
+            self.scenes = []
+            self.urls_scenes = []
+            # scenes of every tile for date x and y, as indexes into urls_scenes
+            self.tile_scenes = []
+            for items in (items_ts1, items_ts2):
+                coverages = []
+                for item in items:
+                    with rio.open(get_urls(item)[0]) as src:
+                        shape = footprint(item, src, self.crs)
+                    coverages.append(features.rasterize([(shape, 1)], out_shape=cells,
+                                                        transform=cell_transform,
+                                                        all_touched=True,
+                                                        dtype='uint8').astype(bool))
+                chosen = choose_scenes(coverages)
+                numbers = list(range(len(self.urls_scenes),
+                                     len(self.urls_scenes) + len(chosen)))
+                self.scenes.append([items[index] for index in chosen])
+                self.urls_scenes += [get_urls(items[index]) for index in chosen]
+                self.tile_scenes.append([
+                    [number for number, index in zip(numbers, chosen)
+                     if coverages[index][self.cells(window)].any()]
+                    for window in self.tiles])
+
+    def cells(self, window):
+        """Slices of the cells of the footprint index a window touches"""
+        return (slice(int(window.row_off) // CELL_SIZE,
+                      -(-int(window.row_off + window.height) // CELL_SIZE)),
+                slice(int(window.col_off) // CELL_SIZE,
+                      -(-int(window.col_off + window.width) // CELL_SIZE)))
+
+
+def mosaic_tiled_calc(layout, outfile, max_workers=1, resume=False, checkpoint_every=None,
+                      recorder=NULL_RECORDER, opener=None, **options):
+    """Calculates the difference of the NDVI mosaics of two dates tile by
+    tile. Every tile reads only the scenes whose footprint touches it, a
+    pixel takes the ndvi of the first (least clouded) scene with data.
+    :parameter:
+    MosaicLayout,
+    Name of outfile,
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if options.get('engine') == 'async':
+        # the async engine fetches every band of the grid, it can't reproject
+        raise ValueError('Mosaics can be calculated with the pool and the staged engine')
+    urls = [url for urls_scene in layout.urls_scenes for url in urls_scene]
+    inputs = scene_inputs(len(layout.urls_scenes))
+
+    def read(window_idx, window):
+        mosaics = []
+        for date, stage in enumerate(('read_ts1', 'read_ts2')):
+            mosaic = np.full((1, int(window.height), int(window.width)), MISSING,
+                             dtype=rio.float32)
+            for number in layout.tile_scenes[date][window_idx]:
+                blocks = read_warped_blocks(layout.urls_scenes[number], layout, window,
+                                            window_idx, stage, recorder, opener,
+                                            inputs[2 * number:2 * number + 2])
+                with recorder.span('kernel', window_idx):
+                    ndvi = calculate_ndvi(*blocks)
+                    gaps = mosaic == MISSING
+                    mosaic[gaps] = ndvi[gaps]
+                # the other scenes of the tile aren't needed without gaps
+                if not (mosaic == MISSING).any():
+                    break
+            mosaics.append(mosaic)
+        return mosaics
+
+    def compute(mosaics):
+        return calculate_difference(*mosaics)
+
+    with gdal_env(options.get('gdal_options')):
+        # open outfile with the profile of the grid, when resuming the
+        # existing outfile is updated instead
+        with TileWriter(outfile, layout.profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+            failures = process_windows(layout.tiles, urls, read, compute, dst,
+                                       max_workers=max_workers, completed=dst.completed,
+                                       recorder=recorder, inputs=inputs, **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
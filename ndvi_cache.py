@@ -0,0 +1,164 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Persistent cache of calculated NDVI tiles. A
+# tile is stored compressed per scene, grid and
+# window, so a scene compared again (e.g. the
+# same baseline with a new acquisition) isn't read
+# and calculated again. The least recently used
+# tiles are removed above the size limit.
+###########################################
+"""
+
+import os
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from tile_journal import window_key
+from instrumentation import NULL_RECORDER
+
+
+# size limit of the cache
+DEFAULT_MAX_MB = 1024
+
+# float32 keeps the ndvi as calculated, int16 stores it
+# scaled by INT16_SCALE (-2 for missing values becomes -20000)
+DTYPES = ('float32', 'int16')
+INT16_SCALE = 10000.0
+
+SUFFIX = '.npz'
+
+
+def scene_id(urls):
+    """Id of a scene: name of the red band and a hash of the urls"""
+    digest = hashlib.sha1('\n'.join(urls).encode('utf8')).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(urls[0]))[0]
+    return '%s_%s' % (name, digest)
+
+
+def grid_id(reference, tiles):
+    """Id of the grid a tile is calculated on: crs, transform and shape
+    of the grid all scenes are resampled to and the tiling (the
+    boundary-cases of read_tile_blocks depend on the neighbouring
+    windows). It doesn't depend on the reference scene itself, so a
+    scene cached as timestep 1 is found again as timestep 2 of another
+    reference with the same grid.
+    :parameter:
+    open dataset of the reference scene (or an object with crs,
+    transform, width and height),
+    list of windows used for the tiling process"""
+    digest = hashlib.sha1(('%s\n%s\n%d %d\n' % (
+        reference.crs, ' '.join('%.12g' % value for value in tuple(reference.transform)[:6]),
+        reference.width, reference.height)).encode('utf8'))
+    for window in tiles:
+        digest.update(('%d %d %d %d\n' % window_key(window)).encode('utf8'))
+    return digest.hexdigest()[:16]
+
+
+class NdviTileCache(object):
+    """Directory with one compressed file per scene, grid and window.
+    Hits are counted as ndvi_cache_hits, misses as ndvi_cache_misses.
+    :parameter:
+    directory of the cache,
+    size limit in MB,
+    dtype of the stored tiles (see DTYPES),
+    Recorder for the counters (see instrumentation)"""
+
+    def __init__(self, directory, max_mb=DEFAULT_MAX_MB, dtype='float32',
+                 recorder=NULL_RECORDER):
+        if dtype not in DTYPES:
+            raise ValueError('dtype of the ndvi cache needs to be one of %s'
+                             % ', '.join(DTYPES))
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1e6)
+        self.dtype = dtype
+        self.recorder = recorder
+        self._lock = threading.Lock()
+        # path: size, least recently used first
+        self._entries = OrderedDict()
+        self.size = 0
+        self._scan()
+
+    def _scan(self):
+        """Reads the tiles of earlier runs, ordered by their last use"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        found = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(SUFFIX):
+                    stat = os.stat(os.path.join(root, name))
+                    found.append((stat.st_mtime, os.path.join(root, name), stat.st_size))
+        for mtime, path, size in sorted(found):
+            self._entries[path] = size
+            self.size += size
+
+    def path(self, scene, grid, window):
+        return os.path.join(self.directory, scene, grid,
+                            '%d_%d_%d_%d%s' % (window_key(window) + (SUFFIX,)))
+
+    def get(self, scene, grid, window):
+        """Returns the ndvi of a tile as float32 array, None if it isn't cached"""
+        path = self.path(scene, grid, window)
+        with self._lock:
+            cached = path in self._entries
+            if cached:
+                self._entries.move_to_end(path)
+        if cached:
+            try:
+                with np.load(path) as data:
+                    ndvi = data['ndvi']
+                # the last use decides which tiles are removed first
+                os.utime(path, None)
+            except (IOError, OSError, KeyError, ValueError):
+                # removed by another run or incomplete
+                self._forget(path)
+                cached = False
+        if not cached:
+            self.recorder.count('ndvi_cache_misses')
+            return None
+        self.recorder.count('ndvi_cache_hits')
+        if ndvi.dtype == np.int16:
+            return ndvi.astype(np.float32) / np.float32(INT16_SCALE)
+        return ndvi
+
+    def put(self, scene, grid, window, ndvi):
+        """Stores the ndvi of a tile and removes the least
+        recently used tiles above the size limit"""
+        if self.dtype == 'int16':
+            ndvi = np.round(ndvi * INT16_SCALE).astype(np.int16)
+        else:
+            ndvi = ndvi.astype(np.float32)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, ndvi=ndvi)
+        path = self.path(scene, grid, window)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a tile is complete or missing, even if the run is aborted
+        temp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(temp, 'wb') as dst:
+            dst.write(buffer.getvalue())
+        os.replace(temp, path)
+
+        with self._lock:
+            self.size += buffer.tell() - self._entries.pop(path, 0)
+            self._entries[path] = buffer.tell()
+            evicted = []
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                oldest, size = self._entries.popitem(last=False)
+                self.size -= size
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+        if evicted:
+            self.recorder.count('ndvi_cache_evictions', len(evicted))
+
+    def _forget(self, path):
+        with self._lock:
+            self.size -= self._entries.pop(path, 0)
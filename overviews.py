@@ -0,0 +1,202 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Decimated runs of the ndvi-difference. The
+# tiles are read at 1/factor of the resolution
+# with out_shape, so GDAL uses the internal
+# overviews of the images, and are passed
+# through the same kernel and engine as the full
+# resolution run into a grid of the decimated size,
+# e.g. for a quick-look preview before a full run.
+###########################################
+"""
+
+import os
+from math import ceil
+import numpy as np
+import rasterio as rio
+from rasterio import windows
+from rasterio.transform import Affine
+from parallized_resampled import get_urls, read_tile_blocks
+from parallized_resampled import compute_tile_difference, process_windows, DIFFERENCE
+from io_profiles import gdal_env
+from instrumentation import NULL_RECORDER, INPUTS
+
+
+# decimation of the overviews used by default (1/8 of the resolution)
+DEFAULT_FACTOR = 8
+
+# size of the tiles of a decimated run in pixels of the decimated grid
+DECIMATED_TILE_SIZE = 512
+
+
+def decimated_shape(height, width, factor=DEFAULT_FACTOR):
+    """(height, width) of a grid of height x width pixels decimated by factor"""
+    if factor < 1:
+        raise ValueError('The decimation factor needs to be at least 1')
+    return int(ceil(height / float(factor))), int(ceil(width / float(factor)))
+
+
+def decimated_window(window, shape, out_shape):
+    """Window of the decimated grid covering a window of the full grid.
+    The borders are rounded, so the windows of adjacent tiles neither
+    overlap nor leave gaps.
+    :parameter:
+    window of the full grid,
+    (height, width) of the full and of the decimated grid
+    :returns:
+    rasterio window, empty for tiles smaller than a decimated pixel"""
+    scale_y, scale_x = out_shape[0] / float(shape[0]), out_shape[1] / float(shape[1])
+    row_start = int(round(window.row_off * scale_y))
+    row_stop = int(round((window.row_off + window.height) * scale_y))
+    col_start = int(round(window.col_off * scale_x))
+    col_stop = int(round((window.col_off + window.width) * scale_x))
+    return windows.Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+
+def decimated_tiles(shape, out_shape, tile_size=DECIMATED_TILE_SIZE):
+    """Windows of the full grid for a decimated run. The tiles are laid out
+    on the decimated grid, so a run opens the bands once per tile_size x
+    tile_size decimated pixels instead of once per tile of the full grid.
+    The borders are the ones of decimated_window, so each window maps
+    back to its tile of the decimated grid.
+    :parameter:
+    (height, width) of the full and of the decimated grid,
+    tile size in pixels of the decimated grid
+    :returns:
+    list of rasterio windows of the full grid"""
+    scale_y, scale_x = shape[0] / float(out_shape[0]), shape[1] / float(out_shape[1])
+    tiles = []
+    for row in range(0, out_shape[0], tile_size):
+        row_start = int(round(row * scale_y))
+        row_stop = int(round(min(row + tile_size, out_shape[0]) * scale_y))
+        for col in range(0, out_shape[1], tile_size):
+            col_start = int(round(col * scale_x))
+            col_stop = int(round(min(col + tile_size, out_shape[1]) * scale_x))
+            tiles.append(windows.Window(col_start, row_start, col_stop - col_start,
+                                        row_stop - row_start))
+    return tiles
+
+
+def decimated_profile(profile, factor=DEFAULT_FACTOR):
+    """Profile of the outfile of a decimated run: the bounds of the
+    full grid with 1/factor of the pixels"""
+    height, width = decimated_shape(profile['height'], profile['width'], factor)
+    out_profile = profile.copy()
+    out_profile.update({'dtype': 'float32', 'height': height, 'width': width,
+                        'transform': profile['transform'] *
+                        Affine.scale(profile['width'] / float(width),
+                                     profile['height'] / float(height))})
+    # the internal blocks of the images are too large for the small grid
+    for key in ('tiled', 'blockxsize', 'blockysize'):
+        out_profile.pop(key, None)
+    return out_profile
+
+
+def preview_path(outfile):
+    """Returns the path of the preview of an outfile"""
+    base, extension = os.path.splitext(outfile)
+    return '%s_preview%s' % (base, extension or '.tif')
+
+
+class ArrayWriter(object):
+    """Destination keeping the result of a run in memory
+    :parameter:
+    number of bands, height and width of the grid"""
+
+    def __init__(self, count, height, width):
+        self.array = np.full((count, height, width), np.nan, dtype=rio.float32)
+
+    def write(self, result, window):
+        rows, cols = window.toslices()
+        self.array[:, rows, cols] = result
+
+
+class DecimatedWriter(object):
+    """Destination writing the tiles of the full grid to their
+    windows of the decimated grid (see decimated_window)"""
+
+    def __init__(self, dst, shape, out_shape):
+        self.dst = dst
+        self.shape = shape
+        self.out_shape = out_shape
+
+    def write(self, result, window):
+        self.dst.write(result, window=decimated_window(window, self.shape, self.out_shape))
+
+
+def decimated_tiled_calc(urls_timestep1, urls_timestep2, dst, tiles, shape, out_shape,
+                         recorder=NULL_RECORDER, opener=None, products=DIFFERENCE,
+                         engine_recorder=None, **options):
+    """Calculates the ndvi-difference of every tile at the resolution of
+    the decimated grid and writes it to the open destination dataset.
+    The reads are the ones of process_tiles with out_shape, the kernel is
+    compute_tile_difference.
+    :parameter:
+    List for each Date containing the urls of the red and nir band,
+    open destination dataset of the decimated grid,
+    list of windows of the full grid used for the tiling process,
+    (height, width) of the full and of the decimated grid,
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    bands of the result (see PRODUCTS),
+    Recorder of the tile counters, kernel and write spans, by default recorder,
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if options.get('engine') == 'async':
+        # the async engine fetches the blocks of the full resolution
+        raise ValueError('Decimated runs can be calculated with the pool and the staged engine')
+    # tiles smaller than a pixel of the decimated grid are part of their neighbours
+    tiles = [window for window in tiles
+             if min(decimated_window(window, shape, out_shape).flatten()[2:]) > 0]
+
+    def read(window_idx, window):
+        out_window = decimated_window(window, shape, out_shape)
+        return read_tile_blocks(urls_timestep1, urls_timestep2, window, tiles,
+                                window_idx=window_idx, recorder=recorder, opener=opener,
+                                out_shape=(int(out_window.height), int(out_window.width)))
+
+    def compute(blocks):
+        return compute_tile_difference(blocks, products)
+
+    # same order of the bands as returned by read_tile_blocks
+    urls = [urls_timestep1[0], urls_timestep1[1], urls_timestep2[0], urls_timestep2[1]]
+
+    return process_windows(tiles, urls, read, compute, DecimatedWriter(dst, shape, out_shape),
+                           recorder=recorder if engine_recorder is None else engine_recorder,
+                           inputs=INPUTS, **options)
+
+
+def preview_calc(statsac_item_ts1, statsac_item_ts2, outfile, factor=DEFAULT_FACTOR,
+                 max_workers=1, recorder=NULL_RECORDER, opener=None, **options):
+    """Quick-look of the ndvi-difference: the scenes are read from the overviews
+    at 1/factor of the resolution in tiles of the decimated grid (see
+    decimated_tiles) and calculated with the kernel and engine of the full
+    run. The preview has the bounds and crs of the full outfile and
+    1/factor of its pixels.
+    :parameter:
+    Statsac-Item Object of date x,
+    Statsac-Item object of date y,
+    Name of the preview (see preview_path),
+    decimation (8 for 1/8 of the resolution),
+    Number of Processors,
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    urls_timestep1 = get_urls(statsac_item_ts1)
+    urls_timestep2 = get_urls(statsac_item_ts2)
+
+    with gdal_env(options.get('gdal_options')), rio.open(urls_timestep1[0]) as src_red:
+        out_profile = decimated_profile(src_red.profile, factor)
+        shape = (src_red.height, src_red.width)
+        out_shape = (out_profile['height'], out_profile['width'])
+        tiles = decimated_tiles(shape, out_shape)
+        # the preview takes seconds, it is written without a journal
+        with rio.open(outfile, 'w', **out_profile) as dst:
+            return decimated_tiled_calc(urls_timestep1, urls_timestep2, dst, tiles,
+                                        shape, out_shape, recorder=recorder, opener=opener,
+                                        max_workers=max_workers, **options)
@@ -12,31 +12,40 @@
 
 import sys
 from itertools import product
-import concurrent.futures
 import numpy as np
 import rasterio as rio
 from rasterio import windows
 from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
 from satsearch import Search
 from rasterio import warp
+from staged_pipeline import run_staged
+from async_engine import run_async
+from io_profiles import gdal_env, with_gdal_env
+from tile_order import order_tasks
+from tile_journal import TileWriter, window_key
+from fault_tolerance import run_pool, tolerant, skip_failed, FAILED
+from instrumentation import NULL_RECORDER, INPUTS, scene_inputs
+from ndvi_cache import scene_id, grid_id
+from progress import NULL_PROGRESS
 
 
 
 # search sources
-def search_image(date, bounding_box, prop):
-    """Searches Satellite-Image for given Boundingbox, Date and Properties
+def search_images(date, bounding_box, prop, count=1):
+    """Searches Satellite-Images for given Boundingbox, Date and Properties
     :parameter:
     single Date,
     Bounding Box as List
-    Properties as String
+    Properties as String,
+    maximum number of images
     :return:
-    statsac.Item Object with the lowest
-    cloud-coverage for the given Date and bounding box"""
-
-    image = []
+    List of statsac.Item Objects with the lowest
+    cloud-coverage for the given Date and bounding box,
+    sorted by the cloud-coverage"""
 
-    # search image for given date or period of time,
-    # always takes the first image
+    # search images for given date or period of time,
+    # sorted by the cloud-coverage
     search = Search(bbox=bounding_box,
                     datetime=date,
                     property=[prop],
@@ -47,21 +56,25 @@ def search_image(date, bounding_box, prop):
 
     # filter for Landsatimages since Sentinel doesn't work and the
     # collection option for sat-search seems to be broken
-    workaround = [str(item) for item in items]
-    counter = 0
-
-    for raster in workaround:
-        if 'S2' in raster:
-            counter += 1
-        else:
-            image.append(items[counter])
-            break
+    images = [item for item in items if 'S2' not in str(item)][:count]
 
     # check if image was found
-    assert len(image) == 1, 'No Images for given Parameters found. ' \
-                            'Please try new ones'
+    assert len(images) >= 1, 'No Images for given Parameters found. ' \
+                             'Please try new ones'
+
+    return images
+
 
-    return items[counter]
+def search_image(date, bounding_box, prop):
+    """Searches Satellite-Image for given Boundingbox, Date and Properties
+    :parameter:
+    single Date,
+    Bounding Box as List
+    Properties as String
+    :return:
+    statsac.Item Object with the lowest
+    cloud-coverage for the given Date and bounding box"""
+    return search_images(date, bounding_box, prop, count=1)[0]
 
 
 def get_urls(statsac_item):
@@ -137,79 +150,334 @@ def calculate_difference(ndvi_tile1, ndvi_tile2):
     return ndvi_difference
 
 
-def tiled_cacl_chunky(urls_timestep1, urls_timestep2, window, window_lst, window_idx=0):
-    """Calculates the difference of the NDVI
-    between to image tiles. In case the two images have a different shape,
-    the red and nir band from urls_timestep2 are resampled to the size of
-    the red and nir band from urls_timestep1
+def window_bytes(src, window):
+    """Compressed size of the blocks of the first band intersecting the
+    window, i.e. the bytes GDAL fetches from disk or http for the read
+    (blocks served from the GDAL block cache are counted as well)
+    :parameter:
+    open dataset,
+    window in the pixel grid of the dataset
+    :returns:
+    number of bytes, 0 if the size of the blocks is unknown"""
+    try:
+        window = window.intersection(windows.Window(0, 0, src.width, src.height))
+    except windows.WindowError:
+        return 0
+    block_height, block_width = src.block_shapes[0]
+    rows = range(int(window.row_off) // block_height,
+                 -(-int(window.row_off + window.height) // block_height))
+    cols = range(int(window.col_off) // block_width,
+                 -(-int(window.col_off + window.width) // block_width))
+    try:
+        return sum(src.block_size(1, row, col) for row, col in product(rows, cols))
+    except rio.errors.RasterBlockError:
+        return 0
+
+
+def count_bytes_read(recorder, src, window, name, out_shape=None):
+    """Adds the bytes read for a window to the counter of the input name.
+    A read decimated to out_shape uses the overviews of the image if it
+    has some, their bytes are estimated from the decimation."""
+    if recorder.enabled:
+        size = window_bytes(src, window)
+        if out_shape is not None and src.overviews(1):
+            size = size * out_shape[-2] * out_shape[-1] // max(1, int(window.height * window.width))
+        recorder.count('bytes_read', size, name)
+
+
+def open_timed(url, recorder=NULL_RECORDER, window_idx=None, opener=None):
+    """Opens a dataset and records the time as 'open'-span.
+    opener replaces rio.open, e.g. to reuse open datasets (see batch)"""
+    with recorder.span('open', window_idx):
+        return (opener or rio.open)(url)
+
+
+def read_reference_blocks(urls, window, window_idx=0, recorder=NULL_RECORDER,
+                          opener=None, inputs=('red_ts1', 'nir_ts1'), out_shape=None):
+    """Reads the red and nir band of the scene whose grid is used for the outfile.
+    :parameter:
+    List with the urls of the red and nir band,
+    the window for the current tile,
+    the index of the current window,
+    a Recorder for the timing of the stages (see instrumentation),
+    a function replacing rio.open (see open_timed),
+    the names of the bands for the bytes_read counter
+    and the (height, width) of a decimated read, None for the full resolution
+    :returns:
+    Tuple of arrays: red, nir"""
+    blocks = []
+    for url, name in zip(urls, inputs):
+        with open_timed(url, recorder, window_idx, opener) as src, \
+                recorder.span('read_ts1', window_idx):
+            if out_shape is None:
+                blocks.append(src.read(window=window))
+            else:
+                # GDAL reads the overviews of the image if it has some
+                blocks.append(src.read(window=window, out_shape=out_shape,
+                                       resampling=Resampling.bilinear))
+            count_bytes_read(recorder, src, window, name, out_shape)
+    return tuple(blocks)
+
+
+def window_inside(window, big_window):
+    """True if the window lies completely inside big_window"""
+    return (window.col_off >= big_window.col_off and window.row_off >= big_window.row_off and
+            window.col_off + window.width <= big_window.col_off + big_window.width and
+            window.row_off + window.height <= big_window.row_off + big_window.height)
+
+
+def read_resampled_blocks(urls, window, window_lst, window_idx=0, recorder=NULL_RECORDER,
+                          opener=None, inputs=('red_ts2', 'nir_ts2'), out_shape=None):
+    """Reads the red and nir band of a further scene, resampled to the
+    size of the window of the reference scene.
+    :parameter:
+    List with the urls of the red and nir band,
+    the window for the current tile,
+    a list of all the windows used for the tiling process,
+    the index of the current window,
+    a Recorder for the timing of the stages (see instrumentation),
+    a function replacing rio.open (see open_timed),
+    the names of the bands for the bytes_read counter
+    and the (height, width) of a decimated read, None for the size of the window
+    :returns:
+    Tuple of arrays: red, nir"""
+    shape = out_shape or (window.height, window.width)
+    blocks = []
+    for url, name in zip(urls, inputs):
+        with open_timed(url, recorder, window_idx, opener) as src, \
+                recorder.span('read_ts2', window_idx):
+            nols, nrows = src.meta['width'], src.meta['height']
+            big_window = rio.windows.Window(col_off=0, row_off=0,
+                                            width=nols, height=nrows)
+            read_window = window
+            if not window_inside(window, big_window):
+                # special boundary-case, the window reaches beyond timestep2:
+                # Take the window before, intersect with datasource
+                # boundaries(big_window), Create new Window with the intersection,
+                # read the new window and resample it to the size of the original window.
+                # Read errors are left to the RetryPolicy
+                read_window = window_lst[window_idx-1].intersection(big_window)
+            blocks.append(src.read(window=read_window,
+                                   out_shape=shape,
+                                   resampling=Resampling.bilinear))
+            count_bytes_read(recorder, src, read_window, name, out_shape)
+    return tuple(blocks)
+
+
+def read_warped_blocks(urls, layout, window, window_idx=0, stage='read_ts1',
+                       recorder=NULL_RECORDER, opener=None, inputs=('red_ts1', 'nir_ts1')):
+    """Reads the red and nir band of a scene for a window of another
+    grid, the scene is reprojected and resampled to the grid.
+    :parameter:
+    List with the urls of the red and nir band,
+    grid with crs, transform, width and height (MosaicLayout, SceneGrid),
+    the window for the current tile,
+    the index of the current window,
+    name of the stage of the reads,
+    a Recorder for the timing of the stages (see instrumentation),
+    a function replacing rio.open (see open_timed)
+    and the names of the bands for the bytes_read counter
+    :returns:
+    Tuple of arrays: red, nir"""
+    blocks = []
+    for url, name in zip(urls, inputs):
+        with open_timed(url, recorder, window_idx, opener) as src, \
+                recorder.span(stage, window_idx):
+            with WarpedVRT(src, crs=layout.crs, transform=layout.transform,
+                           width=layout.width, height=layout.height,
+                           resampling=Resampling.bilinear) as vrt:
+                blocks.append(vrt.read(window=window))
+            if recorder.enabled:
+                bounds = warp.transform_bounds(layout.crs, src.crs,
+                                               *windows.bounds(window, layout.transform))
+                count_bytes_read(recorder, src, src.window(*bounds), name)
+    return tuple(blocks)
+
+
+class SceneGrid(object):
+    """Grid of a scene the other scenes are reprojected to (see read_warped_blocks)
+    :parameter:
+    open rasterio dataset of the scene"""
+
+    def __init__(self, src):
+        self.crs = src.crs
+        self.transform = src.transform
+        self.width = src.width
+        self.height = src.height
+
+
+def read_tile_blocks(urls_timestep1, urls_timestep2, window, window_lst, window_idx=0,
+                     recorder=NULL_RECORDER, opener=None, out_shape=None):
+    """Reads the red and nir band of both timesteps for one tile.
+    The bands from urls_timestep2 are resampled to the size of the
+    window of urls_timestep1. This is the I/O-Part of tiled_cacl_chunky.
     :parameter:
     List for each Date containing the urls of the red and nir band,
     the window for the current tile,
-    a list of all the windows used for the tiling process
-    and the index of the current window
+    a list of all the windows used for the tiling process,
+    the index of the current window,
+    a Recorder for the timing of the stages (see instrumentation),
+    a function replacing rio.open (see open_timed)
+    and the (height, width) of a decimated read (see overviews)
     :returns:
-    Numpy-Array containing the difference of the two tiles"""
+    Tuple of arrays: red ts1, nir ts1, red ts2, nir ts2"""
 
-    # open red band and read window of timestep1
-    with rio.open(urls_timestep1[0]) as src_red_ts1:
-        red_block_ts1 = src_red_ts1.read(window=window)
+    # open red and nir band and read window of timestep1
+    red_block_ts1, nir_block_ts1 = read_reference_blocks(
+        urls_timestep1, window, window_idx, recorder, opener, INPUTS[:2], out_shape)
 
-    # open nir band and read window of timestep1
-    with rio.open(urls_timestep1[1]) as src_nir_ts1:
-        nir_block_ts1 = src_nir_ts1.read(window=window)
+    # open red and nir band and resample window of timestep2
+    red_block_ts2_re, nir_block_ts2_re = read_resampled_blocks(
+        urls_timestep2, window, window_lst, window_idx, recorder, opener, INPUTS[2:],
+        out_shape)
 
-    # calculate ndvi for timestep1
-    ndvi_ts_1 = calculate_ndvi(red_block_ts1, nir_block_ts1)
-    # open red band and resample window of timestep2
+    return red_block_ts1, nir_block_ts1, red_block_ts2_re, nir_block_ts2_re
 
-    try:
-        with rio.open(urls_timestep2[0]) as src_red_ts2_re:
-            red_block_ts2_re = src_red_ts2_re.read(window=window,
-                                                   out_shape=(
-                                                       window.height,
-                                                       window.width)
-                                                   ,
-                                                   resampling=Resampling.bilinear
-                                                   )
-
-        # open red band and resample window of timestep2
-        with rio.open(urls_timestep2[1]) as src_nir_ts2_re:
-            nir_block_ts2_re = src_nir_ts2_re.read(window=window,
-                                                   out_shape=(
-                                                       window.height,
-                                                       window.width)
-                                                   ,
-                                                   resampling=Resampling.bilinear
-                                                   )
-
-    except rio.RasterioIOError:
-        # Exception for special boundary-cases
-        # Take window before error occurred, intersect with datasource boundaries(big_window),
-        # Create new Window with the intersection, read the new window and resample it
-        # to the size of the original window
-
-        with rio.open(urls_timestep2[0]) as src_red_ts2_re:
-            nols, nrows = src_red_ts2_re.meta['width'], src_red_ts2_re.meta['height']
-            big_window = rio.windows.Window(col_off=0, row_off=0, width=nols, height=nrows)
-            window_new = window_lst[window_idx-1].intersection(big_window)
-
-            red_block_ts2_re = src_red_ts2_re.read(window=window_new,
-                                                   out_shape=(
-                                                       window.height,
-                                                       window.width)
-                                                   ,
-                                                   resampling=Resampling.bilinear
-                                                   )
-
-        with rio.open(urls_timestep2[1]) as src_nir_ts2_re:
-            nir_block_ts2_re = src_nir_ts2_re.read(window=window_new,
-                                                   out_shape=(
-                                                       window.height,
-                                                       window.width)
-                                                   ,
-                                                   resampling=Resampling.bilinear
-                                                   )
 
+def read_scene(urls_scenes, number, window, window_lst, window_idx=0,
+               recorder=NULL_RECORDER, opener=None, reference=None):
+    """Reads the red and nir band of one scene of a list of scenes. The first
+    scene is read as it is, the others are resampled to its window, with
+    a reference grid they are reprojected to it instead.
+    :parameter:
+    List for each scene containing the urls of the red and nir band,
+    index of the scene,
+    the window for the current tile,
+    a list of all the windows used for the tiling process,
+    the index of the current window,
+    a Recorder for the timing of the stages (see instrumentation),
+    a function replacing rio.open (see open_timed)
+    and the SceneGrid of the first scene for scenes of other grids
+    :returns:
+    Tuple of arrays: red, nir"""
+    names = scene_inputs(len(urls_scenes))[2 * number:2 * number + 2]
+    if number == 0:
+        return read_reference_blocks(urls_scenes[0], window, window_idx,
+                                     recorder, opener, names)
+    if reference is not None:
+        return read_warped_blocks(urls_scenes[number], reference, window, window_idx,
+                                  'read_ts2', recorder, opener, names)
+    return read_resampled_blocks(urls_scenes[number], window, window_lst, window_idx,
+                                 recorder, opener, names)
+
+
+def read_scene_ndvi(urls_scenes, number, window, window_lst, window_idx=0,
+                    recorder=NULL_RECORDER, opener=None, cache=None, grid=None,
+                    reference=None):
+    """Reads one scene of a list of scenes (see read_scene) and calculates
+    its ndvi, with an NdviTileCache the cached ndvi is used if possible.
+    :parameter:
+    parameters of read_scene,
+    NdviTileCache (see ndvi_cache), the grid_id of the tiles
+    and the SceneGrid the scenes are reprojected to (see read_scene)
+    :returns:
+    Numpy-Array with ndvi values"""
+    scene = scene_id(urls_scenes[number]) if cache is not None else None
+    if cache is not None:
+        ndvi = cache.get(scene, grid, window)
+        if ndvi is not None:
+            return ndvi
+    blocks = read_scene(urls_scenes, number, window, window_lst, window_idx,
+                        recorder, opener, reference)
+    with recorder.span('kernel', window_idx):
+        ndvi = calculate_ndvi(*blocks)
+    if cache is not None:
+        cache.put(scene, grid, window, ndvi)
+    return ndvi
+
+
+def cached_scene_reads(urls_scenes, tiles, cache, recorder=NULL_RECORDER, opener=None):
+    """Reads the scenes of a tile with an NdviTileCache (see ndvi_cache).
+    A scene whose ndvi of the tile is cached isn't read, the ndvi of the
+    other scenes is calculated and added to the cache.
+    :parameter:
+    List for each scene containing the urls of the red and nir band,
+    the first scene is the reference the others are resampled to,
+    list of all the windows used for the tiling process,
+    NdviTileCache,
+    a Recorder for the timing of the stages (see instrumentation)
+    and a function replacing rio.open (see open_timed)
+    :returns:
+    read(window_idx, window) returning the cached ndvi or the bands of every scene,
+    ndvis(data) returning the ndvi of every scene for the result of read"""
+    scenes = [scene_id(urls) for urls in urls_scenes]
+    with rio.open(urls_scenes[0][0]) as reference:
+        grid = grid_id(reference, tiles)
+
+    def read(window_idx, window):
+        data = []
+        for number in range(len(urls_scenes)):
+            ndvi = cache.get(scenes[number], grid, window)
+            if ndvi is None:
+                ndvi = read_scene(urls_scenes, number, window, tiles, window_idx,
+                                  recorder, opener)
+            data.append(ndvi)
+        return window, data
+
+    def ndvis(read_data):
+        window, data = read_data
+        result = []
+        for scene, entry in zip(scenes, data):
+            # the bands of a scene which wasn't cached
+            if isinstance(entry, tuple):
+                entry = calculate_ndvi(*entry)
+                cache.put(scene, grid, window, entry)
+            result.append(entry)
+        return result
+
+    return read, ndvis
+
+
+# bands an outfile can carry, all calculated from the ndvi of the same tile:
+# the ndvi of both timesteps, their difference and a mask of the pixels
+# with data in both timesteps (1.0, otherwise 0.0)
+PRODUCTS = ('ndvi_t1', 'ndvi_t2', 'difference', 'valid')
+DIFFERENCE = ('difference',)
+
+
+def check_products(products):
+    """Raises a ValueError for an unknown or empty list of products"""
+    unknown = [name for name in products if name not in PRODUCTS]
+    if unknown or not products:
+        raise ValueError('products need to be a list of %s' % ', '.join(PRODUCTS))
+
+
+def tile_products(ndvi_ts_1, ndvi_ts_2, products=DIFFERENCE):
+    """Bands of a tile from the ndvi of both timesteps (see PRODUCTS)
+    :parameter:
+    Arrays containing the ndvi values,
+    names of the bands
+    :returns:
+    Numpy-Array with one band per product"""
+    bands = []
+    for name in products:
+        if name == 'ndvi_t1':
+            bands.append(ndvi_ts_1.astype(rio.float32))
+        elif name == 'ndvi_t2':
+            bands.append(ndvi_ts_2.astype(rio.float32))
+        elif name == 'difference':
+            bands.append(calculate_difference(ndvi_ts_1, ndvi_ts_2))
+        else:
+            bands.append(np.logical_and(ndvi_ts_1 != -2, ndvi_ts_2 != -2).astype(rio.float32))
+    if len(bands) == 1:
+        return bands[0]
+    return np.concatenate(bands)
+
+
+def compute_tile_difference(blocks, products=DIFFERENCE):
+    """Calculates the ndvi-difference for the blocks of one tile.
+    This is the Compute-Part of tiled_cacl_chunky.
+    :parameter:
+    Tuple of arrays as returned by read_tile_blocks,
+    bands of the result, the ndvi of both timesteps and the mask
+    cost no further calculation (see PRODUCTS)
+    :returns:
+    Numpy-Array containing the difference of the two tiles
+    (and the further products as bands)"""
+    red_block_ts1, nir_block_ts1, red_block_ts2_re, nir_block_ts2_re = blocks
+
+    # calculate ndvi for timestep1
+    ndvi_ts_1 = calculate_ndvi(red_block_ts1, nir_block_ts1)
 
     # clalculate ndvi for timestep2
     ndvi_ts_2 = calculate_ndvi(red_block_ts2_re, nir_block_ts2_re)
@@ -218,13 +486,229 @@ def tiled_cacl_chunky(urls_timestep1, urls_timestep2, window, window_lst, window
     assert ndvi_ts_1.shape == ndvi_ts_2.shape, 'The NDVI Shapes do not match'
 
     # calculate difference between timestep1 and 2
-    result_block = calculate_difference(ndvi_ts_1, ndvi_ts_2)
+    result_block = tile_products(ndvi_ts_1, ndvi_ts_2, products)
 
     return result_block
 
 
+def tiled_cacl_chunky(urls_timestep1, urls_timestep2, window, window_lst, window_idx=0,
+                      recorder=NULL_RECORDER, products=DIFFERENCE):
+    """Calculates the difference of the NDVI
+    between to image tiles. In case the two images have a different shape,
+    the red and nir band from urls_timestep2 are resampled to the size of
+    the red and nir band from urls_timestep1
+    :parameter:
+    List for each Date containing the urls of the red and nir band,
+    the window for the current tile,
+    a list of all the windows used for the tiling process,
+    the index of the current window,
+    a Recorder for the timing of the stages (see instrumentation)
+    and the bands of the result (see PRODUCTS)
+    :returns:
+    Numpy-Array containing the difference of the two tiles
+    (and the further products as bands)"""
+
+    blocks = read_tile_blocks(urls_timestep1, urls_timestep2,
+                              window, window_lst, window_idx=window_idx,
+                              recorder=recorder)
+
+    with recorder.span('kernel', window_idx):
+        return compute_tile_difference(blocks, products)
+
+
+def run_tasks(tasks, urls, read, compute, write, max_workers=1, engine='pool',
+              stages=None, gdal_options=None, retry=None, recorder=NULL_RECORDER,
+              executor=None, inputs=None):
+    """Runs read, compute and write for every task with the chosen engine.
+    :parameter:
+    List of (window_idx, window),
+    List of the urls read for every task (used by the async engine,
+    in the order read returns the bands),
+    read(task) returning the bands of a task,
+    compute(task, bands) returning the result of a task,
+    write(task, result) writing the result (always called from one thread),
+    Number of Processors (used by the pool-engine),
+    engine: 'pool', 'staged' or 'async' (see process_tiles),
+    stages: dict with io_workers, compute_workers, queue_size and connections,
+    dict with GDAL config options for the workers (see io_profiles),
+    RetryPolicy for retries and stragglers (see fault_tolerance), stragglers
+    are started again by the pool engine only,
+    Recorder for the timing of the stages (see instrumentation),
+    executor of the pool-engine shared with other runs (see batch),
+    names of the urls for the bytes_read counter of the async engine
+    (default INPUTS, see instrumentation)
+    :returns:
+    list with the windows which failed for good"""
+
+    if engine != 'pool' and retry is not None and retry.straggler_factor:
+        # only the pool engine starts stragglers a second time
+        raise ValueError('Stragglers are only started again by the pool engine, '
+                         'set straggler_factor to None for the %s engine' % engine)
+    stages = stages or {}
+    read = with_gdal_env(read, gdal_options)
+    failures = []
+
+    if engine == 'staged':
+        # a window failing for good is skipped by the following stages
+        if retry is not None:
+            read = tolerant(read, retry, failures)
+
+        # the compute-stage needs the task for the timing
+        def read_staged(task):
+            blocks = read(task)
+            return FAILED if blocks is FAILED else (task, blocks)
+
+        run_staged(tasks,
+                   read_staged,
+                   skip_failed(lambda data: compute(*data)),
+                   skip_failed(write),
+                   io_workers=stages.get('io_workers'),
+                   compute_workers=stages.get('compute_workers'),
+                   queue_size=stages.get('queue_size'))
+        return failures
+
+    if engine == 'async':
+        run_async(tasks,
+                  urls,
+                  read,
+                  compute,
+                  write,
+                  max_requests=stages.get('io_workers'),
+                  connections=stages.get('connections'),
+                  decode_workers=stages.get('compute_workers'),
+                  tiles_in_flight=stages.get('queue_size'),
+                  gdal_options=gdal_options,
+                  retry=retry,
+                  failures=failures,
+                  recorder=recorder,
+                  inputs=inputs)
+        return failures
+
+    if engine != 'pool':
+        raise ValueError('Unknown engine %s' % engine)
+
+    def calculate(task):
+        return compute(task, read(task))
+
+    # start with concurrent processing
+    return run_pool(tasks,
+                    calculate,
+                    write,
+                    max_workers=max_workers,
+                    policy=retry,
+                    executor=executor)
+
+
+def process_windows(tiles, urls, read_window, compute_window, dst,
+                    max_workers=1, engine='pool', stages=None, gdal_options=None,
+                    tile_order='native', completed=None, retry=None,
+                    recorder=NULL_RECORDER, progress=NULL_PROGRESS,
+                    executor=None, inputs=None):
+    """Reads, calculates and writes every tile with the chosen engine,
+    the part process_tiles shares with the other modes (see time_series).
+    :parameter:
+    list of windows used for the tiling process,
+    List of the urls read for every tile, in the order read_window returns the bands,
+    read_window(window_idx, window) returning the bands of a tile,
+    compute_window(bands) returning the result of a tile,
+    open destination dataset,
+    further parameters of process_tiles,
+    names of the urls for the bytes_read counter of the async engine
+    :returns:
+    list with the windows which failed for good"""
+
+    # the index of a window in tiles stays the same in every order,
+    # read_tile_blocks relies on it for the boundary-cases
+    tasks = order_tasks(enumerate(tiles), tile_order)
+    if completed:
+        tasks = [task for task in tasks if window_key(task[1]) not in completed]
+    recorder.count('tiles_total', len(tiles))
+    recorder.count('tiles_skipped', len(tiles) - len(tasks))
+
+    def read(task):
+        return read_window(*task)
+
+    def compute(task, blocks):
+        with recorder.span('kernel', task[0]):
+            return compute_window(blocks)
+
+    def write(task, result):
+        with recorder.span('write', task[0]):
+            dst.write(result, window=task[1])
+        recorder.count('tiles_processed')
+        progress.update()
+
+    with progress.run(len(tasks), skipped=len(tiles) - len(tasks)):
+        return run_tasks(tasks, urls, read, compute, write,
+                         max_workers=max_workers, engine=engine, stages=stages,
+                         gdal_options=gdal_options, retry=retry, recorder=recorder,
+                         executor=executor, inputs=inputs)
+
+
+def process_tiles(urls_timestep1, urls_timestep2, dst, tiles,
+                  max_workers=1, engine='pool', stages=None, gdal_options=None,
+                  tile_order='native', completed=None, retry=None,
+                  recorder=NULL_RECORDER, progress=NULL_PROGRESS,
+                  executor=None, opener=None, cache=None, products=DIFFERENCE):
+    """Calculates the ndvi-difference for every tile and writes
+    it to the open destination dataset.
+    :parameter:
+    List for each Date containing the urls of the red and nir band,
+    open destination dataset,
+    list of windows used for the tiling process,
+    Number of Processors (used by the pool-engine),
+    engine: 'pool' (one task per tile), 'staged'
+    (separate I/O-, Compute- and Writer-Stages) or 'async'
+    (concurrent range requests for remote images),
+    stages: dict with io_workers, compute_workers and queue_size
+    for the staged and async engine, connections for the async engine,
+    dict with GDAL config options for the workers (see io_profiles),
+    order in which the tiles are scheduled (see tile_order),
+    set of window keys which are already in the outfile (see tile_journal),
+    RetryPolicy for retries and stragglers, without one the first error is raised
+    (see fault_tolerance),
+    Recorder for the timing of the stages (see instrumentation),
+    ProgressReporter counting the written tiles (see progress),
+    executor of the pool-engine shared with other runs (see batch),
+    function replacing rio.open for the reads (see open_timed),
+    NdviTileCache with the ndvi of scenes calculated before (see ndvi_cache),
+    bands of the outfile (see PRODUCTS)
+    :returns:
+    list with the windows which failed for good"""
+    check_products(products)
+
+    if cache is None:
+        def compute(blocks):
+            return compute_tile_difference(blocks, products)
+
+        def read(window_idx, window):
+            return read_tile_blocks(urls_timestep1, urls_timestep2,
+                                    window, tiles, window_idx=window_idx,
+                                    recorder=recorder, opener=opener)
+    else:
+        if engine == 'async':
+            # the async engine fetches the bands of every scene itself
+            raise ValueError('The ndvi cache can be used with the pool and the staged engine')
+        read, ndvis = cached_scene_reads([urls_timestep1, urls_timestep2], tiles, cache,
+                                         recorder=recorder, opener=opener)
+
+        def compute(data):
+            return tile_products(*ndvis(data), products=products)
+
+    # same order of the bands as returned by read_tile_blocks
+    urls = [urls_timestep1[0], urls_timestep1[1], urls_timestep2[0], urls_timestep2[1]]
+
+    return process_windows(tiles, urls, read, compute, dst,
+                           max_workers=max_workers, engine=engine, stages=stages,
+                           gdal_options=gdal_options, tile_order=tile_order,
+                           completed=completed, retry=retry, recorder=recorder,
+                           progress=progress, executor=executor)
+
+
 # optimal tiling
-def optimal_tiled_calc(statsac_item_ts1, statsac_item_ts2, outfile, max_workers=1):
+def optimal_tiled_calc(statsac_item_ts1, statsac_item_ts2, outfile, max_workers=1,
+                       resume=False, checkpoint_every=None, products=DIFFERENCE,
+                       **options):
     """Process infiles block-by-block, calculate the NDVI for each block,
     and write the difference to a new file. Uses Optimal block-size and
     concurrent processing. Uses the internal Blocks of statsac_item_ts1
@@ -233,48 +717,40 @@ def optimal_tiled_calc(statsac_item_ts1, statsac_item_ts2, outfile, max_workers=
     Statsac-Item Object of date x,
     Statsac-Item object of date y,
     Name of outfile,
-    Number of Processors"""
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    bands of the outfile (see PRODUCTS), by default the difference only,
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    check_products(products)
 
     # get the urls for the red and nir bands for timestep1 and 2
     urls_timestep1 = get_urls(statsac_item_ts1)
     urls_timestep2 = get_urls(statsac_item_ts2)
 
-    # start with concurrent processing
-    # source: https://gist.github.com/sgillies/b90a79917d7ec5ca0c074b5f6f4857e3.js.
-    # This was adapted for the ndvi processing
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-
-        # Create a destination dataset based on source params. The
-        # destination will be tiled, and tiles will be processed
-        # concurrently.
-        with rio.open(urls_timestep1[0]) as src_red:
-            out_profile = src_red.profile.copy()
-            out_profile.update({'dtype': 'float32'})
-            # open outfile with outprofile
-            with rio.open(outfile, "w", **out_profile) as dst:
-                # create windows for tiling
-                tiles = [window for ij, window in dst.block_windows()]
-                counter = 0
-
-                # chunkify(windows):
-                for chunk in [tiles]:
-
-                    future_to_window = dict()
-
-                    for window in chunk:
-                        future = executor.submit(tiled_cacl_chunky,
-                                                 urls_timestep1,
-                                                 urls_timestep2,
-                                                 window,
-                                                 tiles,
-                                                 window_idx=counter)
-                        future_to_window[future] = window
-                        counter += 1
-
-                    for future in concurrent.futures.as_completed(future_to_window):
-                        window = future_to_window[future]
-                        result = future.result()
-                        dst.write(result, window=window)
+    # Create a destination dataset based on source params. The
+    # destination will be tiled, and tiles will be processed
+    # concurrently.
+    with gdal_env(options.get('gdal_options')), rio.open(urls_timestep1[0]) as src_red:
+        out_profile = src_red.profile.copy()
+        out_profile.update({'dtype': 'float32', 'count': len(products)})
+        # open outfile with outprofile, when resuming the existing
+        # outfile is updated instead
+        with TileWriter(outfile, out_profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+            if not dst.completed and tuple(products) != DIFFERENCE:
+                dst.dataset.descriptions = tuple(products)
+            # create windows for tiling
+            tiles = [window for ij, window in dst.block_windows()]
+
+            failures = process_tiles(urls_timestep1, urls_timestep2, dst, tiles,
+                                     max_workers=max_workers, completed=dst.completed,
+                                     products=products, **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
 
 
 # Customized Tiles Functions
@@ -316,8 +792,18 @@ def get_tiles(dataset, tile_a, tile_b):
         yield window, transform
 
 
+def scene_tiles(src, tile_size_x=0, tile_size_y=0):
+    """Tiles of optimal_tiled_calc (internal blocks, no tile size)
+    or customized_tiled_calc (tile size in m)"""
+    if tile_size_x and tile_size_y > 0:
+        return [window for window, transform in get_tiles(src, tile_size_x, tile_size_y)]
+    return [window for ij, window in src.block_windows(1)]
+
+
 def customized_tiled_calc(statsac_item_ts1, statsac_item_ts2, outfile,
-                          tile_size_x, tile_size_y, max_workers=1):
+                          tile_size_x, tile_size_y, max_workers=1,
+                          resume=False, checkpoint_every=None, products=DIFFERENCE,
+                          **options):
     """Process infiles block-by-block, calculate the NDVI for each block,
         and write the difference to a new file. Uses custom block-size.
         :parameter:
@@ -326,48 +812,41 @@ def customized_tiled_calc(statsac_item_ts1, statsac_item_ts2, outfile,
         Name of outfile,
         tile size x,
         tile size y,
-        Number of Processors"""
+        Number of Processors,
+        resume: continue an aborted run with the windows missing in the journal,
+        number of tiles between two checkpoints of the journal,
+        bands of the outfile (see PRODUCTS), by default the difference only,
+        further options of process_tiles (engine, stages, ...)
+        :returns:
+        list with the windows which failed for good"""
+    check_products(products)
 
     # get the urls for the red and nir bands for timestep1 and 2
     urls_timestep1 = get_urls(statsac_item_ts1)
     urls_timestep2 = get_urls(statsac_item_ts2)
-    # start with concurrent processing
-    # source: https://gist.github.com/sgillies/b90a79917d7ec5ca0c074b5f6f4857e3.js.
-    # This was adapted for the ndvi processing
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Create a destination dataset based on source params. The
-        # destination will be tiled, and tiles will be processed
-        # concurrently.
-        with rio.open(urls_timestep1[0]) as src_red:
-            out_profile = src_red.profile.copy()
-            out_profile.update({'dtype': 'float32'})
-            # open outfile with outprofile
-            with rio.open(outfile, "w", **out_profile) as dst:
-                # create windows for tiling
-                tiles = []
-                for window, transform in get_tiles(src_red, tile_size_x, tile_size_y):
-                    out_profile['transform'] = transform
-                    out_profile['width'], out_profile['height'] = window.width, window.height
-                    tiles.append(window)
-                # chunkify(windows)/ concurrent processing of the tiled_calc_function
-                counter = 0
-
-                for chunk in [tiles]:
-                    future_to_window = dict()
-                    for window in chunk:
-
-                        future = executor.submit(tiled_cacl_chunky,
-                                                 urls_timestep1,
-                                                 urls_timestep2,
-                                                 window,
-                                                 tiles,
-                                                 window_idx=counter)
-
-                        future_to_window[future] = window
-                        counter += 1
-
-                    for future in concurrent.futures.as_completed(future_to_window):
-                        window = future_to_window[future]
-                        result = future.result()
-
-                        dst.write(result, window=window)
+
+    # Create a destination dataset based on source params. The
+    # destination will be tiled, and tiles will be processed
+    # concurrently.
+    with gdal_env(options.get('gdal_options')), rio.open(urls_timestep1[0]) as src_red:
+        out_profile = src_red.profile.copy()
+        out_profile.update({'dtype': 'float32', 'count': len(products)})
+        # open outfile with outprofile, when resuming the existing
+        # outfile is updated instead
+        with TileWriter(outfile, out_profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+            if not dst.completed and tuple(products) != DIFFERENCE:
+                dst.dataset.descriptions = tuple(products)
+            # create windows for tiling
+            tiles = []
+            for window, transform in get_tiles(src_red, tile_size_x, tile_size_y):
+                out_profile['transform'] = transform
+                out_profile['width'], out_profile['height'] = window.width, window.height
+                tiles.append(window)
+
+            failures = process_tiles(urls_timestep1, urls_timestep2, dst, tiles,
+                                     max_workers=max_workers, completed=dst.completed,
+                                     products=products, **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
@@ -0,0 +1,168 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Dry-run planning of a run. Opens only the
+# headers of the bands, builds the same tiles as
+# the tiling functions and estimates the bytes to
+# read, the size of the outfile and the runtime
+# from the last benchmark calibration, without
+# reading any pixel data.
+###########################################
+"""
+
+import os
+import json
+import numpy as np
+import rasterio as rio
+from rasterio import windows
+from parallized_resampled import get_urls, scene_tiles, window_bytes, DIFFERENCE
+from io_profiles import gdal_env
+from tile_journal import TileJournal, journal_path, window_key
+from instrumentation import INPUTS
+
+
+def plan_path(outfile):
+    """Returns the path of the plan for an outfile"""
+    return os.path.splitext(outfile)[0] + '_plan.json'
+
+
+def block_sizes_known(src):
+    """Checks if the header lists the compressed size of the blocks"""
+    try:
+        src.block_size(1, 0, 0)
+        return True
+    except rio.errors.RasterBlockError:
+        return False
+
+
+def make_plan(item_ts1, item_ts2, outfile, tile_size_x=0, tile_size_y=0,
+              resume=False, gdal_options=None, products=DIFFERENCE):
+    """Builds the tiles of a run and estimates its cost from the headers.
+    :parameter:
+    Statsac-Item Object of date x,
+    Statsac-Item object of date y,
+    Name of outfile,
+    tile size x and y in m (0 for the optimal tiling),
+    resume: tiles in the journal of the outfile are skipped,
+    dict with GDAL config options (see io_profiles),
+    bands of the outfile (see PRODUCTS)
+    :returns:
+    dict with the plan"""
+    urls = get_urls(item_ts1) + get_urls(item_ts2)
+    completed = TileJournal(journal_path(outfile)).load() if resume else set()
+
+    with gdal_env(gdal_options):
+        sources = [rio.open(url) for url in urls]
+        try:
+            tiles = scene_tiles(sources[0], tile_size_x, tile_size_y)
+            known = [block_sizes_known(src) for src in sources]
+
+            todo = [window for window in tiles if window_key(window) not in completed]
+            bytes_read = dict((name, 0) for name in INPUTS)
+            empty = 0
+            outside_ts2 = 0
+            for window in todo:
+                sizes = [window_bytes(src, window) if is_known else None
+                         for src, is_known in zip(sources, known)]
+                for name, size in zip(INPUTS, sizes):
+                    if size is not None:
+                        bytes_read[name] += size
+                # sparse blocks of timestep 1 are not stored in the file
+                if known[0] and known[1] and sizes[0] == 0 and sizes[1] == 0:
+                    empty += 1
+                try:
+                    window.intersection(windows.Window(0, 0, sources[2].width,
+                                                       sources[2].height))
+                except windows.WindowError:
+                    outside_ts2 += 1
+
+            src = sources[0]
+            pixels = sum(int(window.width) * int(window.height) for window in todo)
+            tile_pixels = max([int(window.width) * int(window.height) for window in tiles])
+            itemsize = np.dtype(src.dtypes[0]).itemsize
+            return {'urls': dict(zip(INPUTS, urls)),
+                    'width': src.width,
+                    'height': src.height,
+                    'tiles': len(tiles),
+                    'tiles_skipped': len(tiles) - len(todo),
+                    'tiles_empty': empty,
+                    'tiles_outside_ts2': outside_ts2,
+                    'pixels': pixels,
+                    'bytes_read': dict((name, bytes_read[name] if is_known else None)
+                                       for name, is_known in zip(INPUTS, known)),
+                    # red and nir of both timesteps, uncompressed like the benchmark
+                    'input_mb': 4 * pixels * itemsize / 1e6,
+                    'bands': len(products),
+                    # the outfile is float32 with one band per product
+                    'output_bytes': src.width * src.height * 4 * len(products),
+                    # bands, ndvi of both timesteps and products of the largest
+                    # tile, held by every worker
+                    'tile_mb': tile_pixels * (4 * itemsize + 4 * (2 + len(products))) / 1e6,
+                    'output_compress': src.profile.get('compress')}
+        finally:
+            for src in sources:
+                src.close()
+
+
+def load_calibration(path):
+    """Reads the results of benchmark.bench_engines, None if there are none"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as src:
+        return json.load(src)
+
+
+def calibration_case(calibration, function, engine, workers, tile_size=0):
+    """Benchmark case closest to a run: same function and engine if
+    possible, then the nearest worker count and tile size"""
+    results = calibration.get('results', [])
+    if not results:
+        return None
+    return min(results, key=lambda result: (result['function'] != function,
+                                            result['engine'] != engine,
+                                            abs(result['workers'] - workers),
+                                            abs(result['tile_size'] - tile_size)))
+
+
+def predict_runtime(plan, calibration, function, engine, workers, tile_size=0):
+    """Predicts the runtime with the MB/s of the closest benchmark case.
+    :returns:
+    dict with the seconds and the case, None without calibration"""
+    if calibration is None:
+        return None
+    case = calibration_case(calibration, function, engine, workers, tile_size)
+    if case is None or not case.get('mb_per_s'):
+        return None
+    return {'seconds': plan['input_mb'] / case['mb_per_s'],
+            'mb_per_s': case['mb_per_s'],
+            'case': dict((key, case[key]) for key in ('function', 'engine', 'workers',
+                                                       'tile_size')),
+            'platform': calibration.get('environment', {}).get('platform')}
+
+
+def format_plan(plan):
+    """Text report of a plan"""
+    lines = ['Tiles:              %d (%d skipped, %d to process)'
+             % (plan['tiles'], plan['tiles_skipped'], plan['tiles'] - plan['tiles_skipped']),
+             'Empty tiles:        %d' % plan['tiles_empty'],
+             'Outside timestep 2: %d' % plan['tiles_outside_ts2'],
+             'Bytes to read:']
+    for name in INPUTS:
+        size = plan['bytes_read'][name]
+        lines.append('  %-8s %s' % (name, 'unknown' if size is None else '%.1f MB' % (size / 1e6)))
+    lines.append('Outfile:            %dx%d px, %d band(s), %.1f MB uncompressed (%s)'
+                 % (plan['width'], plan['height'], plan['bands'], plan['output_bytes'] / 1e6,
+                    plan['output_compress'] or 'no compression'))
+    lines.append('Memory per worker:  %.1f MB for the largest tile' % plan['tile_mb'])
+    runtime = plan.get('runtime')
+    if runtime is None:
+        lines.append('Runtime:            unknown, no benchmark calibration '
+                     '(python -m benchmark.bench_engines -o benchmark/baseline.json)')
+    else:
+        lines.append('Runtime:            ~%.0f s at %.1f MB/s (%s engine=%s workers=%s '
+                     'tile_size=%s on %s)'
+                     % (runtime['seconds'], runtime['mb_per_s'], runtime['case']['function'],
+                        runtime['case']['engine'], runtime['case']['workers'],
+                        runtime['case']['tile_size'], runtime['platform']))
+    return '\n'.join(lines)
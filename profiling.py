@@ -0,0 +1,214 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Profiler hooks for the scripts. 'cpu' runs cProfile
+# in the main thread and in every worker thread and
+# merges the results, 'memory' takes tracemalloc
+# snapshots and the peak RSS for every stage of the
+# script. The reports are saved next to the outfile.
+###########################################
+"""
+
+import io
+import os
+import sys
+import json
+import pstats
+import cProfile
+import resource
+import threading
+import tracemalloc
+from time import sleep
+
+
+PROFILES = ('cpu', 'memory')
+
+# number of entries in the text reports
+TOP = 40
+
+
+def profile_prefix(outfile, kind):
+    """Returns the path of the reports without suffix"""
+    return os.path.splitext(outfile)[0] + '_profile_' + kind
+
+
+class NullProfiler(object):
+    """Profiler doing nothing, used without --profile"""
+
+    def start(self):
+        pass
+
+    def stage(self, name):
+        pass
+
+    def stop(self):
+        pass
+
+    def write(self, outfile):
+        return []
+
+
+class CpuProfiler(object):
+    """cProfile only profiles the thread it is enabled in, so every
+    thread started during the run gets its own profiler, at the end
+    all of them are merged into one report"""
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._main = cProfile.Profile()
+
+    def _thread_hook(self, frame, event, arg):
+        # runs once as first profile-event of a new thread and
+        # replaces itself with a cProfile.Profile for the thread
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # python >= 3.12 allows one profiler per process,
+            # it already sees the events of all threads
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def start(self):
+        threading.setprofile(self._thread_hook)
+        self._main.enable()
+
+    def stage(self, name):
+        pass
+
+    def stop(self):
+        self._main.disable()
+        threading.setprofile(None)
+
+    def stats(self):
+        """Merged pstats.Stats of all threads"""
+        stats = pstats.Stats(self._main)
+        with self._lock:
+            for profile in self._profiles:
+                profile.create_stats()
+                if profile.stats:
+                    stats.add(profile)
+        return stats
+
+    def write(self, outfile):
+        """Saves the stats (readable with pstats or snakeviz) and
+        a text report sorted by cumulative time.
+        :returns:
+        list of the written files"""
+        prefix = profile_prefix(outfile, 'cpu')
+        stats = self.stats()
+        stats.dump_stats(prefix + '.prof')
+
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(TOP)
+        stats.sort_stats('tottime').print_stats(TOP)
+        with open(prefix + '.txt', 'w') as dst:
+            dst.write('Threads profiled: %d\n' % (len(self._profiles) + 1))
+            dst.write(text.getvalue())
+        return [prefix + '.prof', prefix + '.txt']
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return peak / 1e6
+    return peak / 1e3
+
+
+def current_rss_mb():
+    """Resident set size of the process in MB, the peak RSS
+    of the process if the current value is not available"""
+    try:
+        with open('/proc/self/statm') as src:
+            pages = int(src.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (IOError, OSError, ValueError):
+        return peak_rss_mb()
+
+
+class MemoryProfiler(object):
+    """Takes a tracemalloc snapshot at the end of every stage and
+    samples the RSS in a background thread for the peak of the stage"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.stages = []
+        self._name = None
+        self._snapshot = None
+        self._peak_rss = 0.0
+        self._running = threading.Event()
+        self._sampler = None
+
+    def _sample(self):
+        while self._running.is_set():
+            self._peak_rss = max(self._peak_rss, current_rss_mb())
+            sleep(self.interval)
+
+    def start(self):
+        tracemalloc.start(25)
+        self._snapshot = tracemalloc.take_snapshot()
+        self._running.set()
+        self._sampler = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+        self._sampler.start()
+        self.stage('setup')
+
+    def _end_stage(self):
+        if self._name is None:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        growth = snapshot.compare_to(self._snapshot, 'lineno')
+        self.stages.append({'stage': self._name,
+                            'peak_rss_mb': max(self._peak_rss, current_rss_mb()),
+                            'traced_current_mb': current / 1e6,
+                            'traced_peak_mb': peak / 1e6,
+                            'top_growth': [str(stat) for stat in growth[:TOP // 2]]})
+        self._snapshot = snapshot
+        self._name = None
+
+    def stage(self, name):
+        """Ends the current stage and starts the next one"""
+        self._end_stage()
+        self._name = name
+        self._peak_rss = current_rss_mb()
+
+    def stop(self):
+        self._end_stage()
+        self._running.clear()
+        tracemalloc.stop()
+
+    def write(self, outfile):
+        """Saves the stages as json and text report.
+        :returns:
+        list of the written files"""
+        prefix = profile_prefix(outfile, 'memory')
+        with open(prefix + '.json', 'w') as dst:
+            json.dump({'stages': self.stages}, dst, indent=2)
+
+        with open(prefix + '.txt', 'w') as dst:
+            dst.write('%-12s %12s %14s %14s\n' % ('stage', 'peak rss MB',
+                                                  'traced now MB', 'traced peak MB'))
+            for stage in self.stages:
+                dst.write('%-12s %12.1f %14.1f %14.1f\n'
+                          % (stage['stage'], stage['peak_rss_mb'],
+                             stage['traced_current_mb'], stage['traced_peak_mb']))
+            for stage in self.stages:
+                dst.write('\nLargest growth during %s:\n' % stage['stage'])
+                dst.write('\n'.join(stage['top_growth']) + '\n')
+        return [prefix + '.json', prefix + '.txt']
+
+
+def make_profiler(kind=None):
+    """Returns the profiler for --profile (None, 'cpu' or 'memory')"""
+    if kind == 'cpu':
+        return CpuProfiler()
+    if kind == 'memory':
+        return MemoryProfiler()
+    return NullProfiler()
@@ -0,0 +1,149 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Progress of the tiled image processing. Every
+# written tile is counted, at most every interval
+# seconds a line with the tiles done, tiles/s,
+# MB/s read and the ETA is printed. On a terminal
+# the line is updated in place, otherwise log
+# lines are printed.
+###########################################
+"""
+
+import sys
+from contextlib import contextmanager
+from time import monotonic
+from instrumentation import NULL_RECORDER
+
+
+# seconds between two updates on a terminal and in a log
+TTY_INTERVAL = 0.5
+LOG_INTERVAL = 30.0
+
+
+def format_duration(seconds):
+    """Formats seconds as 1h02m, 3m04s or 5s"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return '%dh%02dm' % (seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '%dm%02ds' % (seconds // 60, seconds % 60)
+    return '%ds' % seconds
+
+
+class ProgressReporter(object):
+    """Reports the progress of process_tiles.
+    :parameter:
+    stream the progress is printed to,
+    seconds between two updates (default depends on the stream being a terminal),
+    Recorder with the bytes_read counters for MB/s (see instrumentation)"""
+
+    def __init__(self, stream=None, interval=None, recorder=NULL_RECORDER):
+        self.stream = stream or sys.stderr
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.interval = interval or (TTY_INTERVAL if self.tty else LOG_INTERVAL)
+        self.recorder = recorder
+        self.total = 0
+        self.skipped = 0
+        self.done = 0
+        self._start = None
+        self._due = None
+        self._last = None
+        self._start_bytes = None
+
+    def start(self, total, skipped=0):
+        """Starts the clock for total tiles, skipped tiles are already done"""
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self._start = monotonic()
+        self._due = self._start + self.interval
+        # the recorder may hold the bytes of an earlier pass or job
+        # (see coarse_to_fine, batch), only the bytes of this run count
+        self._start_bytes = self._bytes_read()
+        self._last = (self._start, 0, self._start_bytes)
+
+    def update(self, tiles=1):
+        """Counts written tiles. Called for every tile, so it only
+        compares the clock unless an update is due"""
+        self.done += tiles
+        now = monotonic()
+        if now >= self._due:
+            self._due = now + self.interval
+            self._print(self.line(now))
+
+    def close(self):
+        """Prints the final state"""
+        if self._start is None:
+            return
+        self._print(self.line(monotonic()))
+        if self.tty:
+            self.stream.write('\n')
+            self.stream.flush()
+        self._start = None
+
+    @contextmanager
+    def run(self, total, skipped=0):
+        """start and close around the processing"""
+        self.start(total, skipped)
+        try:
+            yield self
+        finally:
+            self.close()
+
+    def _bytes_read(self):
+        if not self.recorder.enabled:
+            return None
+        return sum(self.recorder.counters().get('bytes_read', {}).values())
+
+    def line(self, now):
+        """Text of an update: tiles done, current and average tiles/s,
+        current and average MB/s read since start and ETA"""
+        elapsed = now - self._start
+        last_time, last_done, last_bytes = self._last
+        bytes_read = self._bytes_read()
+        self._last = (now, self.done, bytes_read)
+
+        average = self.done / elapsed if elapsed > 0 else 0.0
+        current = (self.done - last_done) / (now - last_time) if now > last_time else average
+        parts = ['tiles %d/%d' % (self.done, self.total)]
+        if self.total:
+            parts[0] += ' (%.1f%%)' % (100.0 * self.done / self.total)
+        if self.skipped:
+            parts.append('%d skipped' % self.skipped)
+        parts.append('%.1f tiles/s now, %.1f avg' % (current, average))
+        if bytes_read is not None and elapsed > 0:
+            rate = (bytes_read - self._start_bytes) / elapsed
+            if now > last_time:
+                rate_now = (bytes_read - last_bytes) / (now - last_time)
+            else:
+                rate_now = rate
+            parts.append('%.1f MB/s read now, %.1f avg' % (rate_now / 1e6, rate / 1e6))
+        if self.done < self.total and average > 0:
+            parts.append('ETA %s' % format_duration((self.total - self.done) / average))
+        elif self.done >= self.total:
+            parts.append('done in %s' % format_duration(elapsed))
+        return ', '.join(parts)
+
+    def _print(self, line):
+        if self.tty:
+            # overwrite the line of the last update
+            self.stream.write('\r\x1b[K' + line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
+
+
+class NullProgress(object):
+    """Progress reporter doing nothing"""
+
+    def update(self, tiles=1):
+        pass
+
+    @contextmanager
+    def run(self, total, skipped=0):
+        yield self
+
+
+NULL_PROGRESS = NullProgress()
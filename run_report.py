@@ -0,0 +1,49 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Run report of the tiled image processing.
+# Collects the settings and results of a run
+# and saves them as json next to the outfile.
+###########################################
+"""
+
+import os
+import json
+import threading
+
+
+def report_path(outfile):
+    """Returns the path of the run report for an outfile"""
+    return os.path.splitext(outfile)[0] + '_report.json'
+
+
+class RunReport(object):
+    """Dict-like collection of the settings and results of a run.
+    Sections can be set from worker threads."""
+
+    def __init__(self, **entries):
+        self._entries = dict(entries)
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        """Sets a section of the report"""
+        with self._lock:
+            self._entries[key] = value
+
+    def update(self, key, values):
+        """Updates a dict-section of the report"""
+        with self._lock:
+            self._entries.setdefault(key, {}).update(values)
+
+    def to_dict(self):
+        with self._lock:
+            return json.loads(json.dumps(self._entries, default=str))
+
+    def write(self, path):
+        """Saves the report as json. The file is replaced atomically,
+        so a reader never sees half a report"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as dst:
+            json.dump(self.to_dict(), dst, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
@@ -0,0 +1,269 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Registry of spectral indices (NDVI, NDWI, SAVI,
+# EVI, NBR, ...). Every index declares the bands
+# it needs, a tiled run reads the union of the
+# bands of all requested indices once and writes
+# every index (or its difference between two
+# dates) as band of one outfile or as own file.
+###########################################
+"""
+
+import os
+from contextlib import ExitStack
+import numpy as np
+import rasterio as rio
+from parallized_resampled import scene_tiles, process_windows, calculate_ndvi
+from parallized_resampled import read_reference_blocks, read_resampled_blocks
+from parallized_resampled import calculate_difference
+from io_profiles import gdal_env
+from tile_journal import TileWriter
+from instrumentation import NULL_RECORDER
+
+
+# assets of a band in landsat and sentinel items
+BANDS = {'blue': ('B2', 'B02'),
+         'green': ('B3', 'B03'),
+         'red': ('B4', 'B04'),
+         'nir': ('B5', 'B08'),
+         'swir1': ('B6', 'B11'),
+         'swir2': ('B7', 'B12')}
+
+# order in which the bands are read
+BAND_ORDER = ('blue', 'green', 'red', 'nir', 'swir1', 'swir2')
+
+# indices with constants (SAVI, EVI) need reflectances,
+# reflectance = digital number * scale + offset
+DEFAULT_SCALE = 0.0001
+DEFAULT_OFFSET = 0.0
+
+# the outfile has a band per index, or every index gets its own file
+OUTPUTS = ('bands', 'files')
+
+# value of an index for pixels without data (like calculate_ndvi)
+MISSING = -2
+
+
+class SpectralIndex(object):
+    """An index: its name, the bands the kernel is called with
+    (as keywords) and if the kernel expects reflectances"""
+
+    def __init__(self, name, bands, kernel, reflectance=False):
+        self.name = name
+        self.bands = bands
+        self.kernel = kernel
+        self.reflectance = reflectance
+
+
+# registered indices by name
+INDICES = {}
+
+
+def register_index(name, bands, reflectance=False):
+    """Decorator adding a vectorized kernel to the registry. The kernel
+    gets the bands as float32 arrays, pixels where every band is 0 are
+    set to MISSING afterwards.
+    :parameter:
+    name of the index,
+    names of the bands (see BANDS),
+    True if the kernel needs reflectances instead of digital numbers"""
+    unknown = [band for band in bands if band not in BANDS]
+    if unknown:
+        raise ValueError('Unknown bands %s' % ', '.join(unknown))
+
+    def register(kernel):
+        INDICES[name] = SpectralIndex(name, tuple(bands), kernel, reflectance)
+        return kernel
+    return register
+
+
+@register_index('ndvi', ('red', 'nir'))
+def ndvi(red, nir):
+    """Normalized difference vegetation index, the kernel of the ndvi-difference"""
+    return calculate_ndvi(red, nir)
+
+
+@register_index('ndwi', ('green', 'nir'))
+def ndwi(green, nir):
+    """Normalized difference water index (McFeeters)"""
+    return (green - nir) / (green + nir)
+
+
+@register_index('nbr', ('nir', 'swir2'))
+def nbr(nir, swir2):
+    """Normalized burn ratio"""
+    return (nir - swir2) / (nir + swir2)
+
+
+@register_index('savi', ('red', 'nir'), reflectance=True)
+def savi(red, nir):
+    """Soil adjusted vegetation index with L = 0.5"""
+    return 1.5 * (nir - red) / (nir + red + 0.5)
+
+
+@register_index('evi', ('blue', 'red', 'nir'), reflectance=True)
+def evi(blue, red, nir):
+    """Enhanced vegetation index"""
+    return 2.5 * (nir - red) / (nir + 6.0 * red - 7.5 * blue + 1.0)
+
+
+def get_indices(names):
+    """Returns the registered indices of names"""
+    unknown = [name for name in names if name not in INDICES]
+    if unknown:
+        raise ValueError('Unknown indices %s, registered are %s'
+                         % (', '.join(unknown), ', '.join(sorted(INDICES))))
+    return [INDICES[name] for name in names]
+
+
+def index_bands(indices):
+    """Union of the bands of the indices, in BAND_ORDER"""
+    needed = set(band for index in indices for band in index.bands)
+    return [band for band in BAND_ORDER if band in needed]
+
+
+def get_band_urls(statsac_item, bands):
+    """Urls of the bands of a landsat or sentinel item
+    :parameter:
+    satsac.Item Object,
+    names of the bands (see BANDS)
+    :returns:
+    List of urls in the order of bands"""
+    urls = []
+    for band in bands:
+        assets = [asset for asset in BANDS[band] if asset in statsac_item.assets]
+        if not assets:
+            raise ValueError('No %s band available in %s' % (band, statsac_item))
+        urls.append(statsac_item.assets[assets[0]]['href'])
+    return urls
+
+
+def compute_indices(blocks, bands, indices, scale=DEFAULT_SCALE, offset=DEFAULT_OFFSET):
+    """Calculates the indices of one scene of a tile.
+    :parameter:
+    Tuple of arrays in the order of bands,
+    names of the bands,
+    indices (see get_indices),
+    scale and offset from digital numbers to reflectances
+    :returns:
+    Numpy-Array with one band per index"""
+    numbers = dict((band, block.astype(rio.float32)) for band, block in zip(bands, blocks))
+    reflectances = None
+    results = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for index in indices:
+            arrays = numbers
+            if index.reflectance:
+                if reflectances is None:
+                    reflectances = dict((band, array * np.float32(scale) + np.float32(offset))
+                                        for band, array in numbers.items())
+                arrays = reflectances
+            values = index.kernel(**dict((band, arrays[band]) for band in index.bands))
+            valid = np.logical_or.reduce([numbers[band] > 0 for band in index.bands])
+            results.append(np.where(valid, values, MISSING).astype(rio.float32))
+    return np.concatenate(results)
+
+
+def index_path(outfile, name):
+    """Returns the path of the outfile of one index"""
+    base, extension = os.path.splitext(outfile)
+    return '%s_%s%s' % (base, name, extension or '.tif')
+
+
+class IndexFiles(object):
+    """Destination writing every band of a tile to the file of its index"""
+
+    def __init__(self, writers):
+        self.writers = writers
+
+    def write(self, result, window):
+        for band, writer in enumerate(self.writers):
+            writer.write(result[band:band + 1], window=window)
+
+
+def indices_tiled_calc(statsac_item_ts1, statsac_item_ts2, outfile, indices=('ndvi',),
+                       output='bands', tile_size_x=0, tile_size_y=0, max_workers=1,
+                       resume=False, checkpoint_every=None, scale=DEFAULT_SCALE,
+                       offset=DEFAULT_OFFSET, recorder=NULL_RECORDER, opener=None,
+                       **options):
+    """Calculates spectral indices tile by tile. The union of the bands of
+    all indices is read once per tile, the bands of statsac_item_ts2 are
+    resampled to the grid of statsac_item_ts1 like in optimal_tiled_calc.
+    :parameter:
+    Statsac-Item Object of date x,
+    Statsac-Item object of date y, None for the indices of date x only,
+    Name of outfile,
+    names of the indices (see INDICES),
+    output: 'bands' (one outfile with a band per index) or 'files'
+    (one outfile per index, see index_path),
+    tile size x and y in m (0 for the internal blocks of date x),
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    scale and offset from digital numbers to reflectances (SAVI, EVI),
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if output not in OUTPUTS:
+        raise ValueError('output needs to be one of %s' % ', '.join(OUTPUTS))
+    indices = get_indices(indices)
+    bands = index_bands(indices)
+    urls_ts1 = get_band_urls(statsac_item_ts1, bands)
+    urls_ts2 = get_band_urls(statsac_item_ts2, bands) if statsac_item_ts2 is not None else []
+    inputs = (['%s_ts1' % band for band in bands] +
+              ['%s_ts2' % band for band in bands][:len(urls_ts2)])
+    names = [index.name if statsac_item_ts2 is None else '%s difference' % index.name
+             for index in indices]
+
+    with gdal_env(options.get('gdal_options')), rio.open(urls_ts1[0]) as src:
+        out_profile = src.profile.copy()
+        out_profile.update({'dtype': 'float32'})
+        tiles = scene_tiles(src, tile_size_x, tile_size_y)
+
+        with ExitStack() as stack:
+            # open the outfiles, when resuming the existing outfiles are updated instead
+            if output == 'bands':
+                out_profile['count'] = len(indices)
+                dst = stack.enter_context(TileWriter(outfile, out_profile, resume=resume,
+                                                     checkpoint_every=checkpoint_every))
+                writers = [dst]
+                if not dst.completed:
+                    dst.dataset.descriptions = names
+            else:
+                writers = [stack.enter_context(TileWriter(index_path(outfile, index.name),
+                                                          out_profile, resume=resume,
+                                                          checkpoint_every=checkpoint_every))
+                           for index in indices]
+                for writer, name in zip(writers, names):
+                    if not writer.completed:
+                        writer.dataset.descriptions = (name,)
+                dst = IndexFiles(writers)
+            # a window is done if it is in every outfile
+            completed = set.intersection(*[writer.completed for writer in writers])
+
+            def read(window_idx, window):
+                blocks = read_reference_blocks(urls_ts1, window, window_idx,
+                                               recorder, opener, inputs[:len(bands)])
+                if urls_ts2:
+                    blocks += read_resampled_blocks(urls_ts2, window, tiles, window_idx,
+                                                    recorder, opener, inputs[len(bands):])
+                return blocks
+
+            def compute(blocks):
+                result = compute_indices(blocks[:len(bands)], bands, indices, scale, offset)
+                if not urls_ts2:
+                    return result
+                return calculate_difference(
+                    result, compute_indices(blocks[len(bands):], bands, indices, scale, offset))
+
+            failures = process_windows(tiles, urls_ts1 + urls_ts2, read, compute, dst,
+                                       max_workers=max_workers, completed=completed,
+                                       recorder=recorder, inputs=inputs, **options)
+            # keep the journals, so the failed windows can be resumed
+            for writer in writers:
+                writer.incomplete = bool(failures)
+            return failures
@@ -0,0 +1,142 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Staged pipeline for the tiled image processing.
+# Reading, computing and writing of the tiles run
+# in separate stages which are connected by
+# bounded queues, so every stage gets its own
+# concurrency setting.
+###########################################
+"""
+
+import os
+import queue
+import threading
+
+
+# marks the end of the tasks for a stage
+_DONE = object()
+
+# default concurrency of the stages
+DEFAULT_IO_WORKERS = 32
+DEFAULT_QUEUE_SIZE = 64
+
+
+class _StageError(object):
+    """Wraps an exception raised inside a stage, so the
+    writer can raise it in the main thread"""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(out_queue, item, abort):
+    """Puts an item into a bounded queue without blocking forever
+    if the pipeline has been aborted"""
+    while not abort.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(in_queue, abort):
+    """Takes an item from a queue, returns _DONE if the pipeline
+    has been aborted"""
+    while not abort.is_set():
+        try:
+            return in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _stage_worker(in_queue, out_queue, function, abort):
+    """Takes (task, data) from in_queue, applies function on data
+    and puts (task, result) into out_queue until _DONE is received.
+    Errors are passed on to the next stage"""
+    while True:
+        item = _get(in_queue, abort)
+        if item is _DONE:
+            return
+        if isinstance(item, _StageError):
+            result_item = item
+        else:
+            task, data = item
+            try:
+                result_item = (task, function(data))
+            except Exception as exc:
+                result_item = _StageError(exc)
+        if not _put(out_queue, result_item, abort):
+            return
+
+
+def _start_stage(name, workers, in_queue, out_queue, function, next_workers, abort):
+    """Starts the threads of one stage. After all of them finished,
+    every thread of the next stage receives _DONE"""
+    threads = [threading.Thread(target=_stage_worker,
+                                args=(in_queue, out_queue, function, abort),
+                                name='%s-%d' % (name, i), daemon=True)
+               for i in range(workers)]
+
+    def close_stage():
+        for thread in threads:
+            thread.join()
+        for _ in range(next_workers):
+            _put(out_queue, _DONE, abort)
+
+    for thread in threads:
+        thread.start()
+    threading.Thread(target=close_stage, name='%s-closer' % name, daemon=True).start()
+
+
+def run_staged(tasks, read_fn, compute_fn, write_fn,
+               io_workers=None, compute_workers=None, queue_size=None):
+    """Runs the tasks through an I/O-, a Compute- and a Writer-Stage.
+    The I/O-Stage is a large pool of threads, since remote reads are
+    latency-bound, the Compute-Stage is sized to the number of cores
+    (numpy releases the GIL for the array math) and the writer runs in
+    the calling thread, because the destination dataset is not threadsafe.
+    :parameter:
+    List of tasks,
+    read_fn(task) returning the data of the task,
+    compute_fn(data) returning the result of the task,
+    write_fn(task, result) writing the result,
+    Number of I/O-Threads,
+    Number of Compute-Threads,
+    Maximum number of tiles waiting between two stages"""
+
+    io_workers = io_workers or DEFAULT_IO_WORKERS
+    compute_workers = compute_workers or os.cpu_count() or 1
+    queue_size = queue_size or DEFAULT_QUEUE_SIZE
+
+    task_queue = queue.Queue()
+    read_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    abort = threading.Event()
+
+    for task in tasks:
+        task_queue.put((task, task))
+    for _ in range(io_workers):
+        task_queue.put(_DONE)
+
+    _start_stage('io', io_workers, task_queue, read_queue,
+                 read_fn, compute_workers, abort)
+    _start_stage('compute', compute_workers, read_queue, result_queue,
+                 compute_fn, 1, abort)
+
+    # Writer-Stage
+    try:
+        while True:
+            item = result_queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.exc
+            task, result = item
+            write_fn(task, result)
+    finally:
+        abort.set()
@@ -0,0 +1,153 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Per-pixel statistics of the NDVI over a long
+# time series. The scenes are streamed through
+# every tile one after another and added to online
+# accumulators (Welford), so the memory depends
+# on the tile size and not on the number of
+# scenes. The statistics are written as bands.
+###########################################
+"""
+
+from datetime import datetime
+import numpy as np
+import rasterio as rio
+from parallized_resampled import get_urls, scene_tiles, process_windows
+from parallized_resampled import read_scene_ndvi
+from io_profiles import gdal_env
+from tile_journal import TileWriter
+from ndvi_cache import grid_id
+from instrumentation import NULL_RECORDER, scene_inputs
+
+
+# bands of the outfile, pixels without a valid ndvi are nan
+STATISTICS = ('mean', 'variance', 'min', 'max', 'slope', 'count')
+
+# value of calculate_ndvi for pixels without data
+MISSING = -2
+
+
+def scene_times(statsac_items):
+    """Time of every scene for the slope: days since the first scene
+    if the items have a datetime, otherwise the number of the scene"""
+    dates = [getattr(item, 'datetime', None) for item in statsac_items]
+    if all(isinstance(date, datetime) for date in dates):
+        return [(date - dates[0]).total_seconds() / 86400.0 for date in dates]
+    return [float(number) for number in range(len(statsac_items))]
+
+
+class TemporalAccumulator(object):
+    """Online mean, variance, min, max and linear slope over time for
+    every pixel of a tile. Pixels with a missing ndvi are left out,
+    so every pixel has its own number of values.
+    :parameter:
+    shape of the tile"""
+
+    def __init__(self, shape):
+        self.count = np.zeros(shape, dtype=np.int32)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+        self.minimum = np.full(shape, np.inf, dtype=np.float64)
+        self.maximum = np.full(shape, -np.inf, dtype=np.float64)
+        # mean and sum of squares of the times, co-moment of time and ndvi
+        self.mean_t = np.zeros(shape, dtype=np.float64)
+        self.m2_t = np.zeros(shape, dtype=np.float64)
+        self.c_ty = np.zeros(shape, dtype=np.float64)
+
+    def update(self, ndvi, time):
+        """Adds the ndvi of one scene taken at time"""
+        valid = ndvi != MISSING
+        self.count += valid
+        count = np.maximum(self.count, 1)
+        delta_t = np.where(valid, time - self.mean_t, 0.0)
+        delta = np.where(valid, ndvi - self.mean, 0.0)
+        self.mean_t += delta_t / count
+        self.mean += delta / count
+        self.m2 += np.where(valid, delta * (ndvi - self.mean), 0.0)
+        self.c_ty += np.where(valid, delta_t * (ndvi - self.mean), 0.0)
+        self.m2_t += np.where(valid, delta_t * (time - self.mean_t), 0.0)
+        np.minimum(self.minimum, np.where(valid, ndvi, np.inf), out=self.minimum)
+        np.maximum(self.maximum, np.where(valid, ndvi, -np.inf), out=self.maximum)
+
+    def result(self):
+        """Returns the statistics as float32 array with one band per STATISTICS"""
+        empty = self.count == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+            slope = np.where(self.m2_t > 0, self.c_ty / self.m2_t, np.nan)
+        bands = [np.where(empty, np.nan, self.mean),
+                 variance,
+                 np.where(empty, np.nan, self.minimum),
+                 np.where(empty, np.nan, self.maximum),
+                 slope,
+                 self.count]
+        return np.concatenate(bands).astype(rio.float32)
+
+
+def temporal_stats_calc(statsac_items, outfile, times=None, tile_size_x=0, tile_size_y=0,
+                        max_workers=1, resume=False, checkpoint_every=None,
+                        recorder=NULL_RECORDER, opener=None, cache=None, **options):
+    """Calculates per-pixel statistics of the ndvi of a list of scenes
+    tile by tile. The first scene is the source of the outfile, the
+    others are resampled to its grid like timestep 2 of optimal_tiled_calc.
+    :parameter:
+    List of Statsac-Item Objects,
+    Name of outfile,
+    time of every scene for the slope (default see scene_times),
+    tile size x and y in m (0 for the internal blocks of the first scene),
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    NdviTileCache with the ndvi of scenes calculated before (see ndvi_cache),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if len(statsac_items) < 2:
+        raise ValueError('The statistics need at least 2 scenes')
+    if options.get('engine') == 'async':
+        # the scenes are streamed one after another, the async
+        # engine would fetch all of them at the same time
+        raise ValueError('The statistics can be calculated with the pool and the staged engine')
+    times = times or scene_times(statsac_items)
+    if len(times) != len(statsac_items):
+        raise ValueError('Every scene needs a time')
+    urls_scenes = [get_urls(item) for item in statsac_items]
+    urls = [url for urls_scene in urls_scenes for url in urls_scene]
+
+    with gdal_env(options.get('gdal_options')), rio.open(urls_scenes[0][0]) as src_red:
+        out_profile = src_red.profile.copy()
+        out_profile.update({'dtype': 'float32', 'count': len(STATISTICS), 'nodata': np.nan})
+        tiles = scene_tiles(src_red, tile_size_x, tile_size_y)
+        grid = grid_id(src_red, tiles)
+        # open outfile with outprofile, when resuming the existing
+        # outfile is updated instead
+        with TileWriter(outfile, out_profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+            if not dst.completed:
+                dst.dataset.descriptions = STATISTICS
+
+            def read(window_idx, window):
+                # only the bands of one scene and the accumulators are in memory
+                accumulator = TemporalAccumulator((1, int(window.height), int(window.width)))
+                for number, time in enumerate(times):
+                    ndvi = read_scene_ndvi(urls_scenes, number, window, tiles, window_idx,
+                                           recorder, opener, cache, grid)
+                    with recorder.span('kernel', window_idx):
+                        accumulator.update(ndvi, time)
+                return accumulator
+
+            def compute(accumulator):
+                return accumulator.result()
+
+            failures = process_windows(tiles, urls, read, compute, dst,
+                                       max_workers=max_workers, completed=dst.completed,
+                                       recorder=recorder,
+                                       inputs=scene_inputs(len(statsac_items)),
+                                       **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
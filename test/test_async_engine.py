@@ -0,0 +1,142 @@
+import threading
+import zlib
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import numpy as np
+import rasterio as rio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from async_engine import BlockLayout, decode_block, merge_ranges, run_async
+from instrumentation import Recorder
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """File server answering Range-Requests with 206"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        try:
+            with open(path, 'rb') as src:
+                data = src.read()
+        except OSError:
+            # directory listings and missing files
+            self.send_error(404)
+            return
+        start, end = 0, len(data) - 1
+        if 'Range' in self.headers:
+            start, end = (int(value) for value in
+                          self.headers['Range'].split('=')[1].split('-'))
+            end = min(end, len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(data)))
+        else:
+            self.send_response(200)
+        body = data[start:end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory):
+    handler = partial(RangeRequestHandler, directory=str(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/' % server.server_port
+
+
+def write_band(path, array, predictor=1):
+    profile = {'driver': 'GTiff', 'width': array.shape[1], 'height': array.shape[0],
+               'count': 1, 'dtype': 'uint16', 'crs': 'EPSG:32632',
+               'transform': from_origin(470000, 5480000, 30, 30),
+               'tiled': True, 'blockxsize': 64, 'blockysize': 64,
+               'compress': 'deflate', 'predictor': predictor}
+    with rio.open(str(path), 'w', **profile) as dst:
+        dst.write(array, 1)
+
+
+def test_merge_ranges():
+
+    # Given
+    ranges = [(100, 10, 'b'), (0, 50, 'a'), (1000000, 10, 'c')]
+
+    # Then
+    result = merge_ranges(ranges, gap=100)
+
+    # Expected
+    assert [(start, end) for start, end, members in result] == [(0, 109), (1000000, 1000009)]
+    assert [key for offset, size, key in result[0][2]] == ['a', 'b']
+
+
+def test_decode_block_predictor():
+
+    # Given
+    block = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    layout = BlockLayout('http://x', 4, 4, (4, 4), 'uint16', 'deflate', 2, {}, {})
+    diff = np.diff(block, axis=1, prepend=0).astype('<u2')
+
+    # Then
+    result = decode_block(zlib.compress(diff.tobytes()), layout)
+
+    # Expected
+    assert np.array_equal(result, block)
+
+
+def test_async_read_matches_rasterio(tmp_path):
+
+    # Given
+    red = np.random.randint(0, 20000, (150, 170)).astype(np.uint16)
+    nir = np.random.randint(0, 20000, (150, 170)).astype(np.uint16)
+    write_band(tmp_path / 'red.tif', red)
+    write_band(tmp_path / 'nir.tif', nir, predictor=2)
+    server, base = serve(tmp_path)
+    urls = [base + 'red.tif', base + 'nir.tif']
+    tasks = [(0, Window(0, 0, 64, 64)), (1, Window(100, 90, 70, 60))]
+    written = {}
+
+    def fallback(task):
+        raise AssertionError('async path expected')
+
+    # Then
+    try:
+        run_async(tasks, urls, fallback, lambda task, data: data,
+                  lambda task, result: written.update({task[0]: result}),
+                  max_requests=4, connections=2,
+                  gdal_options={'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR'})
+    finally:
+        server.shutdown()
+
+    # Expected
+    for idx, window in tasks:
+        rows, cols = window.toslices()
+        assert np.array_equal(written[idx][0][0], red[rows, cols])
+        assert np.array_equal(written[idx][1][0], nir[rows, cols])
+
+
+def test_bands_of_a_tile_are_read_concurrently(tmp_path):
+
+    # Given
+    for name in ('red_1', 'nir_1', 'red_2', 'nir_2'):
+        write_band(tmp_path / (name + '.tif'),
+                   np.random.randint(0, 20000, (128, 128)).astype(np.uint16))
+    server, base = serve(tmp_path)
+    urls = [base + name + '.tif' for name in ('red_1', 'nir_1', 'red_2', 'nir_2')]
+    recorder = Recorder()
+
+    # Then
+    try:
+        run_async([(0, Window(0, 0, 128, 128))], urls, None, lambda task, data: data,
+                  lambda task, result: None, recorder=recorder,
+                  gdal_options={'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR'})
+    finally:
+        server.shutdown()
+
+    # Expected
+    reads = [span for span in recorder.spans if span.stage.startswith('read')]
+    assert sorted(span.stage for span in reads) == ['read_ts1'] * 2 + ['read_ts2'] * 2
+    # every band is started before the first one is finished
+    assert max(span.start for span in reads) < min(span.start + span.duration for span in reads)
@@ -0,0 +1,83 @@
+import threading
+import numpy as np
+import pytest
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair
+from batch import BatchScheduler, SharedDatasets, make_jobs
+from instrumentation import Recorder
+
+
+def test_make_jobs_uses_batch_defaults():
+
+    # Given
+    config = {'property': 'eo:cloud_cover<5', 'tilex': 0,
+              'jobs': [{'dates': ['2017-04-01', '2018-06-01'], 'bounding_box': [1, 2, 3, 4],
+                        'outfile': 'a.tif'},
+                       {'dates': ['2017-04-01', '2018-06-01'], 'bounding_box': [1, 2, 3, 4],
+                        'outfile': 'b.tif', 'tilex': 6000, 'tiley': 6000}]}
+
+    # Then
+    jobs = make_jobs(config)
+
+    # Expected
+    assert [job['property'] for job in jobs] == ['eo:cloud_cover<5'] * 2
+    assert [(job['tilex'], job['tiley']) for job in jobs] == [(0, 0), (6000, 6000)]
+    with pytest.raises(ValueError):
+        make_jobs({'jobs': [dict(config['jobs'][0], property='x')] * 2})
+
+
+def test_shared_datasets_per_thread(tmp_path):
+
+    # Given
+    item, _ = make_scene_pair(str(tmp_path), size=128, block_size=64)
+    url = item.assets['B4']['href']
+    datasets = SharedDatasets()
+    opened = []
+
+    def open_twice():
+        with datasets.open(url) as first, datasets.open(url) as second:
+            opened.append((first, second))
+
+    # Then
+    threads = [threading.Thread(target=open_twice) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    datasets.close()
+
+    # Expected
+    assert opened[0][0] is opened[0][1]
+    assert opened[0][0] is not opened[1][0]
+    assert all(dataset.closed for pair in opened for dataset in pair)
+
+
+def test_jobs_share_searches_and_datasets(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+    searches = []
+
+    def search(date, bounding_box, prop):
+        searches.append(date)
+        return item_ts1 if date == 'ts1' else item_ts2
+
+    jobs = [{'dates': ['ts1', 'ts2'], 'bounding_box': [1, 2, 3, 4], 'property': 'p',
+             'tilex': 0, 'tiley': 0, 'outfile': str(tmp_path / ('out_%d.tif' % number))}
+            for number in range(3)]
+    recorder = Recorder()
+
+    # Then
+    with BatchScheduler(2, max_jobs=3, search=search, recorder=recorder) as scheduler:
+        results = scheduler.run(jobs)
+    outputs = []
+    for job in jobs:
+        with rio.open(job['outfile']) as src:
+            outputs.append(src.read(1))
+
+    # Expected
+    assert [result['error'] for result in results] == [None] * 3
+    assert sorted(searches) == ['ts1', 'ts2']
+    assert np.array_equal(outputs[0], outputs[1]) and np.array_equal(outputs[0], outputs[2])
+    assert recorder.counters()['dataset_cache_hits'] > 0
+    worker_threads = set(span.thread for span in recorder.spans if span.stage == 'kernel')
+    assert len(worker_threads) <= 2
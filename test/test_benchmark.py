@@ -0,0 +1,52 @@
+import numpy as np
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair
+from benchmark.bench_engines import run_case
+from benchmark.bench_kernels import run_kernels
+
+
+def test_synthetic_scene(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+
+    # Then
+    with rio.open(item_ts1.assets['B4']['href']) as src:
+        red = src.read(1)
+        blocks = src.block_shapes
+    with rio.open(item_ts2.assets['B5']['href']) as src:
+        shape_ts2 = src.shape
+
+    # Expected
+    assert red.dtype == np.uint16
+    assert blocks == [(128, 128)]
+    assert red[0, 0] == 0 and red[150, 150] > 0
+    assert shape_ts2 == (307, 314)
+
+
+def test_run_case(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+    case = {'item_ts1': item_ts1, 'item_ts2': item_ts2, 'directory': str(tmp_path),
+            'engine': 'pool', 'workers': 2, 'tile_size': 0}
+
+    # Then
+    result = run_case(case)
+
+    # Expected
+    assert result['tiles'] == 9
+    assert result['tiles_per_s'] > 0 and result['peak_rss_mb'] > 0
+
+
+def test_kernels_equivalent():
+
+    # Given
+    shapes = [(1, 64, 64)]
+
+    # Then
+    results = run_kernels(shapes, ['uint16', 'float32'], [0.0, 0.5], repeat=1)
+
+    # Expected
+    assert len(results) == 2 * 2 * 4
+    assert all(result['equivalent'] for result in results)
@@ -0,0 +1,50 @@
+import numpy as np
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair
+from parallized_resampled import customized_tiled_calc
+from instrumentation import Recorder
+from time_series import time_series_calc
+from coarse_to_fine import coarse_to_fine_calc
+
+
+def test_coarse_to_fine(tmp_path):
+
+    # Given
+    scenes = make_scene_pair(str(tmp_path / 'scenes'), size=300, block_size=128)
+    full_file = str(tmp_path / 'full.tif')
+    fine_file = str(tmp_path / 'fine.tif')
+    coarse_file = str(tmp_path / 'coarse.tif')
+    stack_file = str(tmp_path / 'stack.tif')
+    fine, coarse = Recorder(), Recorder()
+
+    # Then
+    customized_tiled_calc(scenes[0], scenes[1], full_file, 2000, 2000)
+    time_series_calc(list(scenes), stack_file, output='stack')
+    # every tile with data in both dates changed
+    coarse_to_fine_calc(scenes[0], scenes[1], fine_file, threshold=-1,
+                        tile_size_x=2000, tile_size_y=2000, max_workers=2, recorder=fine)
+    # no tile changed
+    coarse_to_fine_calc(scenes[0], scenes[1], coarse_file, threshold=10, fill='nodata',
+                        tile_size_x=2000, tile_size_y=2000, engine='staged', recorder=coarse)
+    with rio.open(full_file) as src:
+        full = src.read(1)
+    with rio.open(fine_file) as src:
+        result = src.read(1)
+    with rio.open(coarse_file) as src:
+        filled = src.read(1)
+        nodata = src.nodata
+    with rio.open(stack_file) as src:
+        valid = np.all(src.read() != -2, axis=0)
+    tiles = fine.counters()['tiles_total']
+
+    # Expected
+    assert np.array_equal(result[valid], full[valid])
+    assert fine.counters()['tiles_fine'] > 0
+    assert fine.counters()['tiles_fine'] + fine.counters()['tiles_coarse'] == tiles
+    assert coarse.counters()['tiles_coarse'] == coarse.counters()['tiles_total'] == tiles
+    assert coarse.counters()['tiles_fine'] == 0
+    assert np.isnan(nodata)
+    assert np.isnan(filled).all()
+    # the coarse pass reads the 38 x 38 decimated grid as one tile, the full resolution none
+    assert coarse.summary()['read_ts1']['count'] == 2
+    assert sum(coarse.counters()['bytes_read'].values()) > 0
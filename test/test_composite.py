@@ -0,0 +1,100 @@
+import warnings
+import numpy as np
+import pytest
+import rasterio as rio
+from rasterio import windows
+import parallized_resampled
+from benchmark.synthetic import make_scene_pair, write_band, SyntheticItem
+from parallized_resampled import search_images, calculate_ndvi, calculate_difference
+from composite import composite_tiled_calc
+
+
+class FakeSearch(object):
+
+    def __init__(self, **kwargs):
+        pass
+
+    def items(self):
+        return ['S2A_1', 'LC08_1', 'S2B_2', 'LC08_2', 'LC08_3']
+
+
+def test_search_images_keeps_the_best_landsat_scenes(monkeypatch):
+
+    # Given
+    monkeypatch.setattr(parallized_resampled, 'Search', FakeSearch)
+
+    # Expected
+    assert search_images('2017-04-01', [1, 2, 3, 4], 'eo:cloud_cover<5', 2) == \
+        ['LC08_1', 'LC08_2']
+    assert parallized_resampled.search_image('2017-04-01', [1, 2, 3, 4], 'p') == 'LC08_1'
+
+
+@pytest.fixture
+def scenes(tmp_path):
+    first, second = make_scene_pair(str(tmp_path / 'a'), size=300, block_size=128)
+    third = make_scene_pair(str(tmp_path / 'b'), size=300, offset=3, block_size=128)[1]
+    # first scene with a cloud gap
+    paths = []
+    for band in ('B4', 'B5'):
+        with rio.open(first.assets[band]['href']) as src:
+            array = src.read(1)
+        array[100:200, 50:250] = 0
+        paths.append(str(tmp_path / ('gap_%s.TIF' % band)))
+        write_band(paths[-1], array, block_size=128)
+    return first, second, third, SyntheticItem(*paths)
+
+
+def ground_ndvi(item, shift, size=300):
+    """ndvi of a scene at the pixels of the first scene, the origin
+    of the scene is shift pixels up and left of the first one"""
+    with rio.open(item.assets['B4']['href']) as red, \
+            rio.open(item.assets['B5']['href']) as nir:
+        window = windows.Window(shift, shift, size, size)
+        return calculate_ndvi(red.read(1, window=window), nir.read(1, window=window))
+
+
+@pytest.mark.parametrize('method', ['max-ndvi', 'median'])
+def test_single_scenes_are_read_at_the_same_ground_position(tmp_path, scenes, method):
+
+    # Given
+    first, second = scenes[:2]
+
+    # Then
+    composite_tiled_calc([first], [second], str(tmp_path / 'composite.tif'), method=method)
+    with rio.open(str(tmp_path / 'composite.tif')) as src:
+        composite = src.read(1)
+
+    # Expected
+    # the grid of second is shifted by 7 pixels (see make_scene_pair)
+    assert np.allclose(composite, calculate_difference(ground_ndvi(first, 0),
+                                                       ground_ndvi(second, 7)), atol=1e-5)
+
+
+def test_composites_fill_gaps(tmp_path, scenes):
+
+    # Given
+    first, second, third, gap = scenes
+    ndvis = [ground_ndvi(gap, 0), ground_ndvi(first, 0),
+             ground_ndvi(second, 7), ground_ndvi(third, 3)]
+    ndvi_ts1 = np.maximum(ndvis[0], ndvis[1])
+    values = np.where(np.stack(ndvis[2:]) == -2, np.nan, np.stack(ndvis[2:]))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ndvi_ts2 = np.nan_to_num(np.nanmedian(values, axis=0), nan=-2)
+
+    # Then
+    composite_tiled_calc([gap, first], [second, third], str(tmp_path / 'max.tif'),
+                         method='max-ndvi', max_workers=2, engine='staged')
+    composite_tiled_calc([gap], [second, third], str(tmp_path / 'median.tif'),
+                         method='median')
+    with rio.open(str(tmp_path / 'max.tif')) as src:
+        maximum = src.read(1)
+    with rio.open(str(tmp_path / 'median.tif')) as src:
+        median = src.read(1)
+    ts2_max = np.maximum(ndvis[2], ndvis[3])
+
+    # Expected
+    assert np.allclose(maximum, calculate_difference(ndvi_ts1, ts2_max), atol=1e-5)
+    assert np.allclose(median, calculate_difference(ndvis[0], ndvi_ts2), atol=1e-5)
+    assert np.all(ndvis[0][100:200, 50:250] == -2)
+    assert np.all(ndvi_ts1[100:200, 50:250] == ndvis[1][100:200, 50:250])
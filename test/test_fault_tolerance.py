@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+import rasterio as rio
+from time import sleep, time
+from rasterio.windows import Window
+from benchmark.synthetic import make_scene_pair
+from fault_tolerance import RetryPolicy, run_pool
+from parallized_resampled import run_tasks, optimal_tiled_calc
+
+
+def tasks(number):
+    return [(idx, Window(idx * 10, 0, 10, 10)) for idx in range(number)]
+
+
+def test_transient_errors_are_retried():
+
+    # Given
+    calls = []
+
+    def flaky(task):
+        calls.append(task[0])
+        if calls.count(task[0]) < 3:
+            raise IOError('connection reset')
+        return task[0]
+
+    written = {}
+    policy = RetryPolicy(retries=3, backoff=0.001, straggler_factor=None)
+
+    # Then
+    failures = run_pool(tasks(4), flaky, lambda task, result: written.update({task[0]: result}),
+                        max_workers=2, policy=policy)
+
+    # Expected
+    assert failures == []
+    assert written == {0: 0, 1: 1, 2: 2, 3: 3}
+
+
+def test_failed_windows_are_reported():
+
+    # Given
+    def broken(task):
+        if task[0] == 2:
+            raise IOError('not found')
+        return task[0]
+
+    policy = RetryPolicy(retries=1, backoff=0.001, straggler_factor=None)
+
+    # Then
+    failures = run_pool(tasks(4), broken, lambda task, result: None,
+                        max_workers=2, policy=policy)
+
+    # Expected
+    assert [entry['window'] for entry in failures] == [[20, 0, 10, 10]]
+
+
+def test_without_policy_errors_are_raised():
+
+    # Given
+    def broken(task):
+        raise IOError('not found')
+
+    # Then / Expected
+    with pytest.raises(IOError):
+        run_pool(tasks(2), broken, lambda task, result: None)
+
+
+def test_stragglers_are_started_again():
+
+    # Given
+    calls = []
+
+    def slow_once(task):
+        calls.append(task[0])
+        if task[0] == 0 and calls.count(0) == 1:
+            sleep(1)
+        return task[0]
+
+    written = []
+    policy = RetryPolicy(straggler_factor=2, min_samples=3)
+
+    # Then
+    run_pool(tasks(6), slow_once, lambda task, result: written.append(result),
+             max_workers=4, policy=policy, poll=0.05)
+
+    # Expected
+    assert calls.count(0) == 2
+    assert sorted(written) == [0, 1, 2, 3, 4, 5]
+
+
+def test_straggler_does_not_hold_back_the_run():
+
+    # Given
+    calls = []
+
+    def slow_once(task):
+        calls.append(task[0])
+        if task[0] == 0 and calls.count(0) == 1:
+            sleep(6)
+        sleep(0.05)
+        return task[0]
+
+    written = []
+    policy = RetryPolicy(straggler_factor=2, min_samples=3)
+
+    # Then
+    start = time()
+    run_pool(tasks(6), slow_once, lambda task, result: written.append(result),
+             max_workers=4, policy=policy, poll=0.05)
+    wall_time = time() - start
+
+    # Expected
+    assert sorted(written) == [0, 1, 2, 3, 4, 5]
+    assert wall_time < 2
+
+
+def test_programming_errors_are_raised_with_policy():
+
+    # Given
+    def broken(task):
+        if task[0] == 1:
+            raise KeyError('bug')
+        return task[0]
+
+    policy = RetryPolicy(retries=1, backoff=0.001, straggler_factor=None)
+
+    # Then / Expected
+    with pytest.raises(KeyError):
+        run_pool(tasks(4), broken, lambda task, result: None, max_workers=2, policy=policy)
+
+
+def test_stragglers_need_the_pool_engine():
+
+    # Given
+    policy = RetryPolicy(straggler_factor=4)
+
+    # Then / Expected
+    with pytest.raises(ValueError):
+        run_tasks(tasks(2), [], lambda task: None, lambda task, blocks: None,
+                  lambda task, result: None, engine='staged', retry=policy)
+
+
+def test_transient_read_errors_of_timestep2_are_retried(tmp_path):
+
+    # Given
+    scenes = make_scene_pair(str(tmp_path / 'scenes'), size=300, block_size=128)
+    red_ts2 = scenes[1].assets['B4']['href']
+    opened = []
+
+    def flaky_open(url):
+        opened.append(url)
+        if url == red_ts2 and opened.count(url) == 3:
+            raise rio.RasterioIOError('connection reset')
+        return rio.open(url)
+
+    policy = RetryPolicy(retries=2, backoff=0.001, straggler_factor=None)
+
+    # Then
+    optimal_tiled_calc(scenes[0], scenes[1], str(tmp_path / 'plain.tif'))
+    failures = optimal_tiled_calc(scenes[0], scenes[1], str(tmp_path / 'flaky.tif'),
+                                  retry=policy, opener=flaky_open)
+    with rio.open(str(tmp_path / 'plain.tif')) as src:
+        plain = src.read()
+    with rio.open(str(tmp_path / 'flaky.tif')) as src:
+        flaky = src.read()
+
+    # Expected
+    assert failures == []
+    assert np.array_equal(flaky, plain)
@@ -0,0 +1,48 @@
+from time import sleep
+from instrumentation import Recorder, NULL_RECORDER
+
+
+def test_spans_are_aggregated():
+
+    # Given
+    recorder = Recorder()
+
+    # Then
+    for window_idx in range(3):
+        with recorder.span('read_ts1', window_idx):
+            sleep(0.01)
+        with recorder.span('kernel', window_idx):
+            pass
+    summary = recorder.summary()
+
+    # Expected
+    assert summary['read_ts1']['count'] == 3
+    assert summary['read_ts1']['p50_s'] >= 0.01
+    assert sum(summary['kernel']['histogram'].values()) == 3
+    assert 'read_ts1' in recorder.format_summary()
+
+
+def test_span_recorded_on_error():
+
+    # Given
+    recorder = Recorder()
+
+    # Then
+    try:
+        with recorder.span('open', 0):
+            raise IOError('not found')
+    except IOError:
+        pass
+
+    # Expected
+    assert [span.stage for span in recorder.spans] == ['open']
+
+
+def test_null_recorder():
+
+    # Then
+    with NULL_RECORDER.span('write', 0):
+        pass
+
+    # Expected
+    assert not NULL_RECORDER.enabled
@@ -0,0 +1,36 @@
+import pytest
+from io_profiles import resolve_profile, with_gdal_env, PROFILES
+import rasterio as rio
+
+
+def test_profile_overrides():
+
+    # Given
+    overrides = {'GDAL_CACHEMAX': 128}
+
+    # Then
+    result = resolve_profile('remote-cog', overrides)
+
+    # Expected
+    assert result['GDAL_CACHEMAX'] == 128
+    assert result['GDAL_DISABLE_READDIR_ON_OPEN'] == 'EMPTY_DIR'
+    assert PROFILES['remote-cog']['GDAL_CACHEMAX'] != 128
+
+
+def test_unknown_profile():
+
+    # Then / Expected
+    with pytest.raises(ValueError):
+        resolve_profile('fast')
+
+
+def test_worker_env():
+
+    # Given
+    options = resolve_profile('low-memory')
+
+    # Then
+    result = with_gdal_env(lambda: rio.env.getenv(), options)()
+
+    # Expected
+    assert result['GDAL_CACHEMAX'] == 64
@@ -0,0 +1,81 @@
+import json
+import numpy as np
+import rasterio as rio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from instrumentation import Recorder, Span
+from metrics import MetricsExporter, busy_seconds, hit_rates, collect
+from run_report import RunReport
+from parallized_resampled import window_bytes
+
+
+def test_busy_seconds_counts_overlap_once():
+
+    # Given
+    spans = [Span('open', 0, 'worker_0', 0.0, 1.0),
+             Span('read_ts1', 0, 'worker_0', 0.5, 1.0),
+             Span('kernel', 0, 'worker_0', 3.0, 1.0)]
+
+    # Expected
+    assert busy_seconds(spans) == 2.5
+
+
+def test_hit_rates():
+
+    # Expected
+    assert hit_rates({'connection_pool_hits': 3, 'connection_pool_misses': 1,
+                      'tiles_total': 4}) == {'connection_pool': 0.75}
+
+
+def test_exporter_writes_textfile_and_report(tmp_path):
+
+    # Given
+    recorder = Recorder()
+    recorder.count('tiles_total', 4)
+    recorder.count('tiles_skipped', 1)
+    for window_idx in range(3):
+        with recorder.span('write', window_idx):
+            pass
+        recorder.count('tiles_processed')
+        recorder.count('bytes_read', 100, 'red_ts1')
+    outfile = str(tmp_path / 'diff.tif')
+    exporter = MetricsExporter(recorder, RunReport(), outfile, interval=60)
+
+    # Then
+    with exporter:
+        pass
+    with open(str(tmp_path / 'diff.prom')) as src:
+        text = src.read()
+    with open(str(tmp_path / 'diff_report.json')) as src:
+        report = json.load(src)
+
+    # Expected
+    assert 'ndvi_tiles_processed_total{job="diff.tif"} 3.0' in text
+    assert 'ndvi_bytes_read_total{input="red_ts1",job="diff.tif"} 300.0' in text
+    assert '# TYPE ndvi_stage_latency_seconds summary' in text
+    assert report['metrics']['tiles_skipped'] == 1
+    assert report['metrics']['stages']['write']['count'] == 3
+    assert collect(recorder)['peak_rss_mb'] > 0
+
+
+def test_window_bytes_counts_compressed_blocks(tmp_path):
+
+    # Given
+    profile = {'driver': 'GTiff', 'width': 128, 'height': 128, 'count': 1,
+               'dtype': 'uint16', 'crs': 'EPSG:32632',
+               'transform': from_origin(470000, 5480000, 30, 30),
+               'tiled': True, 'blockxsize': 64, 'blockysize': 64, 'compress': 'deflate'}
+    path = str(tmp_path / 'band.tif')
+    with rio.open(path, 'w', **profile) as dst:
+        dst.write(np.zeros((1, 128, 128), dtype=np.uint16))
+
+    # Then
+    with rio.open(path) as src:
+        one_block = window_bytes(src, Window(0, 0, 64, 64))
+        all_blocks = window_bytes(src, Window(10, 10, 100, 100))
+        outside = window_bytes(src, Window(500, 500, 10, 10))
+
+    # Expected
+    assert 0 < one_block < 64 * 64 * 2
+    assert all_blocks == 4 * one_block
+    assert outside == 0
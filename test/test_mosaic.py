@@ -0,0 +1,78 @@
+import numpy as np
+import rasterio as rio
+from rasterio import warp
+from benchmark.synthetic import synthetic_bands, write_band, SyntheticItem
+from benchmark.synthetic import ORIGIN, PIXEL_SIZE, CRS
+from parallized_resampled import calculate_ndvi
+from instrumentation import Recorder
+from mosaic import MosaicLayout, choose_scenes, mosaic_tiled_calc
+
+
+SIZE = 300
+SHIFT = 250
+
+
+def make_scene(directory, name, col, seed):
+    """Scene of SIZE x SIZE pixels, col pixels east of ORIGIN"""
+    red, nir = synthetic_bands(SIZE, SIZE, seed=seed)
+    origin = (ORIGIN[0] + col * PIXEL_SIZE, ORIGIN[1])
+    paths = [str(directory / ('%s_B%d.TIF' % (name, band))) for band in (4, 5)]
+    write_band(paths[0], red, origin, block_size=128)
+    write_band(paths[1], nir, origin, block_size=128)
+    return SyntheticItem(*paths), calculate_ndvi(red, nir)
+
+
+def test_choose_scenes_skips_redundant_scenes():
+
+    # Given
+    west = np.array([[1, 1, 1, 0]], dtype=bool)
+    east = np.array([[0, 0, 1, 1]], dtype=bool)
+    inside = np.array([[0, 1, 0, 0]], dtype=bool)
+
+    # Expected
+    assert choose_scenes([inside, west, east]) == [1, 2]
+    assert choose_scenes([east, east, west]) == [2, 0]
+
+
+def test_mosaic_fills_the_area_of_interest(tmp_path):
+
+    # Given
+    west_1, ndvi_west_1 = make_scene(tmp_path, 'west_1', 0, 1)
+    east_1, ndvi_east_1 = make_scene(tmp_path, 'east_1', SHIFT, 2)
+    again_1 = make_scene(tmp_path, 'again_1', 0, 3)[0]
+    west_2, ndvi_west_2 = make_scene(tmp_path, 'west_2', 0, 4)
+    east_2, ndvi_east_2 = make_scene(tmp_path, 'east_2', SHIFT, 5)
+    left, top = ORIGIN[0] + 20 * PIXEL_SIZE, ORIGIN[1] - 20 * PIXEL_SIZE
+    right, bottom = left + 500 * PIXEL_SIZE, top - 250 * PIXEL_SIZE
+    bounding_box = warp.transform_bounds(CRS, 'EPSG:4326', left, bottom, right, top)
+    recorder = Recorder()
+
+    # Then
+    layout = MosaicLayout([west_1, again_1, east_1], [west_2, east_2], bounding_box)
+    mosaic_tiled_calc(layout, str(tmp_path / 'mosaic.tif'), max_workers=2, recorder=recorder)
+    with rio.open(str(tmp_path / 'mosaic.tif')) as src:
+        result = src.read(1)
+        col_off, row_off = ~src.transform * (ORIGIN[0], ORIGIN[1])
+    col_off, row_off = int(round(col_off)), int(round(row_off))
+
+    # Expected
+    assert layout.scenes == [[west_1, east_1], [west_2, east_2]]
+    assert sorted(set(len(scenes) for scenes in layout.tile_scenes[0])) == [1, 2]
+
+    def place(ndvi_west, ndvi_east):
+        grid = np.full((layout.height, layout.width), -2, dtype=np.float32)
+        for ndvi, col in ((ndvi_east, SHIFT), (ndvi_west, 0)):
+            ndvi = ndvi[0] if ndvi.ndim == 3 else ndvi
+            rows = slice(max(row_off, 0), min(row_off + SIZE, layout.height))
+            cols = slice(max(col_off + col, 0), min(col_off + col + SIZE, layout.width))
+            part = ndvi[rows.start - row_off:rows.stop - row_off,
+                        cols.start - col_off - col:cols.stop - col_off - col]
+            grid[rows, cols] = np.where(part != -2, part, grid[rows, cols])
+        return grid
+
+    expected = place(ndvi_west_1, ndvi_east_1) - place(ndvi_west_2, ndvi_east_2)
+    assert result.shape == expected.shape
+    assert np.allclose(result, expected, atol=1e-5)
+    assert sorted(recorder.counters()['bytes_read']) == ['nir_ts1', 'nir_ts2', 'nir_ts3',
+                                                          'nir_ts4', 'red_ts1', 'red_ts2',
+                                                          'red_ts3', 'red_ts4']
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pytest
+import rasterio as rio
+from rasterio.windows import Window
+from benchmark.synthetic import make_scene_pair
+from parallized_resampled import optimal_tiled_calc
+from instrumentation import Recorder
+from ndvi_cache import NdviTileCache
+
+
+def test_int16_tiles_keep_missing_values(tmp_path):
+
+    # Given
+    cache = NdviTileCache(str(tmp_path), dtype='int16')
+    ndvi = np.array([[[-2.0, -0.33333, 0.0, 0.87654]]], dtype=np.float32)
+
+    # Then
+    cache.put('scene', 'grid', Window(0, 0, 4, 1), ndvi)
+    cached = cache.get('scene', 'grid', Window(0, 0, 4, 1))
+
+    # Expected
+    assert cached.dtype == np.float32
+    assert cached[0, 0, 0] == -2
+    assert np.allclose(cached, ndvi, atol=1e-4)
+    assert cache.get('scene', 'grid', Window(4, 0, 4, 1)) is None
+
+
+def test_least_recently_used_tiles_are_evicted(tmp_path):
+
+    # Given
+    ndvi = np.random.RandomState(0).uniform(-1, 1, (1, 64, 64)).astype(np.float32)
+    windows = [Window(col, 0, 64, 64) for col in range(0, 256, 64)]
+    cache = NdviTileCache(str(tmp_path), max_mb=1)
+    cache.put('scene', 'grid', windows[0], ndvi)
+    tile_bytes = cache.size
+    cache.max_bytes = 3 * tile_bytes
+
+    # Then
+    cache.put('scene', 'grid', windows[1], ndvi)
+    cache.put('scene', 'grid', windows[2], ndvi)
+    cache.get('scene', 'grid', windows[0])
+    cache.put('scene', 'grid', windows[3], ndvi)
+    reopened = NdviTileCache(str(tmp_path), max_mb=1)
+
+    # Expected
+    assert cache.size <= 3 * tile_bytes
+    assert not os.path.exists(cache.path('scene', 'grid', windows[1]))
+    assert os.path.exists(cache.path('scene', 'grid', windows[0]))
+    assert reopened.size == cache.size
+
+
+@pytest.mark.parametrize('engine', ['pool', 'staged'])
+def test_cached_baseline_is_not_read_again(tmp_path, engine):
+
+    # Given
+    baseline, first = make_scene_pair(str(tmp_path / 'a'), size=300, block_size=128)
+    second = make_scene_pair(str(tmp_path / 'b'), size=300, offset=3, block_size=128)[1]
+    cache = NdviTileCache(str(tmp_path / 'cache'))
+    uncached_file = str(tmp_path / 'uncached.tif')
+    cached_file = str(tmp_path / 'cached.tif')
+    recorder = Recorder()
+
+    # Then
+    optimal_tiled_calc(baseline, first, str(tmp_path / 'first.tif'), cache=cache, engine=engine)
+    optimal_tiled_calc(baseline, second, uncached_file)
+    cache.recorder = recorder
+    optimal_tiled_calc(baseline, second, cached_file, cache=cache, engine=engine,
+                       recorder=recorder)
+    with rio.open(uncached_file) as src:
+        uncached = src.read()
+    with rio.open(cached_file) as src:
+        cached = src.read()
+    counters = recorder.counters()
+
+    # Expected
+    assert np.array_equal(cached, uncached)
+    assert counters['ndvi_cache_hits'] == counters['tiles_total']
+    assert counters['ndvi_cache_misses'] == counters['tiles_total']
+    assert 'read_ts1' not in recorder.summary()
+    with pytest.raises(ValueError):
+        optimal_tiled_calc(baseline, second, cached_file, cache=cache, engine='async')
+
+
+def test_scene_cached_as_timestep1_is_found_as_timestep2(tmp_path):
+
+    # Given
+    first, second = make_scene_pair(str(tmp_path / 'a'), size=300, offset=0, block_size=128)
+    cache = NdviTileCache(str(tmp_path / 'cache'))
+    recorder = Recorder()
+
+    # Then
+    optimal_tiled_calc(first, second, str(tmp_path / 'forward.tif'), cache=cache)
+    cache.recorder = recorder
+    optimal_tiled_calc(second, first, str(tmp_path / 'backward.tif'), cache=cache,
+                       recorder=recorder)
+    with rio.open(str(tmp_path / 'forward.tif')) as src:
+        forward = src.read()
+    with rio.open(str(tmp_path / 'backward.tif')) as src:
+        backward = src.read()
+    counters = recorder.counters()
+
+    # Expected
+    assert counters['ndvi_cache_hits'] == 2 * counters['tiles_total']
+    assert 'ndvi_cache_misses' not in counters
+    assert np.array_equal(backward, -forward)
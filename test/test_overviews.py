@@ -0,0 +1,82 @@
+import numpy as np
+import rasterio as rio
+from rasterio import windows
+from benchmark.synthetic import make_scene_pair
+from parallized_resampled import customized_tiled_calc
+from instrumentation import Recorder
+from overviews import decimated_shape, decimated_window, decimated_tiles
+from overviews import preview_calc, preview_path
+
+
+def test_decimated_windows_cover_the_grid():
+
+    # Given
+    shape = (300, 300)
+    out_shape = decimated_shape(300, 300, 8)
+    tiles = [windows.Window(col, row, min(70, 300 - col), min(70, 300 - row))
+             for row in range(0, 300, 70) for col in range(0, 300, 70)]
+
+    # Then
+    covered = np.zeros(out_shape, dtype=int)
+    for window in tiles:
+        rows, cols = decimated_window(window, shape, out_shape).toslices()
+        covered[rows, cols] += 1
+
+    # Expected
+    assert out_shape == (38, 38)
+    assert np.all(covered == 1)
+
+
+def test_decimated_tiles_map_to_tiles_of_the_decimated_grid():
+
+    # Given
+    shape = (300, 300)
+    out_shape = decimated_shape(300, 300, 8)
+
+    # Then
+    tiles = decimated_tiles(shape, out_shape, tile_size=16)
+    covered = np.zeros(shape, dtype=int)
+    for window in tiles:
+        rows, cols = window.toslices()
+        covered[rows, cols] += 1
+
+    # Expected
+    assert len(tiles) == 9
+    assert [decimated_window(window, shape, out_shape).flatten() for window in tiles][:4] == \
+        [(0, 0, 16, 16), (16, 0, 16, 16), (32, 0, 6, 16), (0, 16, 16, 16)]
+    assert np.all(covered == 1)
+
+
+def test_preview(tmp_path):
+
+    # Given
+    scenes = make_scene_pair(str(tmp_path / 'scenes'), size=300, block_size=128)
+    full_file = str(tmp_path / 'full.tif')
+    preview_file = preview_path(full_file)
+    recorder = Recorder()
+
+    # Then
+    customized_tiled_calc(scenes[0], scenes[1], full_file, 2000, 2000,
+                          products=('difference', 'valid'))
+    failures = preview_calc(scenes[0], scenes[1], preview_file, factor=4,
+                            max_workers=2, recorder=recorder)
+    with rio.open(full_file) as src:
+        bounds, crs = src.bounds, src.crs
+        full, valid = src.read()
+    with rio.open(preview_file) as src:
+        preview = src.read(1)
+
+        # Expected
+        assert preview_file == str(tmp_path / 'full_preview.tif')
+        assert failures == []
+        assert preview.shape == (75, 75)
+        assert src.crs == crs
+        assert np.allclose(tuple(src.bounds), tuple(bounds))
+    # the 75 x 75 preview is a single tile of the decimated grid
+    assert recorder.counters()['tiles_total'] == 1
+    assert recorder.counters()['tiles_processed'] == 1
+    # the full result averaged over the blocks of 4 x 4 pixels with data in both dates
+    blocks = full.reshape(75, 4, 75, 4).mean(axis=(1, 3))
+    inside = (valid.reshape(75, 4, 75, 4) == 1).all(axis=(1, 3))
+    assert inside.sum() > 0.5 * inside.size
+    assert np.allclose(preview[inside], blocks[inside], atol=0.05)
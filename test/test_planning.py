@@ -0,0 +1,90 @@
+import os
+from benchmark.synthetic import make_scene_pair
+from planning import make_plan, predict_runtime, format_plan
+from tile_journal import TileJournal, journal_path
+from rasterio.windows import Window
+
+
+def test_plan_from_headers(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+    outfile = str(tmp_path / 'diff.tif')
+
+    # Then
+    plan = make_plan(item_ts1, item_ts2, outfile)
+
+    # Expected
+    assert plan['tiles'] == 9 and plan['tiles_skipped'] == 0
+    assert plan['pixels'] == 300 * 300
+    assert all(size > 0 for size in plan['bytes_read'].values())
+    assert plan['bands'] == 1
+    assert plan['output_bytes'] == 300 * 300 * 4
+    assert not os.path.exists(outfile)
+
+
+def test_plan_counts_the_bands_of_the_products(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+    outfile = str(tmp_path / 'diff.tif')
+
+    # Then
+    single = make_plan(item_ts1, item_ts2, outfile)
+    products = make_plan(item_ts1, item_ts2, outfile,
+                         products=('ndvi_t1', 'ndvi_t2', 'difference', 'valid'))
+
+    # Expected
+    assert products['bands'] == 4
+    assert products['output_bytes'] == 300 * 300 * 4 * 4
+    assert products['tile_mb'] > single['tile_mb']
+    assert '4 band(s)' in format_plan(dict(products, runtime=None))
+
+
+def test_plan_skips_journal_on_resume(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+    outfile = str(tmp_path / 'diff.tif')
+    journal = TileJournal(journal_path(outfile))
+    journal.record(Window(0, 0, 128, 128))
+    journal.commit()
+
+    # Then
+    plan = make_plan(item_ts1, item_ts2, outfile, resume=True)
+
+    # Expected
+    assert plan['tiles_skipped'] == 1
+    assert plan['pixels'] == 300 * 300 - 128 * 128
+
+
+def test_predicted_runtime_uses_closest_case():
+
+    # Given
+    plan = {'input_mb': 100.0}
+    calibration = {'environment': {'platform': 'test'},
+                   'results': [{'function': 'optimal_tiled_calc', 'engine': 'pool',
+                                'workers': 1, 'tile_size': 0, 'mb_per_s': 10.0},
+                               {'function': 'optimal_tiled_calc', 'engine': 'pool',
+                                'workers': 4, 'tile_size': 0, 'mb_per_s': 50.0},
+                               {'function': 'optimal_tiled_calc', 'engine': 'staged',
+                                'workers': 8, 'tile_size': 0, 'mb_per_s': 80.0}]}
+
+    # Then
+    runtime = predict_runtime(plan, calibration, 'optimal_tiled_calc', 'pool', 8)
+
+    # Expected
+    assert runtime['seconds'] == 2.0
+    assert runtime['case']['workers'] == 4
+    assert predict_runtime(plan, None, 'optimal_tiled_calc', 'pool', 8) is None
+
+
+def test_format_plan_without_calibration(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+    plan = make_plan(item_ts1, item_ts2, str(tmp_path / 'diff.tif'))
+    plan['runtime'] = None
+
+    # Expected
+    assert 'Runtime:            unknown' in format_plan(plan)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair
+from parallized_resampled import optimal_tiled_calc, customized_tiled_calc
+from time_series import time_series_calc
+
+
+@pytest.fixture
+def scenes(tmp_path):
+    return make_scene_pair(str(tmp_path / 'scenes'), size=300, block_size=128)
+
+
+def test_products_are_bands_of_one_outfile(tmp_path, scenes):
+
+    # Given
+    difference_file = str(tmp_path / 'difference.tif')
+    stack_file = str(tmp_path / 'stack.tif')
+    products_file = str(tmp_path / 'products.tif')
+
+    # Then
+    optimal_tiled_calc(scenes[0], scenes[1], difference_file)
+    time_series_calc(list(scenes), stack_file, output='stack')
+    optimal_tiled_calc(scenes[0], scenes[1], products_file, max_workers=2,
+                       products=('ndvi_t1', 'ndvi_t2', 'difference', 'valid'))
+    with rio.open(difference_file) as src:
+        difference = src.read(1)
+    with rio.open(stack_file) as src:
+        stack = src.read()
+    with rio.open(products_file) as src:
+        products = src.read()
+        descriptions = src.descriptions
+
+    # Expected
+    assert descriptions == ('ndvi_t1', 'ndvi_t2', 'difference', 'valid')
+    assert np.array_equal(products[0], stack[0])
+    assert np.array_equal(products[1], stack[1])
+    assert np.array_equal(products[2], difference)
+    valid = (stack[0] != -2) & (stack[1] != -2)
+    assert np.array_equal(products[3], valid.astype(np.float32))
+
+
+def test_products_with_custom_tiles(tmp_path, scenes):
+
+    # Given
+    products_file = str(tmp_path / 'products.tif')
+
+    # Then
+    customized_tiled_calc(scenes[0], scenes[1], products_file, 2000, 2000,
+                          engine='staged', products=('valid', 'difference'))
+    with rio.open(products_file) as src:
+        valid, difference = src.read()
+
+    # Expected
+    assert set(np.unique(valid)) <= {0.0, 1.0}
+    assert np.all(np.abs(difference[valid == 1]) <= 2)
+    with pytest.raises(ValueError):
+        optimal_tiled_calc(scenes[0], scenes[1], str(tmp_path / 'x.tif'), products=('ndwi',))
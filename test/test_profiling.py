@@ -0,0 +1,58 @@
+import json
+import pstats
+import threading
+from profiling import make_profiler, NullProfiler
+
+
+def busy_worker():
+    return sum(value * value for value in range(20000))
+
+
+def test_cpu_profile_includes_worker_threads(tmp_path):
+
+    # Given
+    profiler = make_profiler('cpu')
+    outfile = str(tmp_path / 'diff.tif')
+
+    # Then
+    profiler.start()
+    thread = threading.Thread(target=busy_worker)
+    thread.start()
+    thread.join()
+    profiler.stop()
+    files = profiler.write(outfile)
+
+    # Expected
+    assert files == [str(tmp_path / 'diff_profile_cpu.prof'),
+                     str(tmp_path / 'diff_profile_cpu.txt')]
+    functions = [function for _, _, function in pstats.Stats(files[0]).stats]
+    assert 'busy_worker' in functions
+
+
+def test_memory_profile_per_stage(tmp_path):
+
+    # Given
+    profiler = make_profiler('memory')
+    outfile = str(tmp_path / 'diff.tif')
+
+    # Then
+    profiler.start()
+    profiler.stage('processing')
+    data = [bytearray(1000) for _ in range(1000)]
+    profiler.stop()
+    files = profiler.write(outfile)
+    with open(files[0]) as src:
+        stages = json.load(src)['stages']
+
+    # Expected
+    assert [stage['stage'] for stage in stages] == ['setup', 'processing']
+    assert stages[1]['traced_current_mb'] >= 1.0
+    assert stages[1]['peak_rss_mb'] > 0
+    assert len(data) == 1000
+
+
+def test_no_profile():
+
+    # Expected
+    assert isinstance(make_profiler(None), NullProfiler)
+    assert make_profiler(None).write('diff.tif') == []
@@ -0,0 +1,73 @@
+import io
+from instrumentation import Recorder
+from progress import ProgressReporter, format_duration
+
+
+class FakeTerminal(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+def test_log_lines_without_terminal():
+
+    # Given
+    stream = io.StringIO()
+    recorder = Recorder()
+    recorder.count('bytes_read', 10 ** 6, 'red_ts1')
+    progress = ProgressReporter(stream=stream, interval=1e-9, recorder=recorder)
+
+    # Then
+    with progress.run(4, skipped=2):
+        for _ in range(4):
+            progress.update()
+    lines = stream.getvalue().splitlines()
+
+    # Expected
+    assert len(lines) == 5
+    assert lines[0].startswith('tiles 1/4 (25.0%), 2 skipped')
+    assert 'MB/s read' in lines[0] and 'ETA' in lines[0]
+    assert lines[-1].startswith('tiles 4/4') and 'done in' in lines[-1]
+
+
+def test_updates_are_throttled_on_terminal():
+
+    # Given
+    stream = FakeTerminal()
+    progress = ProgressReporter(stream=stream, interval=60)
+
+    # Then
+    with progress.run(1000):
+        for _ in range(1000):
+            progress.update()
+
+    # Expected
+    assert stream.getvalue().count('\r') == 1
+    assert stream.getvalue().endswith('\n')
+
+
+def test_format_duration():
+
+    # Expected
+    assert format_duration(5) == '5s'
+    assert format_duration(184) == '3m04s'
+    assert format_duration(3720) == '1h02m'
+
+
+def test_bytes_read_before_the_start_do_not_count():
+
+    # Given
+    stream = io.StringIO()
+    recorder = Recorder()
+    # e.g. the coarse pass or an earlier job of a batch
+    recorder.count('bytes_read', 10 ** 12, 'red_ts1')
+    progress = ProgressReporter(stream=stream, interval=1e-9, recorder=recorder)
+
+    # Then
+    with progress.run(2):
+        progress.update()
+        progress.update()
+    lines = stream.getvalue().splitlines()
+
+    # Expected
+    assert all('0.0 MB/s read now, 0.0 avg' in line for line in lines)
@@ -0,0 +1,57 @@
+from benchmark.regression import compare
+
+TOLERANCES = {'iqr_factor': 1.5,
+              'metrics': {'tiles_per_s': {'direction': 'higher', 'tolerance': 0.1},
+                          'peak_rss_mb': {'direction': 'lower', 'tolerance': 0.1}}}
+
+
+def result(tiles_per_s, peak_rss_mb, iqr=0.0, workers=4):
+    return {'function': 'optimal_tiled_calc', 'engine': 'pool', 'workers': workers,
+            'tile_size': 0, 'tiles_per_s': tiles_per_s, 'peak_rss_mb': peak_rss_mb,
+            'iqr': {'tiles_per_s': iqr, 'peak_rss_mb': 0.0}}
+
+
+def statuses(baseline, current):
+    rows = compare({'results': baseline}, {'results': current}, TOLERANCES)
+    return dict((row['metric'], row['status']) for row in rows)
+
+
+def test_regression_detected():
+
+    # Then
+    result_rows = statuses([result(100, 500)], [result(80, 500)])
+
+    # Expected
+    assert result_rows == {'tiles_per_s': 'regression', 'peak_rss_mb': 'ok'}
+
+
+def test_within_tolerance():
+
+    # Then
+    result_rows = statuses([result(100, 500)], [result(95, 540)])
+
+    # Expected
+    assert result_rows == {'tiles_per_s': 'ok', 'peak_rss_mb': 'ok'}
+
+
+def test_noise_is_tolerated():
+
+    # Given a noisy benchmark, an iqr of 10 tiles/s in both runs
+    baseline = [result(100, 500, iqr=10)]
+    current = [result(75, 500, iqr=10)]
+
+    # Then
+    result_rows = statuses(baseline, current)
+
+    # Expected
+    assert result_rows['tiles_per_s'] == 'ok'
+
+
+def test_improvement_and_missing_case():
+
+    # Then
+    rows = compare({'results': [result(100, 500), result(100, 500, workers=1)]},
+                   {'results': [result(150, 300)]}, TOLERANCES)
+
+    # Expected
+    assert [row['status'] for row in rows] == ['improved', 'improved', 'missing', 'missing']
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair, synthetic_bands, write_band
+from parallized_resampled import optimal_tiled_calc
+from instrumentation import Recorder
+from spectral_indices import INDICES, register_index, get_indices, index_bands, index_path
+from spectral_indices import indices_tiled_calc
+
+
+class Item(object):
+
+    def __init__(self, assets):
+        self.assets = dict((name, {'href': href}) for name, href in assets.items())
+
+
+@pytest.fixture
+def scene(tmp_path):
+    red, nir = synthetic_bands(256, 256, seed=1)
+    blue, green = synthetic_bands(256, 256, seed=2)
+    swir1, swir2 = synthetic_bands(256, 256, seed=3)
+    bands = {'B2': blue, 'B3': green, 'B4': red, 'B5': nir, 'B6': swir1, 'B7': swir2}
+    assets = {}
+    for name, array in bands.items():
+        assets[name] = str(tmp_path / ('scene_%s.TIF' % name))
+        write_band(assets[name], array, block_size=128)
+    return Item(assets), dict((name, array.astype(np.float64)) for name, array in bands.items())
+
+
+def test_registry_declares_the_bands():
+
+    # Given
+    @register_index('red_ratio', ('red', 'swir1'))
+    def red_ratio(red, swir1):
+        return red / swir1
+
+    # Then
+    indices = get_indices(['evi', 'red_ratio'])
+    del INDICES['red_ratio']
+
+    # Expected
+    assert index_bands(indices) == ['blue', 'red', 'nir', 'swir1']
+    with pytest.raises(ValueError):
+        get_indices(['red_ratio'])
+
+
+def test_ndvi_difference_is_the_same(tmp_path):
+
+    # Given
+    item_ts1, item_ts2 = make_scene_pair(str(tmp_path), size=300, block_size=128)
+
+    # Then
+    optimal_tiled_calc(item_ts1, item_ts2, str(tmp_path / 'ndvi.tif'))
+    indices_tiled_calc(item_ts1, item_ts2, str(tmp_path / 'indices.tif'), indices=['ndvi'])
+    with rio.open(str(tmp_path / 'ndvi.tif')) as src:
+        expected = src.read()
+    with rio.open(str(tmp_path / 'indices.tif')) as src:
+        result = src.read()
+        descriptions = src.descriptions
+
+    # Expected
+    assert np.array_equal(result, expected)
+    assert descriptions == ('ndvi difference',)
+
+
+def test_indices_read_every_band_once(tmp_path, scene):
+
+    # Given
+    item, bands = scene
+    names = ['ndvi', 'ndwi', 'nbr', 'savi', 'evi']
+    recorder = Recorder()
+    blue, green, red, nir, swir2 = [bands[name] for name in ('B2', 'B3', 'B4', 'B5', 'B7')]
+    valid = red > 0
+    with np.errstate(all='ignore'):
+        expected = {'ndvi': (nir - red) / (nir + red),
+                    'ndwi': (green - nir) / (green + nir),
+                    'nbr': (nir - swir2) / (nir + swir2),
+                    'savi': 1.5 * (nir - red) / 1e4 / ((nir + red) / 1e4 + 0.5),
+                    'evi': 2.5 * (nir - red) / 1e4 / ((nir + 6 * red - 7.5 * blue) / 1e4 + 1)}
+
+    # Then
+    indices_tiled_calc(item, None, str(tmp_path / 'indices.tif'), indices=names,
+                       max_workers=2, recorder=recorder)
+    indices_tiled_calc(item, None, str(tmp_path / 'index.tif'), indices=names, output='files',
+                       engine='staged')
+    with rio.open(str(tmp_path / 'indices.tif')) as src:
+        result = dict(zip(src.descriptions, src.read()))
+    files = {}
+    for name in names:
+        with rio.open(index_path(str(tmp_path / 'index.tif'), name)) as src:
+            files[name] = src.read(1)
+
+    # Expected
+    assert sorted(result) == sorted(names)
+    for name in names:
+        assert np.allclose(result[name][valid], expected[name][valid], rtol=1e-4, atol=1e-5)
+        assert np.all(result[name][~valid] == -2)
+        assert np.array_equal(files[name], result[name])
+    assert recorder.summary()['read_ts1']['count'] == 5 * recorder.counters()['tiles_total']
@@ -0,0 +1,33 @@
+import pytest
+from staged_pipeline import run_staged
+
+
+def test_staged_writes_every_task():
+
+    # Given
+    tasks = list(range(100))
+    written = {}
+
+    def write(task, result):
+        written[task] = result
+
+    # Then
+    run_staged(tasks, lambda task: task * 2, lambda data: data + 1, write,
+               io_workers=8, compute_workers=2, queue_size=4)
+
+    # Expected
+    assert written == {task: task * 2 + 1 for task in tasks}
+
+
+def test_staged_raises_stage_errors():
+
+    # Given
+    def read(task):
+        if task == 5:
+            raise IOError('read failed')
+        return task
+
+    # Then / Expected
+    with pytest.raises(IOError):
+        run_staged(list(range(10)), read, lambda data: data,
+                   lambda task, result: None, io_workers=2, compute_workers=2)
@@ -0,0 +1,59 @@
+import numpy as np
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair
+from time_series import time_series_calc
+from temporal_stats import TemporalAccumulator, temporal_stats_calc, STATISTICS
+
+
+def test_accumulator_skips_missing_values():
+
+    # Given
+    accumulator = TemporalAccumulator((1, 1, 3))
+    series = [([0.1, -2, 0.5], 0.0), ([0.3, -2, -2], 1.0), ([0.8, 0.4, -2], 3.0)]
+
+    # Then
+    for ndvi, time in series:
+        accumulator.update(np.array([[ndvi]], dtype=np.float32), time)
+    result = dict(zip(STATISTICS, accumulator.result()[:, 0]))
+
+    # Expected
+    assert np.allclose(result['mean'], [0.4, 0.4, 0.5])
+    assert np.allclose(result['variance'][0], np.var([0.1, 0.3, 0.8], ddof=1))
+    assert np.isnan(result['variance'][1:]).all()
+    assert np.allclose(result['min'], [0.1, 0.4, 0.5])
+    assert np.allclose(result['max'], [0.8, 0.4, 0.5])
+    assert np.allclose(result['slope'][0], np.polyfit([0, 1, 3], [0.1, 0.3, 0.8], 1)[0])
+    assert np.isnan(result['slope'][1:]).all()
+    assert list(result['count']) == [3, 1, 1]
+
+
+def test_statistics_match_the_stack(tmp_path):
+
+    # Given
+    scenes = list(make_scene_pair(str(tmp_path / 'a'), size=300, block_size=128))
+    for name, offset in (('b', 3), ('c', 5)):
+        scenes.append(make_scene_pair(str(tmp_path / name), size=300, offset=offset,
+                                      block_size=128)[1])
+    times = [0.0, 16.0, 32.0, 80.0]
+
+    # Then
+    time_series_calc(scenes, str(tmp_path / 'stack.tif'), output='stack')
+    temporal_stats_calc(scenes, str(tmp_path / 'stats.tif'), times=times,
+                        max_workers=2, engine='staged')
+    with rio.open(str(tmp_path / 'stack.tif')) as src:
+        stack = np.ma.masked_equal(src.read().astype(np.float64), -2)
+    with rio.open(str(tmp_path / 'stats.tif')) as src:
+        stats = dict(zip(src.descriptions, src.read()))
+
+    # Expected
+    full = ~np.ma.getmaskarray(stack).any(axis=0)
+    time = np.array(times)[:, None, None]
+    slope = (((time - time.mean()) * (stack - stack.mean(axis=0))).sum(axis=0)
+             / ((time - time.mean()) ** 2).sum())
+    assert np.allclose(stats['mean'][full], stack.mean(axis=0)[full], atol=1e-6)
+    assert np.allclose(stats['variance'][full], stack.var(axis=0, ddof=1)[full], atol=1e-6)
+    assert np.allclose(stats['min'][full], stack.min(axis=0)[full])
+    assert np.allclose(stats['max'][full], stack.max(axis=0)[full])
+    assert np.allclose(stats['slope'][full], slope[full], atol=1e-6)
+    assert np.array_equal(stats['count'], stack.count(axis=0))
+    assert np.isnan(stats['mean'][stack.count(axis=0) == 0]).all()
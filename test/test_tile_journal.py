@@ -0,0 +1,154 @@
+import os
+import pytest
+import numpy as np
+import rasterio as rio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from tile_journal import TileJournal, TileWriter, journal_path, window_key
+from parallized_resampled import process_tiles
+
+
+def test_journal_roundtrip(tmp_path):
+
+    # Given
+    journal = TileJournal(str(tmp_path / 'NDVI.tif.journal'))
+    windows = [Window(0, 0, 512, 512), Window(512, 0, 512, 512)]
+
+    # Then
+    for window in windows:
+        journal.record(window)
+    journal.commit()
+
+    # Expected
+    assert journal.load() == set(window_key(window) for window in windows)
+
+
+def test_journal_ignores_incomplete_line(tmp_path):
+
+    # Given
+    path = tmp_path / 'NDVI.tif.journal'
+    path.write_text('0 0 512 512\n512 0 51')
+
+    # Then
+    result = TileJournal(str(path)).load()
+
+    # Expected
+    assert result == {(0, 0, 512, 512)}
+
+
+PROFILE = {'driver': 'GTiff', 'width': 128, 'height': 128, 'count': 1, 'dtype': 'float32',
+           'crs': 'EPSG:32632', 'transform': from_origin(470000, 5480000, 30, 30),
+           'tiled': True, 'blockxsize': 64, 'blockysize': 64}
+
+
+def tile(value):
+    return np.full((1, 64, 64), value, dtype=np.float32)
+
+
+def test_checkpoint_closes_and_reopens_the_outfile(tmp_path):
+
+    # Given
+    outfile = str(tmp_path / 'NDVI.tif')
+    writer = TileWriter(outfile, PROFILE, checkpoint_every=2)
+    first = writer.dataset
+
+    # Then
+    writer.write(tile(1), Window(0, 0, 64, 64))
+    writer.write(tile(2), Window(64, 0, 64, 64))
+    with rio.open(outfile) as src:
+        on_disk = src.read(1, window=Window(64, 0, 64, 64))
+    journal = TileJournal(journal_path(outfile)).load()
+    mode = writer.dataset.mode
+    writer.close()
+
+    # Expected
+    assert first.closed and writer.dataset is not first
+    assert mode == 'r+'
+    assert np.all(on_disk == 2)
+    assert journal == {(0, 0, 64, 64), (64, 0, 64, 64)}
+
+
+def test_resume_updates_the_existing_outfile(tmp_path):
+
+    # Given
+    outfile = str(tmp_path / 'NDVI.tif')
+    writer = TileWriter(outfile, PROFILE)
+    writer.write(tile(1), Window(0, 0, 64, 64))
+    writer.close(finished=False)
+
+    # Then
+    resumed = TileWriter(outfile, PROFILE, resume=True)
+    mode = resumed.dataset.mode
+    resumed.write(tile(2), Window(64, 0, 64, 64))
+    resumed.close()
+    with rio.open(outfile) as src:
+        data = src.read(1)
+
+    # Expected
+    assert resumed.completed == {(0, 0, 64, 64)}
+    assert mode == 'r+'
+    assert np.all(data[:64, :64] == 1) and np.all(data[:64, 64:] == 2)
+    assert not os.path.exists(journal_path(outfile))
+
+
+def test_journal_is_kept_after_an_error(tmp_path):
+
+    # Given
+    outfile = str(tmp_path / 'NDVI.tif')
+
+    # Then
+    with pytest.raises(IOError):
+        with TileWriter(outfile, PROFILE) as writer:
+            writer.write(tile(1), Window(0, 0, 64, 64))
+            raise IOError('connection reset')
+
+    # Expected
+    assert TileJournal(journal_path(outfile)).load() == {(0, 0, 64, 64)}
+
+
+def test_journal_is_kept_for_incomplete_runs(tmp_path):
+
+    # Given
+    outfile = str(tmp_path / 'NDVI.tif')
+
+    # Then
+    with TileWriter(outfile, PROFILE) as writer:
+        writer.write(tile(1), Window(0, 0, 64, 64))
+        writer.incomplete = True
+    kept = os.path.exists(journal_path(outfile))
+    with TileWriter(outfile, PROFILE, resume=True) as writer:
+        writer.write(tile(2), Window(64, 0, 64, 64))
+
+    # Expected
+    assert kept
+    assert not os.path.exists(journal_path(outfile))
+
+
+class RecordingDestination(object):
+
+    def __init__(self):
+        self.windows = []
+
+    def write(self, result, window):
+        self.windows.append(window_key(window))
+
+
+def test_process_tiles_skips_completed_windows(tmp_path):
+
+    # Given
+    band = dict(PROFILE, dtype='uint16')
+    urls = []
+    for name in ('red_1', 'nir_1', 'red_2', 'nir_2'):
+        path = str(tmp_path / (name + '.tif'))
+        with rio.open(path, 'w', **band) as dst:
+            dst.write(np.random.randint(1, 20000, (1, 128, 128)).astype(np.uint16))
+        urls.append(path)
+    tiles = [Window(col, row, 64, 64) for row in (0, 64) for col in (0, 64)]
+    destination = RecordingDestination()
+
+    # Then
+    process_tiles(urls[:2], urls[2:], destination, tiles,
+                  completed={(0, 0, 64, 64), (64, 64, 64, 64)})
+
+    # Expected
+    assert sorted(destination.windows) == [(0, 64, 64, 64), (64, 0, 64, 64)]
@@ -0,0 +1,55 @@
+from collections import namedtuple
+from tile_order import hilbert_index, zorder_index, order_tasks
+
+Window = namedtuple('Window', ['col_off', 'row_off', 'width', 'height'])
+
+
+def grid(cols, rows, size=512):
+    return list(enumerate(Window(col * size, row * size, size, size)
+                          for col in range(cols) for row in range(rows)))
+
+
+def test_hilbert_neighbours():
+
+    # Given
+    n = 8
+    cells = sorted(((x, y) for x in range(n) for y in range(n)),
+                   key=lambda cell: hilbert_index(cell[0], cell[1], n))
+
+    # Then
+    steps = [abs(a[0] - b[0]) + abs(a[1] - b[1]) for a, b in zip(cells, cells[1:])]
+
+    # Expected
+    assert steps == [1] * (n * n - 1)
+
+
+def test_zorder_index():
+
+    # Expected
+    assert [zorder_index(x, y) for y in range(2) for x in range(2)] == [0, 1, 2, 3]
+    assert zorder_index(2, 0) == 4
+
+
+def test_order_keeps_every_task():
+
+    # Given
+    tasks = grid(5, 3)
+
+    # Then
+    result = order_tasks(tasks, 'hilbert')
+
+    # Expected
+    assert sorted(result) == sorted(tasks)
+    assert result[0][1].col_off == 0 and result[0][1].row_off == 0
+
+
+def test_row_order():
+
+    # Given
+    tasks = grid(2, 2)
+
+    # Then
+    result = [(w.row_off, w.col_off) for idx, w in order_tasks(tasks, 'row')]
+
+    # Expected
+    assert result == [(0, 0), (0, 512), (512, 0), (512, 512)]
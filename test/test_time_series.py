@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import rasterio as rio
+from benchmark.synthetic import make_scene_pair
+from parallized_resampled import optimal_tiled_calc
+from instrumentation import Recorder
+from time_series import scene_pairs, time_series_calc
+
+
+def test_scene_pairs():
+
+    # Expected
+    assert scene_pairs(3, 'consecutive') == [(0, 1), (1, 2)]
+    assert scene_pairs(3, 'all-pairs') == [(0, 1), (0, 2), (1, 2)]
+    assert scene_pairs(3, 'stack') == []
+    with pytest.raises(ValueError):
+        scene_pairs(3, 'median')
+
+
+@pytest.fixture
+def scenes(tmp_path):
+    first, second = make_scene_pair(str(tmp_path / 'a'), size=300, block_size=128)
+    third = make_scene_pair(str(tmp_path / 'b'), size=300, offset=3, block_size=128)[1]
+    return [first, second, third]
+
+
+def test_time_series_reads_every_scene_once(tmp_path, scenes):
+
+    # Given
+    recorder = Recorder()
+    pair_file = str(tmp_path / 'pair.tif')
+    series_file = str(tmp_path / 'series.tif')
+
+    # Then
+    optimal_tiled_calc(scenes[0], scenes[1], pair_file)
+    time_series_calc(scenes, series_file, output='all-pairs', max_workers=2,
+                     labels=['t1', 't2', 't3'], recorder=recorder)
+    with rio.open(pair_file) as src:
+        pair = src.read(1)
+    with rio.open(series_file) as src:
+        series = src.read()
+        descriptions = src.descriptions
+    tiles = recorder.counters()['tiles_total']
+
+    # Expected
+    assert series.shape[0] == 3
+    assert np.array_equal(series[0], pair)
+    valid = np.all(series > -1.5, axis=0) & np.all(series < 1.5, axis=0)
+    assert np.allclose(series[1][valid], (series[0] + series[2])[valid], atol=1e-5)
+    assert descriptions == ('ndvi t1 - ndvi t2', 'ndvi t1 - ndvi t3', 'ndvi t2 - ndvi t3')
+    assert recorder.summary()['read_ts1']['count'] == 2 * tiles
+    assert recorder.summary()['read_ts2']['count'] == 4 * tiles
+    assert sorted(recorder.counters()['bytes_read']) == ['nir_ts1', 'nir_ts2', 'nir_ts3',
+                                                          'red_ts1', 'red_ts2', 'red_ts3']
+
+
+def test_time_series_stack(tmp_path, scenes):
+
+    # Given
+    series_file = str(tmp_path / 'stack.tif')
+
+    # Then
+    time_series_calc(scenes, series_file, output='stack', engine='staged')
+    with rio.open(series_file) as src:
+        stack = src.read()
+    with rio.open(scenes[0].assets['B4']['href']) as red, \
+            rio.open(scenes[0].assets['B5']['href']) as nir:
+        red, nir = red.read(1).astype(np.float32), nir.read(1).astype(np.float32)
+
+    # Expected
+    assert stack.shape[0] == 3
+    valid = (red > 0) | (nir > 0)
+    assert np.allclose(stack[0][valid], (nir[valid] - red[valid]) / (nir[valid] + red[valid]))
+    assert np.all(stack[0][~valid] == -2)
@@ -0,0 +1,58 @@
+import json
+import threading
+from instrumentation import Recorder, Span
+from trace_export import write_chrome_trace, trace_events
+
+
+def test_one_track_per_thread(tmp_path):
+
+    # Given
+    recorder = Recorder()
+
+    def work(window_idx):
+        with recorder.span('read_ts1', window_idx):
+            pass
+
+    threads = [threading.Thread(target=work, args=(idx,), name='worker_%d' % idx)
+               for idx in range(2)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    with recorder.span('write', 0):
+        pass
+    path = str(tmp_path / 'trace.json')
+
+    # Then
+    write_chrome_trace(recorder, path)
+    with open(path) as src:
+        events = json.load(src)['traceEvents']
+
+    # Expected
+    names = [event['args']['name'] for event in events if event['name'] == 'thread_name']
+    assert names == ['worker_0', 'worker_1', 'writer (main thread)']
+    spans = [event for event in events if event['ph'] == 'X']
+    assert [span['name'] for span in spans] == ['read_ts1', 'read_ts1', 'write']
+    assert len(set(span['tid'] for span in spans)) == 3
+
+
+def test_concurrent_spans_of_the_event_loop():
+
+    # Given
+    recorder = Recorder()
+    recorder.spans = [Span('read_ts1', 0, 'MainThread', 0.0, 1.0),
+                      Span('read_ts2', 0, 'MainThread', 0.5, 1.0),
+                      Span('write', 0, 'writer_0', 2.0, 0.1)]
+
+    # Then
+    events = trace_events(recorder, engine='async')
+
+    # Expected
+    names = dict((event['tid'], event['args']['name'])
+                 for event in events if event['name'] == 'thread_name')
+    assert sorted(names.values()) == ['event loop (main thread)', 'writer']
+    reads = [event for event in events if event['ph'] in ('b', 'e')]
+    assert [(event['ph'], event['name']) for event in reads] == [
+        ('b', 'read_ts1'), ('e', 'read_ts1'), ('b', 'read_ts2'), ('e', 'read_ts2')]
+    assert reads[0]['id'] != reads[2]['id']
+    writes = [event for event in events if event['ph'] == 'X']
+    assert names[writes[0]['tid']] == 'writer'
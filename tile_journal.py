@@ -0,0 +1,127 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Journal of the completed tiles. The windows
+# written to the outfile are saved in a sidecar
+# file, so an aborted run can be resumed and
+# only the missing windows are calculated.
+###########################################
+"""
+
+import os
+import rasterio as rio
+
+
+# number of written tiles between two checkpoints
+DEFAULT_CHECKPOINT_EVERY = 32
+
+
+def journal_path(outfile):
+    """Returns the path of the journal for an outfile"""
+    return outfile + '.journal'
+
+
+def window_key(window):
+    """Returns a hashable key for a window"""
+    return (int(window.col_off), int(window.row_off),
+            int(window.width), int(window.height))
+
+
+class TileJournal(object):
+    """Sidecar file with one line per completed window"""
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = []
+
+    def load(self):
+        """Reads the completed windows.
+        :returns:
+        set of window keys"""
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path) as src:
+            for line in src:
+                values = line.split()
+                # the last line might be incomplete after a crash
+                if len(values) == 4 and line.endswith('\n'):
+                    done.add(tuple(int(value) for value in values))
+        return done
+
+    def record(self, window):
+        """Remembers a written window until the next commit"""
+        self._pending.append(window_key(window))
+
+    def commit(self):
+        """Appends the remembered windows and forces them to disk"""
+        if not self._pending:
+            return
+        with open(self.path, 'a') as dst:
+            dst.write(''.join('%d %d %d %d\n' % key for key in self._pending))
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._pending = []
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class TileWriter(object):
+    """Writes the tiles to the outfile and keeps the journal.
+    GDAL holds written blocks in its cache and writes the directory
+    of the tiff when the file is closed, so the outfile is closed and
+    reopened at every checkpoint before the journal is committed.
+    Otherwise the journal could list tiles which never reached the disk."""
+
+    def __init__(self, outfile, profile, resume=False,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        self.outfile = outfile
+        self.journal = TileJournal(journal_path(outfile))
+        self.checkpoint_every = checkpoint_every or DEFAULT_CHECKPOINT_EVERY
+        self._since_checkpoint = 0
+        # set if windows are missing after the run
+        self.incomplete = False
+
+        if resume and os.path.exists(outfile):
+            self.completed = self.journal.load()
+            self.dataset = rio.open(outfile, 'r+')
+        else:
+            self.completed = set()
+            self.journal.remove()
+            self.dataset = rio.open(outfile, 'w', **profile)
+
+    def block_windows(self):
+        return self.dataset.block_windows()
+
+    def write(self, result, window):
+        """Writes a tile, same arguments as rasterio's write"""
+        self.dataset.write(result, window=window)
+        self.journal.record(window)
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Flushes the outfile to disk and commits the journal"""
+        self.dataset.close()
+        self.dataset = rio.open(self.outfile, 'r+')
+        self.journal.commit()
+        self._since_checkpoint = 0
+
+    def close(self, finished=True):
+        """Closes the outfile. After a finished run the journal is removed,
+        otherwise the written windows are committed for --resume"""
+        self.dataset.close()
+        if finished:
+            self.journal.remove()
+        else:
+            self.journal.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(finished=exc_type is None and not self.incomplete)
@@ -0,0 +1,90 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Scheduling order of the tiles. Along a
+# Hilbert- or Z-order-curve neighbouring tiles are
+# processed together, so they hit the GDAL block
+# cache and the merged range requests together.
+###########################################
+"""
+
+
+TILE_ORDERS = ('native', 'row', 'hilbert', 'zorder')
+
+
+def hilbert_index(x, y, n):
+    """Position of cell x, y on a Hilbert-Curve filling a n x n grid.
+    :parameter:
+    column, row, size of the grid (power of 2)
+    :returns:
+    distance along the curve"""
+    distance = 0
+    s = n // 2
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        distance += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s //= 2
+    return distance
+
+
+def zorder_index(x, y):
+    """Position of cell x, y on a Z-order-Curve (interleaved bits).
+    :parameter:
+    column, row
+    :returns:
+    distance along the curve"""
+    distance = 0
+    bit = 0
+    while x >> bit or y >> bit:
+        distance |= ((x >> bit) & 1) << (2 * bit)
+        distance |= ((y >> bit) & 1) << (2 * bit + 1)
+        bit += 1
+    return distance
+
+
+def order_tasks(tasks, method='native'):
+    """Sorts tasks of (window_idx, window) along the chosen curve.
+    The windows are mapped to grid cells by the rank of their offsets,
+    so irregular tile sizes at the border work as well.
+    :parameter:
+    List of (window_idx, window),
+    'native' (order of the tiling function), 'row' (row-major),
+    'hilbert' or 'zorder'
+    :returns:
+    sorted list of (window_idx, window)"""
+    if method in (None, 'native'):
+        return list(tasks)
+    if method not in TILE_ORDERS:
+        raise ValueError('Unknown tile_order %s, choose one of %s'
+                         % (method, ', '.join(TILE_ORDERS)))
+
+    tasks = list(tasks)
+    cols = dict((off, i) for i, off in
+                enumerate(sorted(set(task[1].col_off for task in tasks))))
+    rows = dict((off, i) for i, off in
+                enumerate(sorted(set(task[1].row_off for task in tasks))))
+
+    if method == 'row':
+        def key(task):
+            return rows[task[1].row_off], cols[task[1].col_off]
+    elif method == 'zorder':
+        def key(task):
+            return zorder_index(cols[task[1].col_off], rows[task[1].row_off])
+    else:
+        # smallest power of 2 covering the grid
+        n = 1
+        while n < max(len(cols), len(rows)):
+            n *= 2
+
+        def key(task):
+            return hilbert_index(cols[task[1].col_off], rows[task[1].row_off], n)
+
+    return sorted(tasks, key=key)
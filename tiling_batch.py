@@ -0,0 +1,135 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Script calculating the NDVI-difference for a
+# batch of date pairs and bounding boxes. All jobs
+# share one pool of workers, the image searches
+# and the open datasets.
+###########################################
+"""
+
+import os
+import sys
+import json
+import argparse
+from time import time
+from batch import BatchScheduler, make_jobs
+from io_profiles import resolve_profile, effective_options, DEFAULT_PROFILE
+from tile_order import TILE_ORDERS
+from fault_tolerance import RetryPolicy
+from instrumentation import Recorder
+from ndvi_cache import NdviTileCache, DEFAULT_MAX_MB
+from run_report import RunReport
+
+
+# Set up argument parser
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument("-c", "--config",
+                    dest="config_file",
+                    help="batch configuration file",
+                    metavar="CONFIGFILE")
+PARSER.add_argument("--resume",
+                    action="store_true",
+                    help="continue an aborted batch, only the windows missing "
+                         "in the journals of the outfiles are calculated")
+PARSER.add_argument("-o", "--out",
+                    dest="report_file",
+                    default="batch_report.json",
+                    help="json file with the results of the jobs",
+                    metavar="REPORTFILE")
+ARGS = PARSER.parse_args()
+
+CONFIG_FILE = ARGS.config_file
+if CONFIG_FILE is None or not os.path.exists(CONFIG_FILE):
+    print("Config file does not exist.")
+    sys.exit(1)
+
+with open(CONFIG_FILE, 'r') as src:
+    CONFIG = json.load(src)
+
+try:
+    JOBS = make_jobs(CONFIG)
+except (KeyError, ValueError) as error:
+    print('Usage of this Script: jobs as list, every job with dates, bounding_box, '
+          'property and outfile (or set them for all jobs), %s' % error)
+    sys.exit(1)
+
+# processors is the limit of workers for all jobs together
+try:
+    PROCESSORS = int(CONFIG.get('processors', 4))
+    MAX_JOBS = int(CONFIG.get('max_jobs', 0)) or None
+    CHECKPOINT_EVERY = int(CONFIG.get('checkpoint_every', 0)) or None
+    RETRY = RetryPolicy(retries=int(CONFIG.get('retries', 3)),
+                        backoff=float(CONFIG.get('retry_backoff', 0.5)),
+                        straggler_factor=float(CONFIG.get('straggler_factor', 4)) or None)
+except ValueError:
+    print('processors, max_jobs, checkpoint_every and retries need to be integers, '
+          'retry_backoff and straggler_factor need to be float')
+    sys.exit(1)
+
+try:
+    GDAL_OPTIONS = resolve_profile(CONFIG.get('io_profile'), CONFIG.get('gdal_options'))
+except ValueError as error:
+    print(error)
+    sys.exit(1)
+
+TILE_ORDER = str(CONFIG.get('tile_order', 'native'))
+if TILE_ORDER not in TILE_ORDERS:
+    print('tile_order needs to be one of %s' % ', '.join(TILE_ORDERS))
+    sys.exit(1)
+
+if CONFIG.get('engine', 'pool') != 'pool':
+    print('The batch shares the workers of the pool engine, engine is ignored')
+
+RECORDER = Recorder()
+
+# persistent cache of the ndvi tiles of every scene, a scene compared
+# again (e.g. a baseline with every new acquisition) isn't read again
+try:
+    CACHE = NdviTileCache(CONFIG['ndvi_cache'],
+                          max_mb=float(CONFIG.get('ndvi_cache_mb', DEFAULT_MAX_MB)),
+                          dtype=str(CONFIG.get('ndvi_cache_dtype', 'float32')),
+                          recorder=RECORDER) if CONFIG.get('ndvi_cache') else None
+except ValueError as error:
+    print('ndvi_cache_mb needs to be float, %s' % error)
+    sys.exit(1)
+REPORT = RunReport(config=CONFIG,
+                   io_profile=CONFIG.get('io_profile') or DEFAULT_PROFILE,
+                   gdal_options=effective_options(GDAL_OPTIONS),
+                   resumed=ARGS.resume)
+
+print('Start with %d jobs on %d workers' % (len(JOBS), PROCESSORS))
+TIME_1 = time()
+with BatchScheduler(PROCESSORS,
+                    max_jobs=MAX_JOBS,
+                    gdal_options=GDAL_OPTIONS,
+                    tile_order=TILE_ORDER,
+                    resume=ARGS.resume,
+                    checkpoint_every=CHECKPOINT_EVERY,
+                    retry=RETRY,
+                    recorder=RECORDER,
+                    cache=CACHE) as SCHEDULER:
+    RESULTS = SCHEDULER.run(JOBS)
+TIME_2 = time()
+print('This took %s' % (TIME_2-TIME_1))
+
+for RESULT in RESULTS:
+    if RESULT['error']:
+        print('%s failed: %s' % (RESULT['outfile'], RESULT['error']))
+    elif RESULT['failed_windows']:
+        print('%s: %s windows failed, run the batch again with --resume'
+              % (RESULT['outfile'], len(RESULT['failed_windows'])))
+    else:
+        print('%s done in %.1f s' % (RESULT['outfile'], RESULT['wall_time']))
+
+print(RECORDER.format_summary())
+REPORT.set('wall_time', TIME_2-TIME_1)
+REPORT.set('timings', RECORDER.summary())
+REPORT.set('counters', RECORDER.counters())
+REPORT.set('jobs', RESULTS)
+REPORT.write(ARGS.report_file)
+print('Results saved in %s' % ARGS.report_file)
+
+if any(RESULT['error'] or RESULT['failed_windows'] for RESULT in RESULTS):
+    sys.exit(1)
@@ -13,10 +13,30 @@ import sys
 import json
 import argparse
 from time import time
-from parallized_resampled import search_image
+from parallized_resampled import search_image, search_images
 from parallized_resampled import get_urls
 from parallized_resampled import optimal_tiled_calc
 from parallized_resampled import customized_tiled_calc
+from parallized_resampled import check_products, DIFFERENCE
+from io_profiles import resolve_profile, effective_options, DEFAULT_PROFILE
+from run_report import RunReport, report_path
+from tile_order import TILE_ORDERS
+from fault_tolerance import RetryPolicy
+from instrumentation import Recorder
+from ndvi_cache import NdviTileCache, DEFAULT_MAX_MB
+from trace_export import write_chrome_trace
+from profiling import make_profiler, PROFILES
+from metrics import MetricsExporter, DEFAULT_INTERVAL
+from progress import ProgressReporter
+from time_series import time_series_calc, OUTPUTS
+from temporal_stats import temporal_stats_calc
+from composite import composite_tiled_calc, COMPOSITES, DEFAULT_SCENES
+from mosaic import MosaicLayout, mosaic_tiled_calc, DEFAULT_CANDIDATES
+from spectral_indices import indices_tiled_calc, get_indices, DEFAULT_SCALE, DEFAULT_OFFSET
+from coarse_to_fine import coarse_to_fine_calc, DEFAULT_THRESHOLD, FILLS
+from overviews import DEFAULT_FACTOR, preview_calc, preview_path
+from planning import make_plan, predict_runtime, load_calibration, format_plan, plan_path
+from benchmark.regression import DEFAULT_BASELINE
 
 
 #Set up argument parser
@@ -25,7 +45,54 @@ PARSER.add_argument("-c", "--config",
                     dest="config_file",
                     help="configuration file",
                     metavar="CONFIGFILE")
+PARSER.add_argument("--resume",
+                    action="store_true",
+                    help="continue an aborted run, only the windows missing "
+                         "in the journal of the outfile are calculated")
+PARSER.add_argument("--trace",
+                    dest="trace_file",
+                    help="save a timeline of the workers as Chrome-Trace "
+                         "(chrome://tracing or ui.perfetto.dev)",
+                    metavar="TRACEFILE")
+PARSER.add_argument("--plan",
+                    action="store_true",
+                    help="dry run: only the headers of the images are read to report "
+                         "the tiles, the bytes to read, the size of the outfile and "
+                         "the predicted runtime")
+PARSER.add_argument("--calibration",
+                    dest="calibration_file",
+                    default=DEFAULT_BASELINE,
+                    help="results of benchmark.bench_engines used by --plan to predict "
+                         "the runtime",
+                    metavar="BENCHFILE")
+PARSER.add_argument("--preview",
+                    nargs='?',
+                    const=DEFAULT_FACTOR,
+                    type=int,
+                    help="quick-look: the difference is calculated from the overviews "
+                         "at 1/FACTOR of the resolution (default %d) and saved next to "
+                         "the outfile with the suffix _preview" % DEFAULT_FACTOR,
+                    metavar="FACTOR")
+PARSER.add_argument("--profile",
+                    choices=PROFILES,
+                    help="profile the run, 'cpu' with cProfile including the worker "
+                         "threads, 'memory' with tracemalloc and the peak RSS per stage")
 ARGS = PARSER.parse_args()
+if ARGS.preview is not None and ARGS.preview < 1:
+    PARSER.error('--preview needs a factor of at least 1')
+
+# profiler of the whole run, the reports are saved next to the outfile
+PROFILER = make_profiler(ARGS.profile)
+PROFILER.start()
+
+
+def save_profile():
+    """Stops the profiler and saves its reports next to the outfile,
+    also before the early exits of --plan and --preview"""
+    PROFILER.stop()
+    for PROFILE_FILE in PROFILER.write(OUTFILE):
+        print('Profile saved in %s' % PROFILE_FILE)
+
 
 # Parse configuration parameters to dict
 CONFIG_FILE = ARGS.config_file
@@ -94,14 +161,205 @@ except ValueError:
     print('Processors needs to be an integer')
     sys.exit(1)
 
+# Optional engine settings, 'pool' runs one task per tile,
+# 'staged' splits reading, computing and writing into separate stages,
+# 'async' fetches the blocks of remote images with asyncio
+ENGINE = str(CONFIG.get('engine', 'pool'))
+
+try:
+    STAGES = {'io_workers': int(CONFIG.get('io_workers', 0)) or None,
+              'compute_workers': int(CONFIG.get('compute_workers', 0)) or None,
+              'queue_size': int(CONFIG.get('queue_size', 0)) or None,
+              'connections': int(CONFIG.get('connections', 0)) or None}
+except ValueError:
+    print('io_workers, compute_workers, queue_size and connections need to be integers')
+    sys.exit(1)
+
+# GDAL environment of the run, a named profile ('local', 'remote-cog',
+# 'low-memory') whose options can be replaced with gdal_options
+try:
+    GDAL_OPTIONS = resolve_profile(CONFIG.get('io_profile'),
+                                   CONFIG.get('gdal_options'))
+except ValueError as error:
+    print(error)
+    sys.exit(1)
+
+# order in which the tiles are processed: 'native', 'row', 'hilbert' or 'zorder'
+TILE_ORDER = str(CONFIG.get('tile_order', 'native'))
+if TILE_ORDER not in TILE_ORDERS:
+    print('tile_order needs to be one of %s' % ', '.join(TILE_ORDERS))
+    sys.exit(1)
+
+# time series of all dates instead of the difference of two dates,
+# 'consecutive', 'all-pairs' or 'stack' (see time_series) or
+# 'statistics' per pixel over all dates (see temporal_stats)
+TIME_SERIES = CONFIG.get('time_series')
+if TIME_SERIES is not None and TIME_SERIES not in OUTPUTS + ('statistics',):
+    print('time_series needs to be one of %s' % ', '.join(OUTPUTS + ('statistics',)))
+    sys.exit(1)
+
+# composite of the best scenes_per_date scenes of each date instead of
+# the single best scene, 'max-ndvi' or 'median' (see composite)
+COMPOSITE = CONFIG.get('composite')
+if COMPOSITE is not None and COMPOSITE not in COMPOSITES:
+    print('composite needs to be one of %s' % ', '.join(COMPOSITES))
+    sys.exit(1)
+if COMPOSITE and TIME_SERIES:
+    print('composite can only be used for the difference of two dates, not with time_series')
+    sys.exit(1)
+try:
+    SCENES_PER_DATE = int(CONFIG.get('scenes_per_date', DEFAULT_SCENES))
+except ValueError:
+    print('scenes_per_date needs to be an integer')
+    sys.exit(1)
+
+# mosaic of the scenes covering the bounding box for areas crossing
+# the edge of a path/row, chosen from mosaic_candidates scenes per date
+MOSAIC = bool(CONFIG.get('mosaic', False))
+if MOSAIC and (TIME_SERIES or COMPOSITE):
+    print('mosaic can only be used for the difference of two dates, '
+          'not with time_series or composite')
+    sys.exit(1)
+try:
+    MOSAIC_CANDIDATES = int(CONFIG.get('mosaic_candidates', DEFAULT_CANDIDATES))
+except ValueError:
+    print('mosaic_candidates needs to be an integer')
+    sys.exit(1)
+
+# differences of several spectral indices (ndvi, ndwi, savi, evi, nbr, see
+# spectral_indices) in one pass, as bands of the outfile or as own files
+INDICES = CONFIG.get('indices')
+INDEX_OUTPUT = str(CONFIG.get('index_output', 'bands'))
+if INDICES and (TIME_SERIES or COMPOSITE or MOSAIC):
+    print('indices can only be used for the difference of two dates, '
+          'not with time_series, composite or mosaic')
+    sys.exit(1)
+try:
+    if INDICES:
+        get_indices(INDICES)
+    REFLECTANCE_SCALE = float(CONFIG.get('reflectance_scale', DEFAULT_SCALE))
+    REFLECTANCE_OFFSET = float(CONFIG.get('reflectance_offset', DEFAULT_OFFSET))
+except ValueError as error:
+    print('reflectance_scale and reflectance_offset need to be float, %s' % error)
+    sys.exit(1)
+
+# bands of the outfile of the difference of two dates, 'ndvi_t1',
+# 'ndvi_t2', 'difference' and 'valid' (mask of the pixels with data)
+PRODUCTS = tuple(CONFIG.get('products', DIFFERENCE))
+if PRODUCTS != DIFFERENCE and (TIME_SERIES or COMPOSITE or MOSAIC or INDICES):
+    print('products can only be used for the difference of two dates, '
+          'not with time_series, composite, mosaic or indices')
+    sys.exit(1)
+try:
+    check_products(PRODUCTS)
+except ValueError as error:
+    print(error)
+    sys.exit(1)
+
+# change detection from the overviews (1/overview_factor of the resolution),
+# only tiles whose coarse absolute difference exceeds change_threshold are
+# calculated at the full resolution, the others take the coarse difference
+# or nodata (coarse_fill)
+COARSE_TO_FINE = bool(CONFIG.get('coarse_to_fine', False))
+COARSE_FILL = str(CONFIG.get('coarse_fill', 'coarse'))
+if COARSE_TO_FINE and (TIME_SERIES or COMPOSITE or MOSAIC or INDICES or PRODUCTS != DIFFERENCE):
+    print('coarse_to_fine can only be used for the difference of two dates, '
+          'not with time_series, composite, mosaic, indices or products')
+    sys.exit(1)
+if COARSE_FILL not in FILLS:
+    print('coarse_fill needs to be one of %s' % ', '.join(FILLS))
+    sys.exit(1)
+try:
+    CHANGE_THRESHOLD = float(CONFIG.get('change_threshold', DEFAULT_THRESHOLD))
+    OVERVIEW_FACTOR = int(CONFIG.get('overview_factor', DEFAULT_FACTOR))
+except ValueError:
+    print('change_threshold needs to be float, overview_factor needs to be an integer')
+    sys.exit(1)
+
+try:
+    CHECKPOINT_EVERY = int(CONFIG.get('checkpoint_every', 0)) or None
+except ValueError:
+    print('checkpoint_every needs to be an integer')
+    sys.exit(1)
+
+# retries of transient errors and restart of straggling tiles (pool engine only),
+# windows failing for good are listed in the summary
+try:
+    STRAGGLER_FACTOR = float(CONFIG.get('straggler_factor', 4)) or None
+    if STRAGGLER_FACTOR and ENGINE != 'pool':
+        print('straggler_factor is ignored, only the pool engine starts stragglers again')
+        STRAGGLER_FACTOR = None
+    RETRY = RetryPolicy(retries=int(CONFIG.get('retries', 3)),
+                        backoff=float(CONFIG.get('retry_backoff', 0.5)),
+                        straggler_factor=STRAGGLER_FACTOR)
+except ValueError:
+    print('retries needs to be an integer, retry_backoff and straggler_factor need to be float')
+    sys.exit(1)
+
+# timing of the stages of every tile
+RECORDER = Recorder()
+
+# persistent cache of the ndvi tiles of every scene, a scene compared
+# again (e.g. a baseline with every new acquisition) isn't read again
+try:
+    CACHE = NdviTileCache(CONFIG['ndvi_cache'],
+                          max_mb=float(CONFIG.get('ndvi_cache_mb', DEFAULT_MAX_MB)),
+                          dtype=str(CONFIG.get('ndvi_cache_dtype', 'float32')),
+                          recorder=RECORDER) if CONFIG.get('ndvi_cache') else None
+except ValueError as error:
+    print('ndvi_cache_mb needs to be float, %s' % error)
+    sys.exit(1)
+
+# tiles done, tiles/s, MB/s and ETA while processing, updated in place
+# on a terminal and printed as log line every progress_interval seconds otherwise
+try:
+    PROGRESS = ProgressReporter(interval=float(CONFIG.get('progress_interval', 0)) or None,
+                                recorder=RECORDER)
+except ValueError:
+    print('progress_interval needs to be float')
+    sys.exit(1)
+
+# seconds between two updates of the prometheus textfile and the run report
+try:
+    METRICS_INTERVAL = float(CONFIG.get('metrics_interval', DEFAULT_INTERVAL))
+except ValueError:
+    print('metrics_interval needs to be float')
+    sys.exit(1)
+
+REPORT = RunReport(config=CONFIG,
+                   io_profile=CONFIG.get('io_profile') or DEFAULT_PROFILE,
+                   gdal_options=effective_options(GDAL_OPTIONS),
+                   resumed=ARGS.resume)
+
 
 # Search for Satellite-Images
-IMAGE_TIMESTEP_1 = search_image(DATES[0],
-                                BBOX,
-                                PROP)
-IMAGE_TIMESTEP_2 = search_image(DATES[1],
-                                BBOX,
-                                PROP)
+PROFILER.stage('search')
+if COMPOSITE or MOSAIC:
+    # the best scenes of each date, sorted by the cloud-coverage
+    SCENES_TIMESTEP_1 = search_images(DATES[0], BBOX, PROP,
+                                      MOSAIC_CANDIDATES if MOSAIC else SCENES_PER_DATE)
+    SCENES_TIMESTEP_2 = search_images(DATES[1], BBOX, PROP,
+                                      MOSAIC_CANDIDATES if MOSAIC else SCENES_PER_DATE)
+    if MOSAIC:
+        # only the scenes needed to cover the bounding box
+        LAYOUT = MosaicLayout(SCENES_TIMESTEP_1, SCENES_TIMESTEP_2, BBOX,
+                              TILE_SIZE_X, TILE_SIZE_Y, gdal_options=GDAL_OPTIONS)
+        SCENES_TIMESTEP_1, SCENES_TIMESTEP_2 = LAYOUT.scenes
+    IMAGE_TIMESTEP_1 = SCENES_TIMESTEP_1[0]
+    IMAGE_TIMESTEP_2 = SCENES_TIMESTEP_2[0]
+    print('%s of %d and %d scenes' % ('Mosaic' if MOSAIC else 'Composite',
+                                      len(SCENES_TIMESTEP_1), len(SCENES_TIMESTEP_2)))
+else:
+    IMAGE_TIMESTEP_1 = search_image(DATES[0],
+                                    BBOX,
+                                    PROP)
+    IMAGE_TIMESTEP_2 = search_image(DATES[1],
+                                    BBOX,
+                                    PROP)
+# the time series uses every date
+IMAGES = [IMAGE_TIMESTEP_1, IMAGE_TIMESTEP_2]
+if TIME_SERIES:
+    IMAGES += [search_image(DATE, BBOX, PROP) for DATE in DATES[2:]]
 print("Images found")
 
 print("This script is not exact if the images are only marginally"
@@ -115,24 +373,245 @@ print("If the images are only marginally overlapping tiling_script_intersection.
 
 # Get the URLs of the red and nir Band for both Time steps
 # This is just to inform the user
+PROFILER.stage('urls')
 URLS_TIMESTEP_1 = get_urls(IMAGE_TIMESTEP_1)
 URLS_TIMESTEP_2 = get_urls(IMAGE_TIMESTEP_2)
 print(("Got urls"))
 
+# dry run, nothing but the headers is read
+if ARGS.plan and (TIME_SERIES or COMPOSITE or MOSAIC or INDICES or COARSE_TO_FINE):
+    print('--plan estimates the ndvi-difference of two scenes, remove time_series, composite, '
+          'mosaic, indices and coarse_to_fine from the config')
+    sys.exit(1)
+if ARGS.plan:
+    PROFILER.stage('plan')
+    PLAN = make_plan(IMAGE_TIMESTEP_1, IMAGE_TIMESTEP_2, OUTFILE,
+                     TILE_SIZE_X, TILE_SIZE_Y,
+                     resume=ARGS.resume, gdal_options=GDAL_OPTIONS, products=PRODUCTS)
+    PLAN['runtime'] = predict_runtime(PLAN, load_calibration(ARGS.calibration_file),
+                                      'customized_tiled_calc' if TILE_SIZE_X and TILE_SIZE_Y > 0
+                                      else 'optimal_tiled_calc',
+                                      ENGINE, PROCESSORS,
+                                      TILE_SIZE_X if TILE_SIZE_X and TILE_SIZE_Y > 0 else 0)
+    print(format_plan(PLAN))
+    with open(plan_path(OUTFILE), 'w') as dst:
+        json.dump(PLAN, dst, indent=2)
+    print('Plan saved in %s' % plan_path(OUTFILE))
+    save_profile()
+    sys.exit(0)
+
+# quick-look from the overviews, with the same kernel and engine as the full run
+if ARGS.preview is not None and (TIME_SERIES or COMPOSITE or MOSAIC or INDICES):
+    print('--preview shows the ndvi-difference of two scenes, remove time_series, composite, '
+          'mosaic and indices from the config')
+    sys.exit(1)
+if ARGS.preview is not None:
+    PROFILER.stage('preview')
+    TIME_1 = time()
+    print('Start with the preview at 1/%d of the resolution' % ARGS.preview)
+    try:
+        FAILURES = preview_calc(IMAGE_TIMESTEP_1,
+                                IMAGE_TIMESTEP_2,
+                                preview_path(OUTFILE),
+                                factor=ARGS.preview,
+                                max_workers=NUM,
+                                engine=ENGINE,
+                                stages=STAGES,
+                                gdal_options=GDAL_OPTIONS,
+                                tile_order=TILE_ORDER,
+                                retry=RETRY,
+                                recorder=RECORDER)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    print('This took %s' % (time() - TIME_1))
+    if FAILURES:
+        print('%s windows failed and are missing in the preview' % len(FAILURES))
+    print('Preview saved in %s' % preview_path(OUTFILE))
+    save_profile()
+    sys.exit(0)
+
 
 # if optimal-tiled-calculation was choosen
-if TILE_SIZE_X and TILE_SIZE_Y > 0:
+PROFILER.stage('processing')
+METRICS = MetricsExporter(RECORDER, REPORT, OUTFILE,
+                          prom_file=CONFIG.get('metrics_file'),
+                          interval=METRICS_INTERVAL)
+METRICS.start()
+if TIME_SERIES == 'statistics':
+    TIME_1 = time()
+    print('Start with the statistics of %d dates' % len(IMAGES))
+
+    FAILURES = temporal_stats_calc(IMAGES,
+                                   OUTFILE,
+                                   tile_size_x=TILE_SIZE_X,
+                                   tile_size_y=TILE_SIZE_Y,
+                                   max_workers=NUM,
+                                   engine=ENGINE,
+                                   stages=STAGES,
+                                   gdal_options=GDAL_OPTIONS,
+                                   tile_order=TILE_ORDER,
+                                   resume=ARGS.resume,
+                                   checkpoint_every=CHECKPOINT_EVERY,
+                                   retry=RETRY,
+                                   recorder=RECORDER,
+                                   cache=CACHE,
+                                   progress=PROGRESS)
+    TIME_2 = time()
+    print('This took %s' % (TIME_2-TIME_1))
+    REPORT.set('wall_time', TIME_2-TIME_1)
+
+elif COARSE_TO_FINE:
+    TIME_1 = time()
+    print('Start with coarse-to-fine change detection (1/%d, threshold %s)'
+          % (OVERVIEW_FACTOR, CHANGE_THRESHOLD))
+
+    FAILURES = coarse_to_fine_calc(IMAGE_TIMESTEP_1,
+                                   IMAGE_TIMESTEP_2,
+                                   OUTFILE,
+                                   threshold=CHANGE_THRESHOLD,
+                                   factor=OVERVIEW_FACTOR,
+                                   fill=COARSE_FILL,
+                                   tile_size_x=TILE_SIZE_X,
+                                   tile_size_y=TILE_SIZE_Y,
+                                   max_workers=NUM,
+                                   engine=ENGINE,
+                                   stages=STAGES,
+                                   gdal_options=GDAL_OPTIONS,
+                                   tile_order=TILE_ORDER,
+                                   resume=ARGS.resume,
+                                   checkpoint_every=CHECKPOINT_EVERY,
+                                   retry=RETRY,
+                                   recorder=RECORDER,
+                                   progress=PROGRESS)
+    TIME_2 = time()
+    print('This took %s' % (TIME_2-TIME_1))
+    print('%d tiles calculated at the full resolution, %d from the overviews'
+          % (RECORDER.counters().get('tiles_fine', 0),
+             RECORDER.counters().get('tiles_coarse', 0)))
+    REPORT.set('wall_time', TIME_2-TIME_1)
+
+elif INDICES:
+    TIME_1 = time()
+    print('Start with the differences of %s' % ', '.join(INDICES))
+
+    FAILURES = indices_tiled_calc(IMAGE_TIMESTEP_1,
+                                  IMAGE_TIMESTEP_2,
+                                  OUTFILE,
+                                  indices=INDICES,
+                                  output=INDEX_OUTPUT,
+                                  tile_size_x=TILE_SIZE_X,
+                                  tile_size_y=TILE_SIZE_Y,
+                                  max_workers=NUM,
+                                  scale=REFLECTANCE_SCALE,
+                                  offset=REFLECTANCE_OFFSET,
+                                  engine=ENGINE,
+                                  stages=STAGES,
+                                  gdal_options=GDAL_OPTIONS,
+                                  tile_order=TILE_ORDER,
+                                  resume=ARGS.resume,
+                                  checkpoint_every=CHECKPOINT_EVERY,
+                                  retry=RETRY,
+                                  recorder=RECORDER,
+                                  progress=PROGRESS)
+    TIME_2 = time()
+    print('This took %s' % (TIME_2-TIME_1))
+    REPORT.set('wall_time', TIME_2-TIME_1)
+
+elif MOSAIC:
+    TIME_1 = time()
+    print('Start with the mosaic of %dx%d px' % (LAYOUT.width, LAYOUT.height))
+
+    FAILURES = mosaic_tiled_calc(LAYOUT,
+                                 OUTFILE,
+                                 max_workers=NUM,
+                                 engine=ENGINE,
+                                 stages=STAGES,
+                                 gdal_options=GDAL_OPTIONS,
+                                 tile_order=TILE_ORDER,
+                                 resume=ARGS.resume,
+                                 checkpoint_every=CHECKPOINT_EVERY,
+                                 retry=RETRY,
+                                 recorder=RECORDER,
+                                 progress=PROGRESS)
+    TIME_2 = time()
+    print('This took %s' % (TIME_2-TIME_1))
+    REPORT.set('wall_time', TIME_2-TIME_1)
+
+elif COMPOSITE:
+    TIME_1 = time()
+    print('Start with the %s composites' % COMPOSITE)
+
+    FAILURES = composite_tiled_calc(SCENES_TIMESTEP_1,
+                                    SCENES_TIMESTEP_2,
+                                    OUTFILE,
+                                    method=COMPOSITE,
+                                    tile_size_x=TILE_SIZE_X,
+                                    tile_size_y=TILE_SIZE_Y,
+                                    max_workers=NUM,
+                                    engine=ENGINE,
+                                    stages=STAGES,
+                                    gdal_options=GDAL_OPTIONS,
+                                    tile_order=TILE_ORDER,
+                                    resume=ARGS.resume,
+                                    checkpoint_every=CHECKPOINT_EVERY,
+                                    retry=RETRY,
+                                    recorder=RECORDER,
+                                    cache=CACHE,
+                                    progress=PROGRESS)
+    TIME_2 = time()
+    print('This took %s' % (TIME_2-TIME_1))
+    REPORT.set('wall_time', TIME_2-TIME_1)
+
+elif TIME_SERIES:
+    TIME_1 = time()
+    print('Start with the %s time series of %d dates' % (TIME_SERIES, len(IMAGES)))
+
+    FAILURES = time_series_calc(IMAGES,
+                                OUTFILE,
+                                output=TIME_SERIES,
+                                tile_size_x=TILE_SIZE_X,
+                                tile_size_y=TILE_SIZE_Y,
+                                max_workers=NUM,
+                                labels=[str(DATE) for DATE in DATES],
+                                engine=ENGINE,
+                                stages=STAGES,
+                                gdal_options=GDAL_OPTIONS,
+                                tile_order=TILE_ORDER,
+                                resume=ARGS.resume,
+                                checkpoint_every=CHECKPOINT_EVERY,
+                                retry=RETRY,
+                                recorder=RECORDER,
+                                cache=CACHE,
+                                progress=PROGRESS)
+    TIME_2 = time()
+    print('This took %s' % (TIME_2-TIME_1))
+    REPORT.set('wall_time', TIME_2-TIME_1)
+
+elif TILE_SIZE_X and TILE_SIZE_Y > 0:
     TIME_1 = time()
     print('Start with customized image-processing')
 
-    customized_tiled_calc(IMAGE_TIMESTEP_1,
-                          IMAGE_TIMESTEP_2,
-                          OUTFILE,
-                          TILE_SIZE_X,
-                          TILE_SIZE_Y,
-                          max_workers=NUM)
+    FAILURES = customized_tiled_calc(IMAGE_TIMESTEP_1,
+                                     IMAGE_TIMESTEP_2,
+                                     OUTFILE,
+                                     TILE_SIZE_X,
+                                     TILE_SIZE_Y,
+                                     max_workers=NUM,
+                                     engine=ENGINE,
+                                     stages=STAGES,
+                                     gdal_options=GDAL_OPTIONS,
+                                     tile_order=TILE_ORDER,
+                                     resume=ARGS.resume,
+                                     checkpoint_every=CHECKPOINT_EVERY,
+                                     retry=RETRY,
+                                     recorder=RECORDER,
+                                     cache=CACHE,
+                                     products=PRODUCTS,
+                                     progress=PROGRESS)
     TIME_2 = time()
     print('This took %s' % (TIME_2-TIME_1))
+    REPORT.set('wall_time', TIME_2-TIME_1)
 
 
 # otherwise use custom-tiled-calculation
@@ -140,14 +619,49 @@ else:
     print('Start with optimal image-processing')
     TIME_3 = time()
 
-    optimal_tiled_calc(IMAGE_TIMESTEP_1,
-                       IMAGE_TIMESTEP_2,
-                       OUTFILE,
-                       max_workers=NUM)
+    FAILURES = optimal_tiled_calc(IMAGE_TIMESTEP_1,
+                                  IMAGE_TIMESTEP_2,
+                                  OUTFILE,
+                                  max_workers=NUM,
+                                  engine=ENGINE,
+                                  stages=STAGES,
+                                  gdal_options=GDAL_OPTIONS,
+                                  tile_order=TILE_ORDER,
+                                  resume=ARGS.resume,
+                                  checkpoint_every=CHECKPOINT_EVERY,
+                                  retry=RETRY,
+                                  recorder=RECORDER,
+                                  cache=CACHE,
+                                  products=PRODUCTS,
+                                  progress=PROGRESS)
 
     TIME_4 = time()
     print('This took %s' % (TIME_4-TIME_3))
+    REPORT.set('wall_time', TIME_4-TIME_3)
+
+
+PROFILER.stage('report')
+METRICS.stop()
+print('Metrics saved in %s' % METRICS.prom_file)
+print(RECORDER.format_summary())
+REPORT.set('timings', RECORDER.summary())
+if ARGS.trace_file:
+    write_chrome_trace(RECORDER, ARGS.trace_file, engine=ENGINE)
+    print('Timeline saved in %s' % ARGS.trace_file)
+REPORT.set('failed_windows', FAILURES)
+if FAILURES:
+    print('%s windows failed and are missing in the outfile, '
+          'run the script again with --resume to calculate them:' % len(FAILURES))
+    for FAILURE in FAILURES:
+        print(FAILURE['window'], FAILURE['error'])
 
+REPORT.set('urls', dict(('timestep_%d' % (NUMBER + 1), get_urls(IMAGE))
+                        for NUMBER, IMAGE in enumerate(IMAGES)))
+if COMPOSITE or MOSAIC:
+    REPORT.set('composite_urls' if COMPOSITE else 'mosaic_urls', {'timestep_1': [get_urls(IMAGE) for IMAGE in SCENES_TIMESTEP_1],
+                                  'timestep_2': [get_urls(IMAGE) for IMAGE in SCENES_TIMESTEP_2]})
+REPORT.write(report_path(OUTFILE))
+save_profile()
 
 CWD = os.getcwd()
 print('The file has been saved in %s' % CWD)
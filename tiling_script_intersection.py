@@ -17,6 +17,7 @@ from parallized_resampled_intersection import search_image
 from parallized_resampled_intersection import get_urls
 from parallized_resampled_intersection import optimal_tiled_calc
 from parallized_resampled_intersection import customized_tiled_calc
+from profiling import make_profiler, PROFILES
 
 
 # Set up argument parser
@@ -25,8 +26,16 @@ PARSER.add_argument("-c", "--config",
                     dest="config_file",
                     help="configuration file",
                     metavar="CONFIGFILE")
+PARSER.add_argument("--profile",
+                    choices=PROFILES,
+                    help="profile the run, 'cpu' with cProfile including the worker "
+                         "threads, 'memory' with tracemalloc and the peak RSS per stage")
 ARGS = PARSER.parse_args()
 
+# profiler of the whole run, the reports are saved next to the outfile
+PROFILER = make_profiler(ARGS.profile)
+PROFILER.start()
+
 # Parse configuration parameters to dict
 CONFIG_FILE = ARGS.config_file
 if CONFIG_FILE is None or not os.path.exists(CONFIG_FILE):
@@ -96,6 +105,7 @@ except ValueError:
 
 
 # Search for Satellite-Images
+PROFILER.stage('search')
 IMAGE_TIMESTEP_1 = search_image(DATES[0],
                                 BBOX,
                                 PROP)
@@ -107,6 +117,7 @@ print("Images found")
 
 # Get the URLs of the red and nir Band for both Time steps
 # This is just to inform the user
+PROFILER.stage('urls')
 URLS_TIMESTEP_1 = get_urls(IMAGE_TIMESTEP_1)
 URLS_TIMESTEP_2 = get_urls(IMAGE_TIMESTEP_2)
 print(URLS_TIMESTEP_1[0], URLS_TIMESTEP_1[1])
@@ -115,6 +126,7 @@ print(("Got urls"))
 
 
 # if optimal-tiled-calculation was choosen
+PROFILER.stage('processing')
 if TILE_SIZE_X and TILE_SIZE_Y > 0:
     TIME_1 = time()
     print('Start with customized image-processing')
@@ -143,6 +155,9 @@ else:
     TIME_4 = time()
     print('This took %s' % (TIME_4-TIME_3))
 
+PROFILER.stop()
+for PROFILE_FILE in PROFILER.write(OUTFILE):
+    print('Profile saved in %s' % PROFILE_FILE)
 
 CWD = os.getcwd()
 print('The file has been saved in %s' % CWD)
@@ -0,0 +1,161 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Time series of the NDVI for a list of dates.
+# Every tile of every scene is read and its NDVI
+# is calculated exactly once, the differences of
+# consecutive dates, of all pairs of dates or the
+# stack of the NDVIs are written as bands of one
+# outfile in a single pass over the tiles.
+###########################################
+"""
+
+from itertools import combinations
+import numpy as np
+import rasterio as rio
+from parallized_resampled import get_urls, scene_tiles, process_windows
+from parallized_resampled import read_scene, cached_scene_reads
+from parallized_resampled import calculate_ndvi, calculate_difference
+from io_profiles import gdal_env
+from tile_journal import TileWriter
+from instrumentation import NULL_RECORDER, scene_inputs
+
+
+# bands of the outfile: differences of consecutive dates,
+# differences of all pairs of dates or the ndvi of every date
+OUTPUTS = ('consecutive', 'all-pairs', 'stack')
+
+
+def scene_pairs(count, output='consecutive'):
+    """Pairs of scenes whose difference is a band of the outfile
+    :parameter:
+    number of scenes,
+    output (see OUTPUTS)
+    :returns:
+    list of (index of the earlier scene, index of the later scene),
+    empty for the stack"""
+    if output == 'consecutive':
+        return [(scene, scene + 1) for scene in range(count - 1)]
+    if output == 'all-pairs':
+        return list(combinations(range(count), 2))
+    if output == 'stack':
+        return []
+    raise ValueError('output needs to be one of %s' % ', '.join(OUTPUTS))
+
+
+def band_descriptions(labels, output='consecutive'):
+    """Descriptions of the bands of the outfile, e.g. 'ndvi 2017-04-01 - ndvi 2018-06-01'"""
+    if output == 'stack':
+        return ['ndvi %s' % label for label in labels]
+    return ['ndvi %s - ndvi %s' % (labels[first], labels[second])
+            for first, second in scene_pairs(len(labels), output)]
+
+
+def read_scene_blocks(urls_scenes, window, window_lst, window_idx=0,
+                      recorder=NULL_RECORDER, opener=None):
+    """Reads the red and nir band of every scene for one tile, the
+    bands of the later scenes are resampled to the window of the first.
+    :parameter:
+    List for each scene containing the urls of the red and nir band,
+    the window for the current tile,
+    a list of all the windows used for the tiling process,
+    the index of the current window,
+    a Recorder for the timing of the stages (see instrumentation)
+    and a function replacing rio.open (see open_timed)
+    :returns:
+    Tuple of arrays: red and nir of every scene"""
+    blocks = ()
+    for number in range(len(urls_scenes)):
+        blocks += read_scene(urls_scenes, number, window, window_lst, window_idx,
+                             recorder, opener)
+    return blocks
+
+
+def compute_time_series(blocks, pairs):
+    """Calculates the ndvi of every scene once and derives the bands of the tile.
+    :parameter:
+    Tuple of arrays as returned by read_scene_blocks,
+    pairs of scenes (see scene_pairs), empty for the stack of the ndvis
+    :returns:
+    Numpy-Array with one band per pair or per scene"""
+    ndvis = [calculate_ndvi(blocks[band], blocks[band + 1])
+             for band in range(0, len(blocks), 2)]
+    return combine_ndvis(ndvis, pairs)
+
+
+def combine_ndvis(ndvis, pairs):
+    """Bands of a tile from the ndvi of every scene (see compute_time_series)"""
+    if not pairs:
+        return np.concatenate(ndvis).astype(rio.float32)
+    return np.concatenate([calculate_difference(ndvis[first], ndvis[second])
+                           for first, second in pairs])
+
+
+def time_series_calc(statsac_items, outfile, output='consecutive', tile_size_x=0,
+                     tile_size_y=0, max_workers=1, resume=False, checkpoint_every=None,
+                     labels=None, recorder=NULL_RECORDER, opener=None, cache=None,
+                     **options):
+    """Calculates the ndvi time series of a list of scenes tile by tile.
+    The first scene is the source of the outfile, the others are
+    resampled to its grid like timestep 2 of optimal_tiled_calc.
+    :parameter:
+    List of Statsac-Item Objects in the order of the dates,
+    Name of outfile,
+    output (see OUTPUTS),
+    tile size x and y in m (0 for the internal blocks of the first scene),
+    Number of Processors,
+    resume: continue an aborted run with the windows missing in the journal,
+    number of tiles between two checkpoints of the journal,
+    labels of the scenes for the band descriptions (e.g. the dates),
+    Recorder for the timing of the stages (see instrumentation),
+    function replacing rio.open for the reads (see open_timed),
+    NdviTileCache with the ndvi of scenes calculated before (see ndvi_cache),
+    further options of process_tiles (engine, stages, ...)
+    :returns:
+    list with the windows which failed for good"""
+    if len(statsac_items) < 2:
+        raise ValueError('A time series needs at least 2 scenes')
+    pairs = scene_pairs(len(statsac_items), output)
+    labels = labels or [str(item) for item in statsac_items]
+    urls_scenes = [get_urls(item) for item in statsac_items]
+    urls = [url for urls_scene in urls_scenes for url in urls_scene]
+
+    with gdal_env(options.get('gdal_options')), rio.open(urls_scenes[0][0]) as src_red:
+        out_profile = src_red.profile.copy()
+        out_profile.update({'dtype': 'float32',
+                            'count': len(pairs) or len(statsac_items)})
+        tiles = scene_tiles(src_red, tile_size_x, tile_size_y)
+        # open outfile with outprofile, when resuming the existing
+        # outfile is updated instead
+        with TileWriter(outfile, out_profile, resume=resume,
+                        checkpoint_every=checkpoint_every) as dst:
+            if not dst.completed:
+                dst.dataset.descriptions = tuple(band_descriptions(labels, output))
+
+            if cache is None:
+                def read(window_idx, window):
+                    return read_scene_blocks(urls_scenes, window, tiles, window_idx,
+                                             recorder=recorder, opener=opener)
+
+                def compute(blocks):
+                    return compute_time_series(blocks, pairs)
+            else:
+                if options.get('engine') == 'async':
+                    # the async engine fetches the bands of every scene itself
+                    raise ValueError('The ndvi cache can be used with the pool '
+                                     'and the staged engine')
+                read, ndvis = cached_scene_reads(urls_scenes, tiles, cache,
+                                                 recorder=recorder, opener=opener)
+
+                def compute(data):
+                    return combine_ndvis(ndvis(data), pairs)
+
+            failures = process_windows(tiles, urls, read, compute, dst,
+                                       max_workers=max_workers, completed=dst.completed,
+                                       recorder=recorder,
+                                       inputs=scene_inputs(len(statsac_items)),
+                                       **options)
+            # keep the journal, so the failed windows can be resumed
+            dst.incomplete = bool(failures)
+            return failures
@@ -0,0 +1,92 @@
+"""
+#!/bin/python
+# -*- coding: utf8 -*-
+# Author: J. Vetter, 2019
+# Export of the recorded spans as Chrome-Trace.
+# The file can be opened in chrome://tracing or
+# ui.perfetto.dev, every worker thread and the
+# writer get their own track. Spans running at the
+# same time in one thread (the coroutines of the
+# async engine) get an async track per span.
+###########################################
+"""
+
+import os
+import json
+
+
+# the writer runs in the main thread for the pool and staged engine,
+# the async engine runs the event loop there and writes in writer_0
+THREAD_LABELS = {'pool': {'MainThread': 'writer (main thread)'},
+                 'staged': {'MainThread': 'writer (main thread)'},
+                 'async': {'MainThread': 'event loop (main thread)',
+                           'writer_0': 'writer'}}
+
+
+def overlapping(spans):
+    """Checks if some of the spans of one thread run at the same time"""
+    end = None
+    for span in sorted(spans, key=lambda span: span.start):
+        if end is not None and span.start < end:
+            return True
+        end = span.start + span.duration if end is None else max(end, span.start + span.duration)
+    return False
+
+
+def trace_events(recorder, process_name='tiling_script', engine='pool'):
+    """Converts the spans of a Recorder to trace-events.
+    :parameter:
+    Recorder (see instrumentation),
+    name of the process in the trace,
+    engine of the run, used for the names of the threads
+    :returns:
+    list of trace-events"""
+    labels = THREAD_LABELS.get(engine, {})
+    spans = list(recorder.spans)
+    threads = sorted(set(span.thread for span in spans),
+                     key=lambda name: (name in labels, name))
+    thread_ids = dict((name, tid) for tid, name in enumerate(threads, 1))
+    pid = os.getpid()
+
+    events = [{'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0,
+               'args': {'name': process_name}}]
+    for name, tid in thread_ids.items():
+        events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid,
+                       'args': {'name': labels.get(name, name)}})
+        events.append({'ph': 'M', 'name': 'thread_sort_index', 'pid': pid, 'tid': tid,
+                       'args': {'sort_index': tid}})
+
+    concurrent = set(name for name in threads
+                     if overlapping([span for span in spans if span.thread == name]))
+
+    # complete events, timestamps in microseconds
+    for span_id, span in enumerate(spans):
+        if span.thread in concurrent:
+            # complete events of one track have to be nested,
+            # so concurrent spans become async begin/end-events
+            for phase, timestamp in (('b', span.start), ('e', span.start + span.duration)):
+                events.append({'ph': phase,
+                               'name': span.stage,
+                               'cat': 'tile',
+                               'id': span_id,
+                               'pid': pid,
+                               'tid': thread_ids[span.thread],
+                               'ts': timestamp * 1e6,
+                               'args': {'window_idx': span.window_idx}})
+            continue
+        events.append({'ph': 'X',
+                       'name': span.stage,
+                       'cat': 'tile',
+                       'pid': pid,
+                       'tid': thread_ids[span.thread],
+                       'ts': span.start * 1e6,
+                       'dur': span.duration * 1e6,
+                       'args': {'window_idx': span.window_idx}})
+    return events
+
+
+def write_chrome_trace(recorder, path, process_name='tiling_script', engine='pool'):
+    """Saves the spans of a Recorder as Chrome-Trace json"""
+    with open(path, 'w') as dst:
+        json.dump({'traceEvents': trace_events(recorder, process_name, engine),
+                   'displayTimeUnit': 'ms'}, dst)